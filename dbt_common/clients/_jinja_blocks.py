@@ -1,7 +1,8 @@
+import bisect
 import dataclasses
 import re
 from collections import namedtuple
-from typing import Callable, Dict, Iterator, List, Optional, Set, Union
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, Type, Union
 
 from dbt_common.exceptions import (
     BlockDefinitionNotAtTopError,
@@ -19,26 +20,139 @@ def regex(pat: str) -> re.Pattern:
 
 
 class BlockData:
-    """raw plaintext data from the top level of the file."""
+    """raw plaintext data from the top level of the file.
 
-    def __init__(self, contents: str) -> None:
+    start and end are the offsets of the data in the file. If source is set,
+    the contents are not stored, but sliced from source when accessed.
+    """
+
+    __slots__ = ("block_type_name", "_contents", "source", "start", "end")
+
+    def __init__(
+        self,
+        contents: Optional[str] = None,
+        source: Optional[str] = None,
+        start: int = 0,
+        end: Optional[int] = None,
+    ) -> None:
         self.block_type_name = "__dbt__data"
-        self.contents: str = contents
-        self.full_block = contents
+        self._contents = contents
+        self.source = source
+        self.start = start
+        if end is None:
+            end = start + len(contents) if contents is not None else start
+        self.end = end
+
+    @property
+    def contents(self) -> str:
+        if self.source is not None:
+            return self.source[self.start : self.end]
+        return self._contents or ""
+
+    @contents.setter
+    def contents(self, value: str) -> None:
+        self._contents = value
+        self.source = None
+
+    @property
+    def full_block(self) -> str:
+        return self.contents
+
+    def __copy__(self) -> "BlockData":
+        block = BlockData.__new__(BlockData)
+        block.block_type_name = self.block_type_name
+        block._contents = self._contents
+        block.source = self.source
+        block.start = self.start
+        block.end = self.end
+        return block
 
 
 class BlockTag:
+    """A top-level block, such as a macro, extracted from a file.
+
+    start and end are the offsets of the full block in the file, and
+    contents_start and contents_end those of its contents. If source is set,
+    contents and full_block are not stored, but sliced from source when
+    accessed.
+    """
+
+    __slots__ = (
+        "block_type_name",
+        "block_name",
+        "_contents",
+        "_full_block",
+        "source",
+        "start",
+        "end",
+        "contents_start",
+        "contents_end",
+    )
+
     def __init__(
         self,
         block_type_name: str,
         block_name: str,
         contents: Optional[str] = None,
         full_block: Optional[str] = None,
+        source: Optional[str] = None,
+        start: int = 0,
+        end: int = 0,
+        contents_start: int = 0,
+        contents_end: int = 0,
     ) -> None:
         self.block_type_name = block_type_name
         self.block_name = block_name
-        self.contents = contents
-        self.full_block = full_block
+        self._contents = contents
+        self._full_block = full_block
+        self.source = source
+        self.start = start
+        self.end = end
+        self.contents_start = contents_start
+        self.contents_end = contents_end
+
+    @property
+    def contents(self) -> Optional[str]:
+        if self.source is not None:
+            return self.source[self.contents_start : self.contents_end]
+        return self._contents
+
+    @contents.setter
+    def contents(self, value: Optional[str]) -> None:
+        self._materialize()
+        self._contents = value
+
+    @property
+    def full_block(self) -> Optional[str]:
+        if self.source is not None:
+            return self.source[self.start : self.end]
+        return self._full_block
+
+    @full_block.setter
+    def full_block(self, value: Optional[str]) -> None:
+        self._materialize()
+        self._full_block = value
+
+    def _materialize(self) -> None:
+        # Once either value is replaced the offsets no longer describe the
+        # block, so the other one is copied out of the source first.
+        if self.source is not None:
+            self._contents = self.contents
+            self._full_block = self.full_block
+            self.source = None
+
+    def __copy__(self) -> "BlockTag":
+        return BlockTag(
+            self.block_type_name,
+            self.block_name,
+            self._contents,
+            self._full_block,
+            self.source,
+            self.start,
+            self.end,
+            self.contents_start,
+            self.contents_end,
+        )
 
     def __str__(self) -> str:
         return "BlockTag({!r}, {!r})".format(self.block_type_name, self.block_name)
@@ -115,16 +229,52 @@ class PositionedMatch:
     match: Optional[re.Match]
 
 
+class LineIndex:
+    """Converts absolute positions in a text to line and column numbers.
+
+    The offsets at which lines start are found on first use, after which each
+    conversion is a binary search rather than a scan of the text.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self._line_starts: Optional[List[int]] = None
+
+    @property
+    def line_starts(self) -> List[int]:
+        if self._line_starts is None:
+            line_starts = [0]
+            find = self.text.find
+            newline = find("\n")
+            while newline != -1:
+                line_starts.append(newline + 1)
+                newline = find("\n", newline + 1)
+            self._line_starts = line_starts
+        return self._line_starts
+
+    def lineno(self, pos: int) -> int:
+        """Return the 1-indexed line number of pos."""
+        return bisect.bisect_right(self.line_starts, pos)
+
+    def position(self, pos: int) -> Tuple[int, int]:
+        """Return the 1-indexed line number of pos and its 0-indexed column."""
+        lineno = self.lineno(pos)
+        return lineno, pos - self.line_starts[lineno - 1]
+
+
 @dataclasses.dataclass
 class ExtractWarning:
     warning_type: str
     msg: str
+    lineno: Optional[int] = None
+    col: Optional[int] = None
 
 
 class TagIterator:
     def __init__(self, text: str) -> None:
         self.text: str = text
         self.pos: int = 0
+        self._line_index: Optional[LineIndex] = None
 
         # A cache of the most recent matches seen for each pattern, maintained
         # in order to avoid slowly re-searching long inputs many times.
@@ -137,12 +287,14 @@ class TagIterator:
         line number + relative position to the start of the line.
         """
         end_val: int = self.pos if end is None else end
-        text = self.text[:end_val]
-        # if not found, rfind returns -1, and -1+1=0, which is perfect!
-        last_line_start = text.rfind("\n") + 1
-        # it's easy to forget this, but line numbers are 1-indexed
-        line_number = text.count("\n") + 1
-        return f"{line_number}:{end_val - last_line_start}"
+        line_number, col = self.line_index.position(end_val)
+        return f"{line_number}:{col}"
+
+    @property
+    def line_index(self) -> LineIndex:
+        if self._line_index is None:
+            self._line_index = LineIndex(self.text)
+        return self._line_index
 
     def advance(self, new_position: int) -> None:
         self.pos = new_position
@@ -323,6 +475,101 @@ class TagIterator:
         return self.find_tags()
 
 
+# The patterns below combine the patterns TagIterator searches for separately
+# into single alternations. None of the alternatives can match at the same
+# position, and whichever match starts first also ends first, so a single
+# search finds the same match TagIterator._first_match() would.
+TAG_START_PATTERN = regex(
+    "".join(
+        (
+            r"(?P<comment_start>(\s*\{\#))",
+            r"|(?P<expr_start>(\{\{\s*))",
+            r"|(?:\s*\{\%\-|\{\%)\s*",
+            r"(?P<block_type_name>({}))".format(_NAME_PATTERN),
+            r"(?:\s+(?P<block_name>({})))?".format(_NAME_PATTERN),
+        )
+    )
+)
+
+EXPR_END_OR_QUOTE_PATTERN = regex(r"""(?P<expr_end>(\s*\}\}))|(?P<quote>(['"]))""")
+
+QUOTE_OR_TAG_CLOSE_PATTERN = regex(r"""(?P<quote>(['"]))|(?P<tag_close>(\-\%\}\s*|\%\}))""")
+
+
+class SinglePassTagIterator(TagIterator):
+    """A TagIterator which walks the text once, with a single regex search per token.
+
+    TagIterator searches for each kind of token separately and picks the
+    nearest match, caching the matches it didn't use. This iterator instead
+    searches for a combined pattern, which avoids the bookkeeping and repeated
+    searches over long inputs. It produces identical tags and errors.
+    """
+
+    def _expect_match(self, expected_name: str, *patterns) -> re.Match:  # type: ignore
+        if len(patterns) != 1:
+            return super()._expect_match(expected_name, *patterns)
+        match = patterns[0].search(self.text, self.pos)
+        if match is None:
+            raise UnexpectedMacroEOFError(expected_name, self.text[self.pos :])
+        return match
+
+    def handle_expr(self, match: re.Match) -> None:
+        self.advance(match.end())
+        while True:
+            match = self._expect_match("}}", EXPR_END_OR_QUOTE_PATTERN)
+            if match.lastgroup == "expr_end":
+                break
+            # it's a quote. we haven't advanced for this match yet, so just
+            # slurp up the whole string.
+            match = self._expect_match("string", STRING_PATTERN)
+            self.advance(match.end())
+
+        self.advance(match.end())
+
+    def handle_comment(self, match: re.Match) -> None:
+        self.advance(match.end())
+        end = self.text.find("#}", self.pos)
+        if end < 0:
+            raise UnexpectedMacroEOFError("#}", self.text[self.pos :])
+        self.advance(end + 2)
+
+    def _expect_block_close(self) -> None:
+        while True:
+            end_match = self._expect_match('tag close ("%}")', QUOTE_OR_TAG_CLOSE_PATTERN)
+            if end_match.lastgroup == "tag_close":
+                self.advance(end_match.end())
+                return
+            # must be a string. Advance past it from its start.
+            self.advance(end_match.start())
+            string_match = self._expect_match("string", STRING_PATTERN)
+            self.advance(string_match.end())
+
+    def find_tags(self) -> Iterator[Tag]:
+        text = self.text
+        search = TAG_START_PATTERN.search
+        while True:
+            match = search(text, self.pos)
+            if match is None:
+                break
+
+            self.advance(match.start())
+
+            kind = match.lastgroup
+            if kind == "comment_start":
+                self.handle_comment(match)
+            elif kind == "expr_start":
+                self.handle_expr(match)
+            else:
+                yield self.handle_tag(match)
+
+
+# The available tag iterators, selected by name in extract_toplevel_blocks().
+TAG_ITERATORS: Dict[str, Type[TagIterator]] = {
+    "default": TagIterator,
+    "single_pass": SinglePassTagIterator,
+}
+
+
 _CONTROL_FLOW_TAGS = {
     "if": "endif",
     "for": "endfor",
@@ -362,11 +609,19 @@ class BlockIterator:
         )
 
     def find_blocks(
-        self, allowed_blocks: Optional[Set[str]] = None, collect_raw_data: bool = True
+        self,
+        allowed_blocks: Optional[Set[str]] = None,
+        collect_raw_data: bool = True,
+        lazy_contents: bool = False,
     ) -> Iterator[Union[BlockData, BlockTag]]:
-        """Find all top-level blocks in the data."""
+        """Find all top-level blocks in the data.
+
+        If lazy_contents is set, the blocks refer to the data rather than
+        holding copies of their contents.
+        """
         if allowed_blocks is None:
             allowed_blocks = {"snapshot", "macro", "materialization", "docs"}
+        source = self.data if lazy_contents else None
 
         for tag in self.tag_parser.find_tags():
             if tag.block_type_name in _CONTROL_FLOW_TAGS:
@@ -388,10 +643,9 @@ class BlockIterator:
                 if self.current is not None:
                     raise NestedTagsError(outer=self.current, inner=tag)
                 if collect_raw_data:
-                    raw_data = self.data[self.last_position : tag.start]
+                    if tag.start > self.last_position:
+                        yield self._block_data(source, self.last_position, tag.start)
                     self.last_position = tag.start
-                    if raw_data:
-                        yield BlockData(raw_data)
                 self.current = tag
 
             elif self.is_current_end(tag):
@@ -400,30 +654,49 @@ class BlockIterator:
                 yield BlockTag(
                     block_type_name=self.current.block_type_name,
                     block_name=self.current.block_name,
-                    contents=self.data[self.current.end : tag.start],
-                    full_block=self.data[self.current.start : tag.end],
+                    contents=None if lazy_contents else self.data[self.current.end : tag.start],
+                    full_block=None if lazy_contents else self.data[self.current.start : tag.end],
+                    source=source,
+                    start=self.current.start,
+                    end=tag.end,
+                    contents_start=self.current.end,
+                    contents_end=tag.start,
                 )
                 self.current = None
             elif self.current is None and self.warning_callback:
                 # Warn on unexpected top-level tags
+                lineno, col = self.tag_parser.line_index.position(tag.start)
                 self.warning_callback(
                     ExtractWarning(
-                        "unexpected_block", f"Found unexpected '{tag.block_type_name}' block tag."
+                        "unexpected_block",
+                        f"Found unexpected '{tag.block_type_name}' block tag.",
+                        lineno=lineno,
+                        col=col,
                     )
                 )
 
         if self.current:
-            linecount = self.data[: self.current.end].count("\n") + 1
+            linecount = self.tag_parser.line_index.lineno(self.current.end)
             raise MissingCloseTagError(self.current.block_type_name, linecount)
 
-        if collect_raw_data:
-            raw_data = self.data[self.last_position :]
-            if raw_data:
-                yield BlockData(raw_data)
+        if collect_raw_data and len(self.data) > self.last_position:
+            yield self._block_data(source, self.last_position, len(self.data))
+
+    def _block_data(self, source: Optional[str], start: int, end: int) -> BlockData:
+        if source is not None:
+            return BlockData(source=source, start=start, end=end)
+        return BlockData(self.data[start:end], start=start, end=end)
 
     def lex_for_blocks(
-        self, allowed_blocks: Optional[Set[str]] = None, collect_raw_data: bool = True
+        self,
+        allowed_blocks: Optional[Set[str]] = None,
+        collect_raw_data: bool = True,
+        lazy_contents: bool = False,
     ) -> List[Union[BlockData, BlockTag]]:
         return list(
-            self.find_blocks(allowed_blocks=allowed_blocks, collect_raw_data=collect_raw_data)
+            self.find_blocks(
+                allowed_blocks=allowed_blocks,
+                collect_raw_data=collect_raw_data,
+                lazy_contents=lazy_contents,
+            )
         )
@@ -0,0 +1,318 @@
+import dataclasses
+import fnmatch
+import hashlib
+import hmac
+import io
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+def content_digest(*parts: str) -> str:
+    """Return a hex digest identifying the given strings.
+
+    Each part is length-prefixed, so distinct sequences of parts can never
+    produce the same input to the hash.
+    """
+    hash = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8", "surrogatepass")
+        hash.update(b"%d:" % len(encoded))
+        hash.update(encoded)
+    return hash.hexdigest()
+
+
+# The file, in each cache directory, holding the key which entries are signed with.
+_KEY_FILENAME = "__dbt_cache.key"
+_KEY_SIZE = 32
+_MAC_SIZE = hashlib.sha256().digest_size
+
+
+def _directory_key(directory: str) -> bytes:
+    """Return the key for signing the entries in directory, creating it if needed.
+
+    The key is only used if it is private to the current user. Otherwise, a
+    key for this process alone is returned, so entries written by other
+    processes are never trusted.
+    """
+    path = os.path.join(directory, _KEY_FILENAME)
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=_KEY_FILENAME, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(_KEY_SIZE))
+            # Linking fails if another process created the key first, in
+            # which case that key is used.
+            os.link(tmp_name, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_name)
+
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            key = f.read()
+    except OSError:
+        return os.urandom(_KEY_SIZE)
+
+    if len(key) != _KEY_SIZE or stat.st_mode & 0o077:
+        return os.urandom(_KEY_SIZE)
+    if hasattr(os, "getuid") and stat.st_uid != os.getuid():
+        return os.urandom(_KEY_SIZE)
+    return key
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+
+
+class LRUCache(Generic[V]):
+    """A thread-safe least-recently-used cache.
+
+    The cache is bounded by its number of entries, by the sum of the estimated
+    sizes given for its entries, or both. A bound of None means unbounded.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_size: Optional[int] = None) -> None:
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[V, int]]" = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def get(self, key: str) -> Optional[V]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def peek(self, key: str) -> Optional[V]:
+        """Return the value for key, without counting a hit or miss or marking it as used."""
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key: str, value: V, size: int = 0) -> None:
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._data[key] = (value, size)
+            self._size += size
+            self._evict()
+
+    def remove(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return False
+            self._size -= entry[1]
+            return True
+
+    def resize(self, max_entries: Optional[int] = None, max_size: Optional[int] = None) -> None:
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._data),
+                size=self._size,
+            )
+
+    def _evict(self) -> None:
+        # The most recently added entry is always kept, even if it alone
+        # exceeds max_size, so that a single large value can still be cached.
+        while len(self._data) > 1 and (
+            (self.max_entries is not None and len(self._data) > self.max_entries)
+            or (self.max_size is not None and self._size > self.max_size)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self._size -= size
+            self._evictions += 1
+        if self.max_entries == 0 and self._data:
+            self._size = 0
+            self._evictions += len(self._data)
+            self._data.clear()
+
+
+class ContentCache(Generic[V]):
+    """A cache of results derived from file contents, such as parsed templates.
+
+    Keys are expected to be content digests (see content_digest), so an entry
+    can never be returned for different contents. Entries are held in a
+    bounded, thread-safe LRUCache and, if a directory is configured, are also
+    pickled to disk so that later invocations can reuse them. Entries on disk
+    are signed with a key kept in the directory, and are only unpickled if
+    their signature matches.
+
+    The cache is disabled until configure() is called. persistent_id and
+    persistent_load may be given to replace objects that cannot, or should
+    not, be pickled (such as jinja environments) with a reference.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        persistent_id: Optional[Callable[[Any], Any]] = None,
+        persistent_load: Optional[Callable[[Any], Any]] = None,
+    ) -> None:
+        self.name = name
+        self.enabled: bool = False
+        self.directory: Optional[str] = None
+        self.entries: LRUCache[V] = LRUCache()
+        self._key = b""
+        self._persistent_id = persistent_id
+        self._persistent_load = persistent_load
+
+    def configure(
+        self,
+        enabled: bool = True,
+        max_entries: Optional[int] = None,
+        max_size: Optional[int] = None,
+        directory: Optional[str] = None,
+    ) -> None:
+        """Enable or disable the cache, and set its bounds and on-disk location."""
+        self.enabled = enabled
+        self.entries.resize(max_entries, max_size)
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._key = _directory_key(directory)
+        self.directory = directory
+
+    def get(self, key: str) -> Optional[V]:
+        value = self.entries.get(key)
+        if value is None and self.directory is not None:
+            loaded = self._load(key)
+            if loaded is not None:
+                value, size = loaded
+                self.entries.put(key, value, size)
+        return value
+
+    def put(self, key: str, value: V, size: int = 0) -> None:
+        self.entries.put(key, value, size)
+        if self.directory is not None:
+            self._dump(key, value, size)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop the entry for key, or every entry if key is None, including on disk."""
+        if key is not None:
+            self.entries.remove(key)
+            if self.directory is not None:
+                try:
+                    os.remove(self._filename(key))
+                except OSError:
+                    pass
+            return
+
+        self.entries.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for filename in fnmatch.filter(os.listdir(self.directory), self._pattern("*")):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.entries.stats
+
+    def _pattern(self, key: str) -> str:
+        return f"__dbt_{self.name}_{key}.pickle"
+
+    def _filename(self, key: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, self._pattern(key))
+
+    def _mac(self, key: str, payload: bytes) -> bytes:
+        # The name and key are signed too, so an entry can't be moved to
+        # another key's file.
+        mac = hmac.new(self._key, self._pattern(key).encode("utf-8"), hashlib.sha256)
+        mac.update(payload)
+        return mac.digest()
+
+    def _load(self, key: str) -> Optional[Tuple[V, int]]:
+        try:
+            with open(self._filename(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        mac, payload = data[:_MAC_SIZE], data[_MAC_SIZE:]
+        if not hmac.compare_digest(mac, self._mac(key, payload)):
+            # Never unpickle an entry this cache didn't write.
+            return None
+
+        try:
+            unpickler = pickle.Unpickler(io.BytesIO(payload))
+            if self._persistent_load is not None:
+                unpickler.persistent_load = self._persistent_load  # type: ignore
+            size, value = unpickler.load()
+        except Exception:
+            # A missing, corrupt or incompatible entry is treated as a miss,
+            # and will be replaced when the result is stored again.
+            return None
+        return value, size
+
+    def _dump(self, key: str, value: V, size: int) -> None:
+        buffer = io.BytesIO()
+        pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+        if self._persistent_id is not None:
+            pickler.persistent_id = self._persistent_id  # type: ignore
+        try:
+            pickler.dump((size, value))
+        except Exception:
+            # Values which can't be pickled are only cached in memory.
+            return
+
+        # Write to a temporary file and rename it, so that concurrent readers
+        # never see a partially written entry.
+        filename = self._filename(key)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self.directory, prefix=self._pattern(key), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                payload = buffer.getvalue()
+                f.write(self._mac(key, payload))
+                f.write(payload)
+            os.replace(tmp_name, filename)
+        except OSError:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
@@ -0,0 +1,101 @@
+import atexit
+import functools
+import linecache
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Any, Optional, Set, Tuple
+
+
+class DebugBundle:
+    """An archive of the python source generated for templates.
+
+    Each source is stored once, under a name derived from its contents, so
+    identical macros compiled by any number of environments share one entry.
+    The archive is a zip file, opened for appending when the first source is
+    added, and its index is written when it is closed, which happens at exit
+    at the latest.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._archive: Optional[zipfile.ZipFile] = None
+        self._names: Set[str] = set()
+
+    def _open(self) -> zipfile.ZipFile:
+        if self._archive is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            mode = "a" if zipfile.is_zipfile(self.path) else "w"
+            self._archive = zipfile.ZipFile(self.path, mode, zipfile.ZIP_DEFLATED)
+            self._names.update(self._archive.namelist())
+            atexit.register(self.close)
+        return self._archive
+
+    def filename(self, name: str) -> str:
+        """The filename tracebacks show for the entry with the given name."""
+        return os.path.join(self.path, name)
+
+    def add(self, name: str, source: str) -> str:
+        """Add source to the archive as name, unless it is already there."""
+        with self._lock:
+            if name not in self._names:
+                self._open().writestr(name, source)
+                self._names.add(name)
+        return self.filename(name)
+
+    def read(self, name: str) -> str:
+        with self._lock:
+            return self._open().read(name).decode("utf-8")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def close(self) -> None:
+        with self._lock:
+            if self._archive is not None:
+                self._archive.close()
+                self._archive = None
+                atexit.unregister(self.close)
+
+
+class LineCacheEntries:
+    """Bounds the number of entries added to the linecache.
+
+    Entries are evicted from the linecache, oldest added first, once there
+    are more than max_entries of them.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._filenames: "OrderedDict[str, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._filenames)
+
+    def add(self, filename: str, entry: Tuple[Any, ...]) -> None:
+        with self._lock:
+            if filename in self._filenames:
+                self._filenames.move_to_end(filename)
+            else:
+                self._filenames[filename] = None
+            # The linecache may have been cleared since the entry was added.
+            # linecache does in fact have an attribute `cache`, thanks
+            linecache.cache.setdefault(filename, entry)  # type: ignore
+            while len(self._filenames) > max(self.max_entries, 0):
+                evicted, _ = self._filenames.popitem(last=False)
+                linecache.cache.pop(evicted, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            for filename in self._filenames:
+                linecache.cache.pop(filename, None)
+            self._filenames.clear()
+
+
+def lazy_entry(bundle: DebugBundle, name: str) -> Tuple[Any, ...]:
+    # A linecache entry with a single item is loaded by calling it, the first
+    # time the lines of the file are needed.
+    return (functools.partial(bundle.read, name),)
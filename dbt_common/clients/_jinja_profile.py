@@ -0,0 +1,125 @@
+import pstats
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Functions are identified as in the profile module: (filename, line, name).
+FunctionKey = Tuple[str, int, str]
+
+
+class MacroFrame:
+    """A call on the macro stack kept by the macro generators.
+
+    The key and times are only set if a profiler recorded the call.
+    """
+
+    __slots__ = ("generator", "key", "start", "child_time")
+
+    def __init__(self, generator: Any) -> None:
+        self.generator = generator
+        self.key: Optional[FunctionKey] = None
+        self.start = 0.0
+        self.child_time = 0.0
+
+
+class _FunctionStats:
+    __slots__ = ("primitive_calls", "calls", "self_time", "cumulative_time", "callers")
+
+    def __init__(self) -> None:
+        self.primitive_calls = 0
+        self.calls = 0
+        self.self_time = 0.0
+        self.cumulative_time = 0.0
+        # caller -> [primitive calls, calls, self time, cumulative time]
+        self.callers: Dict[FunctionKey, List[Any]] = {}
+
+
+class MacroProfiler:
+    """Records the calls, and the time spent in, each macro.
+
+    Times are recorded on the macro stack of each thread, in the same way as
+    the profile module records them for python functions: a macro's self time
+    excludes the time spent in the macros it called, and the cumulative time
+    of a recursive macro only counts its outermost call. The results are
+    compatible with the pstats module, so they can be inspected with
+    `pstats.Stats(profiler)`, or written with dump_stats() for tools such as
+    snakeviz.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._functions: Dict[FunctionKey, _FunctionStats] = {}
+        self.stats: Dict[FunctionKey, Tuple[Any, ...]] = {}
+
+    def enter(self, frame: MacroFrame, key: FunctionKey) -> None:
+        """Start timing frame, which has just been pushed on the macro stack."""
+        frame.key = key
+        frame.child_time = 0.0
+        frame.start = time.perf_counter()
+
+    def exit(self, stack: List[MacroFrame]) -> None:
+        """Record the call on top of stack, which is about to be popped."""
+        end = time.perf_counter()
+        frame = stack[-1]
+        key = frame.key
+        assert key is not None
+        total = end - frame.start
+        self_time = total - frame.child_time
+
+        # Calls made before profiling started have no key, and are skipped.
+        callers = [f for f in stack[:-1] if f.key is not None]
+        caller = callers[-1] if callers else None
+        if caller is not None:
+            caller.child_time += total
+        recursive = any(f.key == key for f in callers)
+
+        with self._lock:
+            function = self._functions.get(key)
+            if function is None:
+                function = self._functions[key] = _FunctionStats()
+            function.calls += 1
+            function.self_time += self_time
+            if not recursive:
+                function.primitive_calls += 1
+                function.cumulative_time += total
+
+            if caller is not None:
+                assert caller.key is not None
+                counts = function.callers.get(caller.key)
+                if counts is None:
+                    counts = function.callers[caller.key] = [0, 0, 0.0, 0.0]
+                counts[1] += 1
+                counts[2] += self_time
+                if not recursive:
+                    counts[0] += 1
+                    counts[3] += total
+
+    def create_stats(self) -> None:
+        """Update stats from the calls recorded so far, as pstats expects."""
+        with self._lock:
+            self.stats = {
+                key: (
+                    function.primitive_calls,
+                    function.calls,
+                    function.self_time,
+                    function.cumulative_time,
+                    {caller: tuple(counts) for caller, counts in function.callers.items()},
+                )
+                for key, function in self._functions.items()
+            }
+
+    def dump_stats(self, path: str) -> None:
+        """Write the stats to path, in the format read by pstats."""
+        pstats.Stats(self).dump_stats(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._functions.clear()
+            self.stats = {}
+
+
+def macro_function_key(name: str, macro: Optional[Any] = None) -> FunctionKey:
+    # Macros from different files may share a name, so the file is included
+    # where the macro has one.
+    path = getattr(macro, "original_file_path", None) or getattr(macro, "path", None)
+    return (str(path) if path else "<macro>", 0, name)
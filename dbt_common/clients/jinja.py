@@ -1,23 +1,33 @@
-import codecs
+import contextvars
+import copy
 import dataclasses
-import linecache
+import enum
+import functools
 import os
+import re
 import tempfile
+import threading
+import types
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
 from ast import literal_eval
 from collections import ChainMap
 from contextlib import contextmanager
 from itertools import chain, islice
-from types import CodeType
+from types import CodeType, MappingProxyType
 from typing import (
+    IO,
     Any,
     Callable,
     Dict,
+    Iterable,
     Iterator,
     List,
     Mapping,
     Optional,
     Union,
     Set,
+    Tuple,
     Type,
     NoReturn,
 )
@@ -25,25 +35,37 @@ from typing import (
 from typing_extensions import Protocol
 
 import jinja2
+import jinja2.bccache
 import jinja2.ext
 import jinja2.nativetypes
 import jinja2.nodes
 import jinja2.parser
 import jinja2.sandbox
 
+from dbt_common.__about__ import version as dbt_common_version
 from dbt_common.tests import test_caching_enabled
 from dbt_common.utils.jinja import (
+    MACRO_PREFIX,
     get_dbt_macro_name,
     get_docs_macro_name,
     get_materialization_macro_name,
     get_test_macro_name,
 )
+from dbt_common.clients._jinja_cache import CacheStats, ContentCache, LRUCache, content_digest
+from dbt_common.clients._jinja_debug import DebugBundle, LineCacheEntries, lazy_entry
+from dbt_common.clients._jinja_profile import (
+    FunctionKey,
+    MacroFrame,
+    MacroProfiler,
+    macro_function_key,
+)
 from dbt_common.clients._jinja_blocks import (
     BlockIterator,
     BlockData,
     BlockTag,
     TagIterator,
     ExtractWarning,
+    TAG_ITERATORS,
 )
 
 from dbt_common.exceptions import (
@@ -60,9 +82,28 @@ from dbt_common.exceptions.macros import MacroReturn, UndefinedMacroError, Caugh
 
 SUPPORTED_LANG_ARG = jinja2.nodes.Name("supported_languages", "param")
 
-# Global which can be set by dependents of dbt-common (e.g. core via flag parsing)
+# Global which can be set by dependents of dbt-common (e.g. core via flag parsing).
+# When set, the python source generated for each template is made available to
+# tracebacks and debuggers. If it is 'write', each source is also written to its
+# own temporary file, and if it is 'bundle', each distinct source is appended to
+# the single archive at MACRO_DEBUGGING_BUNDLE.
 MACRO_DEBUGGING: Union[str, bool] = False
 
+# The archive written when MACRO_DEBUGGING is 'bundle'. Defaults to a file, per
+# process, in the temporary directory.
+MACRO_DEBUGGING_BUNDLE: Optional[str] = None
+
+# The most entries MACRO_DEBUGGING adds to the linecache at once.
+MACRO_DEBUGGING_LINECACHE_SIZE: int = 1000
+
+# Global which selects the TagIterator used by extract_toplevel_blocks(), by its
+# name in TAG_ITERATORS. "single_pass" produces identical results to "default".
+BLOCK_SCANNER: str = "default"
+
+# Optional persistent bytecode cache shared by every environment created by
+# get_environment(). Set with set_bytecode_cache().
+_BYTECODE_CACHE: Optional[jinja2.BytecodeCache] = None
+
 _ParseReturn = Union[jinja2.nodes.Node, List[jinja2.nodes.Node]]
 
 
@@ -71,8 +112,33 @@ class _NodeProtocol(Protocol):
     pass
 
 
-def _linecache_inject(source: str, write: bool) -> str:
-    if write:
+_LINECACHE_ENTRIES = LineCacheEntries(MACRO_DEBUGGING_LINECACHE_SIZE)
+_DEBUG_BUNDLE: Optional[DebugBundle] = None
+# Guards creating and replacing _DEBUG_BUNDLE, as two bundles for the same
+# path would each write the archive and corrupt it.
+_DEBUG_BUNDLE_LOCK = threading.Lock()
+
+
+def _debug_bundle() -> DebugBundle:
+    global _DEBUG_BUNDLE
+    path = os.path.abspath(
+        MACRO_DEBUGGING_BUNDLE
+        or os.path.join(tempfile.gettempdir(), f"dbt-macro-debug-{os.getpid()}.zip")
+    )
+    with _DEBUG_BUNDLE_LOCK:
+        if _DEBUG_BUNDLE is None or _DEBUG_BUNDLE.path != path:
+            if _DEBUG_BUNDLE is not None:
+                _DEBUG_BUNDLE.close()
+            _DEBUG_BUNDLE = DebugBundle(path)
+        return _DEBUG_BUNDLE
+
+
+def _linecache_inject(source: str, mode: Union[str, bool]) -> str:
+    # Sources are named by their contents, so the same macro compiled again
+    # reuses its existing entries.
+    name = f"dbt-macro-{content_digest(source)}.py"
+    entry: Tuple[Any, ...]
+    if mode == "write":
         # this is the only reliable way to accomplish this. Obviously, it's
         # really darn noisy and will fill your temporary directory
         tmp_file = tempfile.NamedTemporaryFile(
@@ -84,16 +150,19 @@ def _linecache_inject(source: str, write: bool) -> str:
         )
         tmp_file.write(source)
         filename = tmp_file.name
+        entry = (len(source), None, [line + "\n" for line in source.splitlines()], filename)
+    elif mode == "bundle":
+        # The source is read back from the archive when it is first needed.
+        bundle = _debug_bundle()
+        filename = bundle.add(name, source)
+        entry = lazy_entry(bundle, name)
     else:
-        # `codecs.encode` actually takes a `bytes` as the first argument if
-        # the second argument is 'hex' - mypy does not know this.
-        rnd = codecs.encode(os.urandom(12), "hex")
-        filename = rnd.decode("ascii")
+        filename = name
+        entry = (len(source), None, [line + "\n" for line in source.splitlines()], filename)
 
     # put ourselves in the cache
-    cache_entry = (len(source), None, [line + "\n" for line in source.splitlines()], filename)
-    # linecache does in fact have an attribute `cache`, thanks
-    linecache.cache[filename] = cache_entry
+    _LINECACHE_ENTRIES.max_entries = MACRO_DEBUGGING_LINECACHE_SIZE
+    _LINECACHE_ENTRIES.add(filename, entry)
     return filename
 
 
@@ -176,7 +245,94 @@ class MacroFuzzParser(jinja2.parser.Parser):
         return type
 
 
+# Types whose public attributes are read without the sandbox's checks. See
+# register_trusted_type().
+_TRUSTED_TYPES: Set[type] = set()
+# Whether each type seen by MacroFuzzEnvironment.getattr() is trusted, which
+# includes subclasses of the registered types. Types are held weakly, so
+# that classes which come and go are not kept alive.
+_TRUSTED_TYPE_CACHE: "weakref.WeakKeyDictionary[type, bool]" = weakref.WeakKeyDictionary()
+
+# Types which the sandbox treats specially, and so can never be trusted.
+_UNTRUSTABLE_TYPES = (
+    str,
+    type,
+    types.FunctionType,
+    types.MethodType,
+    types.BuiltinFunctionType,
+    types.CodeType,
+    types.FrameType,
+    types.TracebackType,
+    types.GeneratorType,
+    types.CoroutineType,
+    types.AsyncGeneratorType,
+)
+
+
+def register_trusted_type(cls: type) -> None:
+    """Let templates read the public attributes of cls, and its subclasses, directly.
+
+    Attribute lookups in templates normally check that the attribute is safe
+    to expose, which is wasted work for the objects dbt itself puts in the
+    context. Attributes starting with an underscore are still looked up with
+    the full checks, and str.format methods are still wrapped by the sandbox.
+    """
+    if issubclass(cls, _UNTRUSTABLE_TYPES):
+        raise DbtInternalError(f"Cannot trust {cls.__name__} in the sandbox")
+    _TRUSTED_TYPES.add(cls)
+    _TRUSTED_TYPE_CACHE.clear()
+
+
+def unregister_trusted_type(cls: type) -> None:
+    _TRUSTED_TYPES.discard(cls)
+    _TRUSTED_TYPE_CACHE.clear()
+
+
+def _is_trusted_type(cls: type) -> bool:
+    trusted = _TRUSTED_TYPE_CACHE.get(cls)
+    if trusted is None:
+        trusted = _TRUSTED_TYPE_CACHE[cls] = any(issubclass(cls, t) for t in _TRUSTED_TYPES)
+    return trusted
+
+
 class MacroFuzzEnvironment(jinja2.sandbox.SandboxedEnvironment):
+    # Set by get_environment() when capturing macros for a node, see
+    # CaptureUndefined.
+    undefined_node: Optional[_NodeProtocol] = None
+
+    def _trusted_getattr(self, obj: Any, attribute: str) -> Any:
+        # On trusted types, the sandbox's safety checks only differ from plain
+        # getattr() for attributes starting with an underscore. str.format and
+        # format_map must still be wrapped, wherever they come from.
+        value = getattr(obj, attribute)
+        fmt = self.wrap_str_format(value)
+        return value if fmt is None else fmt
+
+    def getattr(self, obj: Any, attribute: str) -> Any:
+        if _TRUSTED_TYPES and attribute[:1] != "_" and _is_trusted_type(type(obj)):
+            try:
+                return self._trusted_getattr(obj, attribute)
+            except AttributeError:
+                pass
+        return super().getattr(obj, attribute)
+
+    def getitem(self, obj: Any, argument: Any) -> Any:
+        if (
+            _TRUSTED_TYPES
+            and isinstance(argument, str)
+            and argument[:1] != "_"
+            and _is_trusted_type(type(obj))
+        ):
+            try:
+                return obj[argument]
+            except (TypeError, LookupError):
+                pass
+            try:
+                return self._trusted_getattr(obj, argument)
+            except AttributeError:
+                pass
+        return super().getitem(obj, argument)
+
     def _parse(
         self, source: str, name: Optional[str], filename: Optional[str]
     ) -> jinja2.nodes.Template:
@@ -190,17 +346,107 @@ class MacroFuzzEnvironment(jinja2.sandbox.SandboxedEnvironment):
 
         If the value is 'write', also write the files to disk.
         WARNING: This can write a ton of data if you aren't careful.
+
+        If the value is 'bundle', append each distinct file to a single
+        archive instead.
         """
         if filename == "<template>" and MACRO_DEBUGGING:
-            write = MACRO_DEBUGGING == "write"
-            filename = _linecache_inject(source, write)
+            filename = _linecache_inject(source, MACRO_DEBUGGING)
 
         return super()._compile(source, filename)  # type: ignore
 
+    def compile(  # type: ignore[override]
+        self,
+        source: Union[str, jinja2.nodes.Template],
+        name: Optional[str] = None,
+        filename: Optional[str] = None,
+        raw: bool = False,
+        defer_init: bool = False,
+    ) -> Union[str, CodeType]:
+        """
+        Override jinja's compile to consult the bytecode cache, if one is
+        configured. Jinja only uses its bytecode cache for templates loaded
+        through a loader, but dbt builds all of its templates with
+        from_string(), so without this the cache would never be used.
+
+        The cache is bypassed while macro debugging is enabled, since the
+        compiled code then refers to a debugging-specific filename.
+        """
+        bcc = self.bytecode_cache
+        if bcc is None or raw or defer_init or MACRO_DEBUGGING or not isinstance(source, str):
+            return super().compile(source, name, filename, raw, defer_init)
+
+        bucket = bcc.get_bucket(self, name, filename, source)  # type: ignore
+        if bucket.code is None:
+            bucket.code = super().compile(source, name, filename)  # type: ignore
+            bcc.set_bucket(bucket)
+        return bucket.code
+
+
+class MacroBytecodeCache(jinja2.FileSystemBytecodeCache):
+    """A persistent, on-disk cache of compiled template bytecode.
+
+    Entries are keyed by a digest of the template source, the environment
+    flavor (native or text, and whether macros are captured) and the versions
+    of dbt-common and jinja, so a stale entry is never loaded. Jinja itself
+    additionally rejects bytecode written by a different python version.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        super().__init__(directory, pattern="__dbt_jinja_%s.cache")
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get_cache_key_for_source(
+        self,
+        environment: jinja2.Environment,
+        source: str,
+        name: Optional[str] = None,
+        filename: Optional[str] = None,
+    ) -> str:
+        capture_macros = environment.undefined is not jinja2.Undefined
+        flavor = f"{type(environment).__name__}:{capture_macros}:{name}:{filename}"
+        versions = f"{dbt_common_version}:{jinja2.__version__}"
+
+        return content_digest(versions, flavor, source)
+
+    def get_bucket(
+        self,
+        environment: jinja2.Environment,
+        name: Optional[str],
+        filename: Optional[str],
+        source: str,
+    ) -> jinja2.bccache.Bucket:
+        key = self.get_cache_key_for_source(environment, source, name, filename)
+        # The key already covers the source, so the checksum only needs to
+        # guard against a truncated or foreign file with a matching name.
+        bucket = jinja2.bccache.Bucket(environment, key, key)
+        self.load_bytecode(bucket)
+        return bucket
+
+
+def set_bytecode_cache(cache: Optional[jinja2.BytecodeCache]) -> None:
+    """Configure the bytecode cache used by environments from get_environment().
+
+    Pass a MacroBytecodeCache to persist compiled templates across processes,
+    or None to disable bytecode caching.
+    """
+    global _BYTECODE_CACHE
+    _BYTECODE_CACHE = cache
+    # pooled environments were built with the previous cache
+    _ENVIRONMENT_POOL.clear()
+
+
+def get_bytecode_cache() -> Optional[jinja2.BytecodeCache]:
+    return _BYTECODE_CACHE
+
 
 class MacroFuzzTemplate(jinja2.nativetypes.NativeTemplate):
     environment_class = MacroFuzzEnvironment  # type: ignore
 
+    # Set by get_template() when capturing macros, see CaptureUndefined.
+    undefined_node: Optional[_NodeProtocol] = None
+
     def new_context(
         self,
         vars: Optional[Dict[str, Any]] = None,
@@ -228,6 +474,13 @@ class MacroFuzzTemplate(jinja2.nativetypes.NativeTemplate):
 
         ctx = self.new_context(args[0])
 
+        node = _template_undefined_node(self)
+        if node is not None:
+            with undefined_node(node):
+                return self._render(ctx)
+        return self._render(ctx)
+
+    def _render(self, ctx: jinja2.runtime.Context) -> Any:
         try:
             return self.environment_class.concat(  # type: ignore
                 self.root_render_func(ctx)  # type: ignore
@@ -266,6 +519,76 @@ def _is_number(value: Any) -> bool:
     return isinstance(value, (int, float)) and not isinstance(value, bool)
 
 
+# The shapes of literal which most native values take: numbers, booleans,
+# None, strings without escapes, and flat lists and dicts of those. Each one
+# has the same value for literal_eval, which is used for anything else.
+_LITERAL_WS = r"[ \t\n]*"
+_SCALAR_LITERAL = (
+    r"-?(?:0|[1-9][0-9]{0,17})(?:\.[0-9]+(?:[eE][-+]?[0-9]{1,3})?)?"
+    r"|True|False|None"
+    r'''|'[^'\\\n\r\x00\ud800-\udfff]*'|"[^"\\\n\r\x00\ud800-\udfff]*"'''
+)
+_SCALAR_LITERAL_PATTERN = re.compile(_SCALAR_LITERAL)
+_LIST_LITERAL_PATTERN = re.compile(
+    rf"\[{_LITERAL_WS}(?:(?:{_SCALAR_LITERAL}){_LITERAL_WS},{_LITERAL_WS})*"
+    rf"(?:(?:{_SCALAR_LITERAL}){_LITERAL_WS},?{_LITERAL_WS})?\]"
+)
+_DICT_ITEM_LITERAL = rf"(?:{_SCALAR_LITERAL}){_LITERAL_WS}:{_LITERAL_WS}(?:{_SCALAR_LITERAL})"
+_DICT_LITERAL_PATTERN = re.compile(
+    rf"\{{{_LITERAL_WS}(?:{_DICT_ITEM_LITERAL}{_LITERAL_WS},{_LITERAL_WS})*"
+    rf"(?:{_DICT_ITEM_LITERAL}{_LITERAL_WS},?{_LITERAL_WS})?\}}"
+)
+_SCALAR_CONSTANTS = {"True": True, "False": False, "None": None}
+
+# Returned by _eval_literal() for values which aren't literals.
+_NOT_A_LITERAL = object()
+
+# Longer values are not worth keeping in the memo of literal values.
+_MAX_MEMO_LITERAL_LENGTH = 1024
+
+
+def _scalar_literal_value(token: str) -> Any:
+    first = token[0]
+    if first == "'" or first == '"':
+        return token[1:-1]
+    if token in _SCALAR_CONSTANTS:
+        return _SCALAR_CONSTANTS[token]
+    if "." in token:
+        return float(token)
+    return int(token)
+
+
+def _eval_literal(raw: str) -> Any:
+    if _SCALAR_LITERAL_PATTERN.fullmatch(raw):
+        return _scalar_literal_value(raw)
+    if _LIST_LITERAL_PATTERN.fullmatch(raw):
+        return [_scalar_literal_value(t) for t in _SCALAR_LITERAL_PATTERN.findall(raw)]
+    if _DICT_LITERAL_PATTERN.fullmatch(raw):
+        tokens = [_scalar_literal_value(t) for t in _SCALAR_LITERAL_PATTERN.findall(raw)]
+        return dict(zip(tokens[::2], tokens[1::2]))
+
+    try:
+        return literal_eval(raw)
+    except (ValueError, SyntaxError, MemoryError):
+        return _NOT_A_LITERAL
+
+
+_eval_literal_memo = functools.lru_cache(maxsize=4096)(_eval_literal)
+
+
+def _copy_literal(value: Any) -> Any:
+    # Values from the memo are shared, so the containers in them are copied.
+    if isinstance(value, list):
+        return [_copy_literal(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _copy_literal(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_copy_literal(v) for v in value)
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
 def quoted_native_concat(nodes: Iterator[str]) -> Any:
     """Handle special case for native_concat from the NativeTemplate.
 
@@ -289,9 +612,11 @@ def quoted_native_concat(nodes: Iterator[str]) -> Any:
         # multiple nodes become a string.
         return "".join([str(v) for v in chain(head, nodes)])
 
-    try:
-        result = literal_eval(raw)
-    except (ValueError, SyntaxError, MemoryError):
+    if len(raw) <= _MAX_MEMO_LITERAL_LENGTH:
+        result = _copy_literal(_eval_literal_memo(raw))
+    else:
+        result = _eval_literal(raw)
+    if result is _NOT_A_LITERAL:
         result = raw
     if isinstance(raw, BoolMarker) and not isinstance(result, bool):
         raise JinjaRenderingError(f"Could not convert value '{raw!s}' into type 'bool'")
@@ -304,6 +629,9 @@ def quoted_native_concat(nodes: Iterator[str]) -> Any:
 class NativeSandboxTemplate(jinja2.nativetypes.NativeTemplate):  # mypy: ignore
     environment_class = NativeSandboxEnvironment  # type: ignore
 
+    # Set by get_template() when capturing macros, see CaptureUndefined.
+    undefined_node: Optional[_NodeProtocol] = None
+
     def render(self, *args: Any, **kwargs: Any) -> Any:
         """Render the template to produce a native Python type.
 
@@ -314,6 +642,13 @@ class NativeSandboxTemplate(jinja2.nativetypes.NativeTemplate):  # mypy: ignore
         """
         vars = args[0]
 
+        node = _template_undefined_node(self)
+        if node is not None:
+            with undefined_node(node):
+                return self._render(vars)
+        return self._render(vars)
+
+    def _render(self, vars: Dict[str, Any]) -> Any:
         try:
             return quoted_native_concat(self.root_render_func(self.new_context(vars)))
         except Exception:
@@ -328,25 +663,118 @@ class MacroProtocol(Protocol):
 NativeSandboxEnvironment.template_class = NativeSandboxTemplate  # type: ignore
 
 
-class TemplateCache:
+def _estimate_template_size(source: str) -> int:
+    # A rough estimate of the memory held by a compiled template, measured on
+    # CPython: a fixed overhead plus about ten bytes per character of source.
+    return 8192 + 10 * len(source)
+
+
+class PrecompiledTemplates(Protocol):
+    def get_template(self, digest: str) -> Optional[jinja2.Template]:
+        ...
+
+
+class _LockStripe:
+    __slots__ = ("lock", "pending")
+
     def __init__(self) -> None:
-        self.file_cache: Dict[str, jinja2.Template] = {}
+        self.lock = threading.Lock()
+        # The compilations in progress for the keys of this stripe.
+        self.pending: Dict[str, "Future[jinja2.Template]"] = {}
 
-    def get_node_template(self, node: MacroProtocol) -> jinja2.Template:
-        key = node.macro_sql
 
-        if key in self.file_cache:
-            return self.file_cache[key]
+# Macro sources are looked up on every call of their macro, and hashing a
+# large source costs more than the call, so their digests are memoized.
+# Looking up a source hashes the str, which python caches on the object.
+_macro_digest = functools.lru_cache(maxsize=16384)(content_digest)
 
-        template = get_template(
-            string=node.macro_sql,
-            ctx={},
-            node=node,
-        )
 
-        self.file_cache[key] = template
+class TemplateCache:
+    """A cache of compiled macro templates, keyed by a digest of the macro source.
+
+    By default the cache is unbounded. It can be bounded by number of entries
+    and/or by the estimated memory held by the compiled templates, in which
+    case the least recently used templates are evicted first.
+
+    If precompiled is set, templates are loaded from it rather than compiled
+    where possible. See dbt_common.clients.jinja_precompile.
+
+    The cache is safe to use from multiple threads. Threads which request a
+    template that is being compiled by another thread wait for that
+    compilation rather than repeating it. Keys are spread over lock_stripes
+    locks, so requests for unrelated templates rarely contend.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_size: Optional[int] = None,
+        lock_stripes: int = 16,
+    ) -> None:
+        self.file_cache: LRUCache[jinja2.Template] = LRUCache(max_entries, max_size)
+        self.precompiled: Optional[PrecompiledTemplates] = None
+        self._stripes = [_LockStripe() for _ in range(max(lock_stripes, 1))]
+
+    def get_node_template(self, node: MacroProtocol) -> jinja2.Template:
+        key = _macro_digest(node.macro_sql)
+
+        template = self.file_cache.get(key)
+        if template is not None:
+            return template
+
+        stripe = self._stripes[int(key[:8], 16) % len(self._stripes)]
+        with stripe.lock:
+            # The template may have been added since the lookup above.
+            template = self.file_cache.peek(key)
+            if template is not None:
+                return template
+            pending = stripe.pending.get(key)
+            if pending is None:
+                compilation: "Future[jinja2.Template]" = Future()
+                stripe.pending[key] = compilation
+
+        if pending is not None:
+            try:
+                return pending.result()
+            except Exception:
+                # Compile it again, so that the error is raised for this
+                # node rather than the one the other thread compiled.
+                return self._load_template(node, key)
+
+        try:
+            template = self._load_template(node, key)
+            self.file_cache.put(key, template, _estimate_template_size(node.macro_sql))
+        except BaseException as exc:
+            compilation.set_exception(exc)
+            raise
+        else:
+            compilation.set_result(template)
+        finally:
+            with stripe.lock:
+                del stripe.pending[key]
         return template
 
+    def _load_template(self, node: MacroProtocol, key: str) -> jinja2.Template:
+        template = None
+        if self.precompiled is not None:
+            with catch_jinja(node):
+                template = self.precompiled.get_template(key)
+        if template is None:
+            template = get_template(
+                string=node.macro_sql,
+                ctx={},
+                node=node,
+            )
+        return template
+
+    def configure(self, max_entries: Optional[int] = None, max_size: Optional[int] = None) -> None:
+        """Set the bounds of the cache, evicting entries if they are now exceeded."""
+        self.file_cache.resize(max_entries, max_size)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.file_cache.stats
+
     def clear(self) -> None:
         self.file_cache.clear()
 
@@ -354,7 +782,133 @@ class TemplateCache:
 template_cache = TemplateCache()
 
 
+# If set, the calls to each macro are recorded by this profiler.
+_MACRO_PROFILER: Optional[MacroProfiler] = None
+
+
+def set_macro_profiler(profiler: Optional[MacroProfiler]) -> None:
+    """Record macro calls with profiler, or stop recording them if None.
+
+    For example, to write the stats of the macros called while compiling:
+
+        profiler = MacroProfiler()
+        set_macro_profiler(profiler)
+        ...
+        set_macro_profiler(None)
+        profiler.dump_stats("macros.prof")
+    """
+    global _MACRO_PROFILER
+    _MACRO_PROFILER = profiler
+
+
+def get_macro_profiler() -> Optional[MacroProfiler]:
+    return _MACRO_PROFILER
+
+
+class _MacroStack(threading.local):
+    def __init__(self) -> None:
+        self.frames: List[MacroFrame] = []
+
+
+# The macros being called by each thread, innermost last. Pushed and popped
+# by BaseMacroGenerator.call_macro(), and timed by the macro profiler.
+_MACRO_STACK = _MacroStack()
+
+
+def current_macro_stack() -> List["BaseMacroGenerator"]:
+    """Return the generators of the macros being called by the current thread, outermost first."""
+    return [frame.generator for frame in _MACRO_STACK.frames]
+
+
+class MacroUsage:
+    """Records which macros had generators made for them, and which of those were compiled.
+
+    Generators only compile their macro when it is first called, so the
+    macros which were registered but never compiled are the ones a command
+    did not need. Macros are identified by their unique_id, if they have
+    one, and otherwise by their name.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._registered: Dict[str, MacroProtocol] = {}
+        self._compiled: Set[str] = set()
+
+    @staticmethod
+    def macro_key(macro: MacroProtocol) -> str:
+        return getattr(macro, "unique_id", None) or macro.name
+
+    def register(self, macro: MacroProtocol) -> None:
+        key = self.macro_key(macro)
+        if key not in self._registered:
+            with self._lock:
+                self._registered.setdefault(key, macro)
+
+    def compiled(self, macro: MacroProtocol) -> None:
+        key = self.macro_key(macro)
+        if key not in self._compiled:
+            with self._lock:
+                self._registered.setdefault(key, macro)
+                self._compiled.add(key)
+
+    @property
+    def registered_count(self) -> int:
+        return len(self._registered)
+
+    @property
+    def compiled_count(self) -> int:
+        return len(self._compiled)
+
+    def uncompiled(self) -> List[MacroProtocol]:
+        """Return the registered macros which were never compiled."""
+        with self._lock:
+            return [macro for key, macro in self._registered.items() if key not in self._compiled]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._registered.clear()
+            self._compiled.clear()
+
+
+# If set, the macros generators are made for, and compile, are recorded here.
+_MACRO_USAGE: Optional[MacroUsage] = None
+
+
+def set_macro_usage(usage: Optional[MacroUsage]) -> None:
+    """Record the macros which are registered and compiled in usage, or stop if None."""
+    global _MACRO_USAGE
+    _MACRO_USAGE = usage
+
+
+def get_macro_usage() -> Optional[MacroUsage]:
+    return _MACRO_USAGE
+
+
+def _module_is_reusable(template: jinja2.Template) -> bool:
+    """Whether the module of template can be made once and its macros called many times.
+
+    Making the module runs the top level of the template. If the top level
+    loads or assigns any name other than the macros it defines, its
+    variables would be frozen at the values they had when the module was
+    made, and shared by later calls, so the module must be made per call.
+    The top-level variables are the root function's locals named l_0_*.
+    """
+    reusable = getattr(template, "_dbt_module_reusable", None)
+    if reusable is None:
+        code = template.root_render_func.__code__  # type: ignore[attr-defined]
+        macro_prefix = "l_0_" + MACRO_PREFIX
+        reusable = all(
+            not name.startswith("l_0_") or name.startswith(macro_prefix)
+            for name in code.co_varnames + code.co_cellvars
+        )
+        template._dbt_module_reusable = reusable  # type: ignore[attr-defined]
+    return reusable
+
+
 class BaseMacroGenerator:
+    # The template and context the macro was last made from, and the macro.
+    _macro_cache: Optional[Tuple[jinja2.Template, Any, Callable]] = None
+
     def __init__(self, context: Optional[Dict[str, Any]] = None) -> None:
         self.context: Optional[Dict[str, Any]] = context
 
@@ -365,14 +919,24 @@ class BaseMacroGenerator:
         raise NotImplementedError("get_name not implemented!")
 
     def get_macro(self) -> Callable:
-        name = self.get_name()
         template = self.get_template()
+        # Making the module runs the whole template, so the macro is reused
+        # for as long as the template and the context are the same objects,
+        # if the template has no top-level state. Replacing either one makes
+        # a new module.
+        cached = self._macro_cache
+        if cached is not None and cached[0] is template and cached[1] is self.context:
+            return cached[2]
+
+        name = self.get_name()
         # make the module. previously we set both vars and local, but that's
         # redundant: They both end up in the same place
         # make_module is in jinja2.environment. It returns a TemplateModule
         module = template.make_module(vars=self.context, shared=False)
         macro = module.__dict__[get_dbt_macro_name(name)]
 
+        if _module_is_reusable(template):
+            self._macro_cache = (template, self.context, macro)
         return macro
 
     @contextmanager
@@ -382,12 +946,30 @@ class BaseMacroGenerator:
         except (TypeError, jinja2.exceptions.TemplateRuntimeError) as e:
             raise CaughtMacroError(e)
 
+    def get_profile_key(self) -> FunctionKey:
+        return macro_function_key(self.get_name())
+
     def call_macro(self, *args: Any, **kwargs: Any) -> Any:
         # called from __call__ methods
         if self.context is None:
             raise DbtInternalError("Context is still None in call_macro!")
         assert self.context is not None
 
+        frames = _MACRO_STACK.frames
+        frames.append(MacroFrame(self))
+        try:
+            profiler = _MACRO_PROFILER
+            if profiler is None:
+                return self._call_macro(*args, **kwargs)
+            profiler.enter(frames[-1], self.get_profile_key())
+            try:
+                return self._call_macro(*args, **kwargs)
+            finally:
+                profiler.exit(frames)
+        finally:
+            frames.pop()
+
+    def _call_macro(self, *args: Any, **kwargs: Any) -> Any:
         macro = self.get_macro()
 
         with self.exception_handler():
@@ -398,20 +980,41 @@ class BaseMacroGenerator:
 
 
 class CallableMacroGenerator(BaseMacroGenerator):
+    """Calls a macro as a python function.
+
+    The macro is compiled when it is first called, so that making generators
+    for every macro in a project only costs compiling the ones that are used.
+    If lazy is False, it is compiled immediately instead, which raises any
+    compilation error up front.
+    """
+
     def __init__(
         self,
         macro: MacroProtocol,
         context: Optional[Dict[str, Any]] = None,
+        lazy: bool = True,
     ) -> None:
         super().__init__(context)
         self.macro = macro
+        usage = _MACRO_USAGE
+        if usage is not None:
+            usage.register(macro)
+        if not lazy:
+            self.get_template()
 
     def get_template(self) -> jinja2.Template:
-        return template_cache.get_node_template(self.macro)
+        template = template_cache.get_node_template(self.macro)
+        usage = _MACRO_USAGE
+        if usage is not None:
+            usage.compiled(self.macro)
+        return template
 
     def get_name(self) -> str:
         return self.macro.name
 
+    def get_profile_key(self) -> FunctionKey:
+        return macro_function_key(self.macro.name, self.macro)
+
     @contextmanager
     def exception_handler(self) -> Iterator[None]:
         try:
@@ -501,46 +1104,89 @@ def _is_dunder_name(name: str) -> bool:
     return name.startswith("__") and name.endswith("__")
 
 
+# The node which undefined values created while rendering a template for
+# capture_macros are attributed to. See undefined_node().
+_UNDEFINED_NODE: contextvars.ContextVar[Optional[_NodeProtocol]] = contextvars.ContextVar(
+    "dbt_undefined_node", default=None
+)
+
+
+@contextmanager
+def undefined_node(node: Optional[_NodeProtocol]) -> Iterator[None]:
+    """Attribute the undefined values created within the block to node."""
+    token = _UNDEFINED_NODE.set(node)
+    try:
+        yield
+    finally:
+        _UNDEFINED_NODE.reset(token)
+
+
+def _template_undefined_node(template: jinja2.Template) -> Optional[_NodeProtocol]:
+    # The node given to get_template(), or else to get_environment().
+    node = getattr(template, "undefined_node", None)
+    if node is None:
+        node = getattr(template.environment, "undefined_node", None)
+    return node
+
+
+class CaptureUndefined(jinja2.Undefined):
+    """The undefined type used when capturing macros.
+
+    Rather than failing, undefined values propagate through attribute access,
+    item access and calls. They can't be serialized, and raise an
+    UndefinedCompilationError for the node they were created for if that is
+    attempted.
+    """
+
+    def __init__(
+        self,
+        hint: Optional[str] = None,
+        obj: Any = None,
+        name: Optional[str] = None,
+        exc: Any = None,
+    ) -> None:
+        super().__init__(hint=hint, name=name)
+        self.node = _UNDEFINED_NODE.get()
+        self.name = name
+        self.hint = hint
+        # jinja uses these for safety, so we have to override them.
+        # see https://github.com/pallets/jinja/blob/master/jinja2/sandbox.py#L332-L339 # noqa
+        self.unsafe_callable = False
+        self.alters_data = False
+
+    def __getitem__(self, name: Any) -> "CaptureUndefined":
+        # Propagate the undefined value if a caller accesses this as if it
+        # were a dictionary
+        return self
+
+    def __getattr__(self, name: str) -> "CaptureUndefined":
+        if name == "name" or _is_dunder_name(name):
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(type(self).__name__, name)
+            )
+
+        self.name = name
+
+        undefined = self.__class__(hint=self.hint, name=self.name)
+        undefined.node = self.node
+        return undefined
+
+    def __call__(self, *args: Any, **kwargs: Any) -> "CaptureUndefined":
+        return self
+
+    def __reduce__(self) -> NoReturn:
+        raise UndefinedCompilationError(name=self.name or "unknown", node=self.node)
+
+
 def create_undefined(node: Optional[_NodeProtocol] = None) -> Type[jinja2.Undefined]:
-    class Undefined(jinja2.Undefined):
-        def __init__(
-            self,
-            hint: Optional[str] = None,
-            obj: Any = None,
-            name: Optional[str] = None,
-            exc: Any = None,
-        ) -> None:
-            super().__init__(hint=hint, name=name)
-            self.node = node
-            self.name = name
-            self.hint = hint
-            # jinja uses these for safety, so we have to override them.
-            # see https://github.com/pallets/jinja/blob/master/jinja2/sandbox.py#L332-L339 # noqa
-            self.unsafe_callable = False
-            self.alters_data = False
-
-        def __getitem__(self, name: Any) -> "Undefined":
-            # Propagate the undefined value if a caller accesses this as if it
-            # were a dictionary
-            return self
-
-        def __getattr__(self, name: str) -> "Undefined":
-            if name == "name" or _is_dunder_name(name):
-                raise AttributeError(
-                    "'{}' object has no attribute '{}'".format(type(self).__name__, name)
-                )
-
-            self.name = name
-
-            return self.__class__(hint=self.hint, name=self.name)
-
-        def __call__(self, *args: Any, **kwargs: Any) -> "Undefined":
-            return self
-
-        def __reduce__(self) -> NoReturn:
-            raise UndefinedCompilationError(name=self.name or "unknown", node=node)
-
-    return Undefined
+    """Return the undefined type to use when capturing macros.
+
+    This is always the shared CaptureUndefined type. Its instances are
+    attributed to the node bound with undefined_node() when they are created,
+    which templates from get_template() and get_environment() do while
+    rendering. The node argument is accepted for compatibility.
+    """
+    return CaptureUndefined
 
 
 def is_list(value):
@@ -570,18 +1216,19 @@ def get_environment(
     capture_macros: bool = False,
     native: bool = False,
 ) -> jinja2.Environment:
-    args: Dict[str, List[Union[str, Type[jinja2.ext.Extension]]]] = {
-        "extensions": ["jinja2.ext.do", "jinja2.ext.loopcontrols"]
+    args: Dict[str, Any] = {
+        "extensions": ["jinja2.ext.do", "jinja2.ext.loopcontrols"],
+        "bytecode_cache": _BYTECODE_CACHE,
     }
 
     if capture_macros:
-        args["undefined"] = create_undefined(node)  # type: ignore
+        args["undefined"] = CaptureUndefined
 
     args["extensions"].append(MaterializationExtension)
     args["extensions"].append(DocumentationExtension)
     args["extensions"].append(TestExtension)
 
-    env_cls: Type[jinja2.Environment]
+    env_cls: Type[MacroFuzzEnvironment]
     if native:
         env_cls = NativeSandboxEnvironment
         filters = NATIVE_FILTERS
@@ -591,10 +1238,41 @@ def get_environment(
 
     env = env_cls(**args)
     env.filters.update(filters)
+    if capture_macros:
+        env.undefined_node = node
 
     return env
 
 
+# Environments shared by get_template() and parse(), keyed by (native, capture_macros).
+_ENVIRONMENT_POOL: Dict[Tuple[bool, bool], jinja2.Environment] = {}
+
+
+def get_pooled_environment(
+    capture_macros: bool = False, native: bool = False
+) -> jinja2.Environment:
+    """Return a shared environment equivalent to get_environment().
+
+    Building an environment loads its extensions and filters, so environments
+    are built once per flavor and reused. The returned environment is shared
+    by every caller and must not be modified: its globals, filters and tests
+    are read-only mappings. Use get_environment() to get a private one.
+
+    The capture_macros environments are not specific to a node. Use
+    get_template() to get a template whose undefined values are attributed to
+    a node.
+    """
+    key = (native, capture_macros)
+    env = _ENVIRONMENT_POOL.get(key)
+    if env is None:
+        env = get_environment(None, capture_macros, native)
+        env.globals = MappingProxyType(env.globals)  # type: ignore[assignment]
+        env.filters = MappingProxyType(env.filters)  # type: ignore[assignment]
+        env.tests = MappingProxyType(env.tests)  # type: ignore[assignment]
+        env = _ENVIRONMENT_POOL.setdefault(key, env)
+    return env
+
+
 @contextmanager
 def catch_jinja(node: Optional[_NodeProtocol] = None) -> Iterator[None]:
     try:
@@ -615,21 +1293,245 @@ def catch_jinja(node: Optional[_NodeProtocol] = None) -> Iterator[None]:
         raise CompilationError(str(e), node) from e
 
 
-_TESTING_PARSE_CACHE: Dict[str, jinja2.nodes.Template] = {}
+def _parse_cache_persistent_id(obj: Any) -> Optional[str]:
+    # Parsed templates refer to the environment which parsed them. Pickle a
+    # reference to it, and resolve it to the pooled environment when loading.
+    if isinstance(obj, jinja2.Environment):
+        return "environment"
+    return None
+
+
+def _parse_cache_persistent_load(pid: Any) -> jinja2.Environment:
+    return get_pooled_environment()
+
+
+# Caches of parse() and extract_toplevel_blocks() results. Both are disabled
+# unless configured (or test caching is enabled), e.g.
+# parse_cache.configure(max_size=256 * 1024 * 1024, directory="target/jinja_cache")
+parse_cache: ContentCache[jinja2.nodes.Template] = ContentCache(
+    "parse",
+    persistent_id=_parse_cache_persistent_id,
+    persistent_load=_parse_cache_persistent_load,
+)
+blocks_cache: ContentCache[
+    Tuple[List[Union[BlockData, BlockTag]], List[ExtractWarning]]
+] = ContentCache("blocks")
+
+# A cache of analyze() results, which is enabled and held in memory by default.
+analysis_cache: ContentCache["TemplateAnalysis"] = ContentCache("analysis")
+analysis_cache.configure(max_entries=10000)
+
+
+# Bumped whenever the parse trees or blocks stored by the caches change shape.
+# Keys include it, and the versions of dbt-common and jinja, so that entries
+# written to disk by other versions are never loaded.
+CACHE_FORMAT_VERSION = 1
+_CACHE_VERSION = f"{CACHE_FORMAT_VERSION}:{dbt_common_version}:{jinja2.__version__}"
+
+
+def _parse_cache_key(string: str) -> str:
+    return content_digest(_CACHE_VERSION, string)
+
+
+def _blocks_cache_key(
+    text: str,
+    allowed_blocks: Optional[Set[str]],
+    collect_raw_data: bool,
+    lazy_contents: bool = False,
+) -> str:
+    # None and an empty set of allowed blocks mean different things to
+    # BlockIterator, so they must not share a key.
+    allowed = ["default"] if allowed_blocks is None else ["set", *sorted(allowed_blocks)]
+    return content_digest(
+        _CACHE_VERSION, text, str(collect_raw_data), str(lazy_contents), *allowed
+    )
+
+
+def invalidate_parse_cache(string: Optional[str] = None) -> None:
+    """Drop the cached parse() result for string, or all cached results if None."""
+    parse_cache.invalidate(None if string is None else _parse_cache_key(str(string)))
+
+
+def invalidate_blocks_cache(
+    text: Optional[str] = None,
+    allowed_blocks: Optional[Set[str]] = None,
+    collect_raw_data: bool = True,
+    lazy_contents: bool = False,
+) -> None:
+    """Drop the cached extract_toplevel_blocks() result for the given arguments,
+    or all cached results if text is None."""
+    if text is None:
+        blocks_cache.invalidate()
+    else:
+        blocks_cache.invalidate(
+            _blocks_cache_key(text, allowed_blocks, collect_raw_data, lazy_contents)
+        )
 
 
 def parse(string: Any) -> jinja2.nodes.Template:
+    """Parse a template into its jinja syntax tree.
+
+    If the parse cache is enabled, the same tree is returned to every caller
+    which parses the same string, so it must not be modified.
+    """
     str_string = str(string)
-    if test_caching_enabled() and str_string in _TESTING_PARSE_CACHE:
-        return _TESTING_PARSE_CACHE[str_string]
+    use_cache = parse_cache.enabled or test_caching_enabled()
+    if use_cache:
+        key = _parse_cache_key(str_string)
+        cached = parse_cache.get(key)
+        if cached is not None:
+            return cached
 
     with catch_jinja():
-        parsed: jinja2.nodes.Template = get_environment().parse(str(string))
-        if test_caching_enabled():
-            _TESTING_PARSE_CACHE[str_string] = parsed
+        parsed: jinja2.nodes.Template = get_pooled_environment().parse(str_string)
+        if use_cache:
+            # a rough estimate of the memory held by the parse tree
+            parse_cache.put(key, parsed, 4096 + 25 * len(str_string))
         return parsed
 
 
+class _Unresolved(enum.Enum):
+    UNRESOLVED = "<unresolved>"
+
+    def __repr__(self) -> str:
+        return self.value
+
+
+# Stands in for an argument of a call whose value is only known when rendering.
+UNRESOLVED = _Unresolved.UNRESOLVED
+
+
+@dataclasses.dataclass
+class TemplateCall:
+    """A call made by a template, as found by analyze().
+
+    path is the name called and the attributes accessed on it, such as
+    ("adapter", "dispatch"), or None if what is called is not a name. args and
+    kwargs are the literal values of the arguments, where an argument which
+    isn't a literal is UNRESOLVED. The call is static if its path and all its
+    arguments are known.
+    """
+
+    path: Optional[Tuple[str, ...]]
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+    static: bool
+    lineno: int
+
+    @property
+    def name(self) -> Optional[str]:
+        return None if self.path is None else ".".join(self.path)
+
+
+@dataclasses.dataclass
+class TemplateAnalysis:
+    """What analyze() found in a template.
+
+    calls holds every call in the template, in the order they appear. macros
+    holds the names of the macros the template defines. The template is
+    static if all its calls are.
+    """
+
+    calls: List[TemplateCall]
+    macros: Set[str]
+
+    @property
+    def static(self) -> bool:
+        return all(call.static for call in self.calls)
+
+    @property
+    def called_names(self) -> Set[str]:
+        """The names called, along with any attributes accessed on them."""
+        return {call.name for call in self.calls if call.name is not None}
+
+    def calls_to(self, name: str) -> List[TemplateCall]:
+        """Return the calls to name, such as 'ref' or 'adapter.dispatch'."""
+        return [call for call in self.calls if call.name == name]
+
+
+def _call_path(node: jinja2.nodes.Node) -> Optional[Tuple[str, ...]]:
+    path = []
+    while isinstance(node, jinja2.nodes.Getattr):
+        path.append(node.attr)
+        node = node.node
+    if not isinstance(node, jinja2.nodes.Name):
+        return None
+    path.append(node.name)
+    return tuple(reversed(path))
+
+
+def _literal_value(node: jinja2.nodes.Node) -> Any:
+    if isinstance(node, jinja2.nodes.Const):
+        return node.value
+    if isinstance(node, (jinja2.nodes.List, jinja2.nodes.Tuple)):
+        items = [_literal_value(item) for item in node.items]
+        if any(item is UNRESOLVED for item in items):
+            return UNRESOLVED
+        return items if isinstance(node, jinja2.nodes.List) else tuple(items)
+    if isinstance(node, jinja2.nodes.Dict):
+        result = {}
+        for pair in node.items:
+            key = _literal_value(pair.key)
+            value = _literal_value(pair.value)
+            if key is UNRESOLVED or value is UNRESOLVED:
+                return UNRESOLVED
+            try:
+                result[key] = value
+            except TypeError:
+                # Unhashable keys, such as lists or tuples holding them, fail
+                # when the template is rendered, so have no static value.
+                return UNRESOLVED
+        return result
+    if isinstance(node, jinja2.nodes.Neg):
+        value = _literal_value(node.node)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return -value
+    return UNRESOLVED
+
+
+def _analyze_call(node: jinja2.nodes.Call) -> TemplateCall:
+    path = _call_path(node.node)
+    args = tuple(_literal_value(arg) for arg in node.args)
+    kwargs = {kwarg.key: _literal_value(kwarg.value) for kwarg in node.kwargs}
+    static = (
+        path is not None
+        and node.dyn_args is None
+        and node.dyn_kwargs is None
+        and UNRESOLVED not in args
+        and UNRESOLVED not in kwargs.values()
+    )
+    return TemplateCall(
+        path=path, args=args, kwargs=kwargs, static=static, lineno=node.lineno or 0
+    )
+
+
+def analyze(string: Any) -> TemplateAnalysis:
+    """Find the calls a template makes, such as to macros, ref() and source(), without
+    rendering it.
+
+    Where all the calls are static, their arguments are known without
+    rendering the template. The result is cached, and must not be modified.
+    """
+    str_string = str(string)
+    key = _parse_cache_key(str_string)
+    cached = analysis_cache.get(key) if analysis_cache.enabled else None
+    if cached is not None:
+        return cached
+
+    parsed = parse(str_string)
+    # find_all() visits nodes in the order they appear in the template.
+    calls = [_analyze_call(call) for call in parsed.find_all(jinja2.nodes.Call)]
+    macros = {
+        macro.name[len(MACRO_PREFIX) :] if macro.name.startswith(MACRO_PREFIX) else macro.name
+        for macro in parsed.find_all(jinja2.nodes.Macro)
+    }
+    analysis = TemplateAnalysis(calls=calls, macros=macros)
+
+    if analysis_cache.enabled:
+        analysis_cache.put(key, analysis)
+    return analysis
+
+
 def get_template(
     string: str,
     ctx: Dict[str, Any],
@@ -638,10 +1540,13 @@ def get_template(
     native: bool = False,
 ) -> jinja2.Template:
     with catch_jinja(node):
-        env = get_environment(node, capture_macros, native=native)
+        env = get_pooled_environment(capture_macros, native=native)
 
         template_source = str(string)
-        return env.from_string(template_source, globals=ctx)
+        template = env.from_string(template_source, globals=ctx)
+        if capture_macros:
+            template.undefined_node = node  # type: ignore
+        return template
 
 
 def render_template(
@@ -651,14 +1556,89 @@ def render_template(
         return template.render(ctx)
 
 
-_TESTING_BLOCKS_CACHE: Dict[int, List[Union[BlockData, BlockTag]]] = {}
+def _bind_undefined_node(pieces: Iterator[Any], node: _NodeProtocol) -> Iterator[Any]:
+    # A context variable set in a generator stays set for its caller while it
+    # is suspended, so the node is only bound while the template is running.
+    done = object()
+    while True:
+        with undefined_node(node):
+            piece = next(pieces, done)
+        if piece is done:
+            return
+        yield piece
+
+
+# The size, in characters, of the chunks stream_template() yields.
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
-def _get_blocks_hash(text: str, allowed_blocks: Optional[Set[str]], collect_raw_data: bool) -> int:
-    """Provides a hash function over the arguments to extract_toplevel_blocks, in order to support caching."""
-    allowed_blocks = allowed_blocks or set()
-    allowed_tuple = tuple(sorted(allowed_blocks) or [])
-    return text.__hash__() + allowed_tuple.__hash__() + collect_raw_data.__hash__()
+def stream_template(
+    template: jinja2.Template,
+    ctx: Dict[str, Any],
+    node: Optional[_NodeProtocol] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Render template, yielding the output in chunks rather than as one string.
+
+    Errors are translated as for render_template(), but are raised from the
+    iteration which reaches them, after the output before them has been
+    yielded. The output is always text: native templates yield their values
+    converted to strings.
+
+    :param chunk_size: The output is yielded in chunks of at least this many
+        characters, other than the last.
+    """
+    with catch_jinja(node):
+        generated = template.generate(ctx)
+        bound_node = _template_undefined_node(template)
+        if bound_node is not None:
+            generated = _bind_undefined_node(generated, bound_node)
+
+        pieces: List[str] = []
+        size = 0
+        for piece in generated:
+            if not isinstance(piece, str):
+                piece = str(piece)
+            pieces.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(pieces)
+                pieces = []
+                size = 0
+        if pieces:
+            yield "".join(pieces)
+
+
+def render_template_to(
+    template: jinja2.Template,
+    ctx: Dict[str, Any],
+    output: IO[str],
+    node: Optional[_NodeProtocol] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> int:
+    """Render template into output, such as a file, without holding all the output in memory.
+
+    See stream_template(). If rendering fails, the output before the error
+    will already have been written.
+
+    :return: The number of characters written.
+    """
+    written = 0
+    for chunk in stream_template(template, ctx, node, chunk_size):
+        output.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _new_tag_iterator(text: str, block_scanner: Optional[str] = None) -> TagIterator:
+    if block_scanner is None:
+        block_scanner = BLOCK_SCANNER
+    tag_iterator_class = TAG_ITERATORS.get(block_scanner)
+    if tag_iterator_class is None:
+        raise DbtInternalError(
+            f"Unknown block scanner '{block_scanner}', expected one of {sorted(TAG_ITERATORS)}"
+        )
+    return tag_iterator_class(text)
 
 
 def extract_toplevel_blocks(
@@ -666,6 +1646,7 @@ def extract_toplevel_blocks(
     allowed_blocks: Optional[Set[str]] = None,
     collect_raw_data: bool = True,
     warning_callback: Optional[Callable[[ExtractWarning], None]] = None,
+    lazy_contents: bool = False,
 ) -> List[Union[BlockData, BlockTag]]:
     """Extract the top-level blocks with matching block types from a jinja file.
 
@@ -681,22 +1662,332 @@ def extract_toplevel_blocks(
         `block_name`.
     :param warning_callback: An optional callback that will be called if there
         are recoverable issues detected in the template.
+    :param lazy_contents: If set, the blocks keep a reference to text and the
+        offsets of their contents, which are only sliced out of text when
+        accessed, instead of holding copies of them.
     :return: A list of `BlockTag`s matching the allowed block types and (if
-        `collect_raw_data` is `True`) `BlockData` objects.
+        `collect_raw_data` is `True`) `BlockData` objects. The list and its
+        blocks are the caller's own, even when they come from the cache.
     """
 
-    if test_caching_enabled():
-        hash = _get_blocks_hash(text, allowed_blocks, collect_raw_data)
-        if hash in _TESTING_BLOCKS_CACHE:
-            return _TESTING_BLOCKS_CACHE[hash]
+    return _extract_toplevel_blocks(
+        text, allowed_blocks, collect_raw_data, warning_callback, lazy_contents
+    )
+
+
+def _extract_toplevel_blocks(
+    text: str,
+    allowed_blocks: Optional[Set[str]],
+    collect_raw_data: bool,
+    warning_callback: Optional[Callable[[ExtractWarning], None]],
+    lazy_contents: bool,
+    block_scanner: Optional[str] = None,
+) -> List[Union[BlockData, BlockTag]]:
+    use_cache = blocks_cache.enabled or test_caching_enabled()
+    if not use_cache:
+        tag_iterator = _new_tag_iterator(text, block_scanner)
+        return BlockIterator(tag_iterator, warning_callback).lex_for_blocks(
+            allowed_blocks=allowed_blocks,
+            collect_raw_data=collect_raw_data,
+            lazy_contents=lazy_contents,
+        )
+
+    key = _blocks_cache_key(text, allowed_blocks, collect_raw_data, lazy_contents)
+    cached = blocks_cache.get(key)
+    if cached is not None:
+        blocks, warnings = cached
+    else:
+        # Warnings are cached alongside the blocks, so that they can be
+        # replayed to the callback when the result comes from the cache.
+        warnings: List[ExtractWarning] = []
+        tag_iterator = _new_tag_iterator(text, block_scanner)
+        blocks = BlockIterator(tag_iterator, warnings.append).lex_for_blocks(
+            allowed_blocks=allowed_blocks,
+            collect_raw_data=collect_raw_data,
+            lazy_contents=lazy_contents,
+        )
+        # a rough estimate of the memory held by the blocks
+        blocks_cache.put(key, (blocks, warnings), 1024 + (1 if lazy_contents else 4) * len(text))
+
+    if warning_callback is not None:
+        for warning in warnings:
+            warning_callback(warning)
+
+    # Blocks can be modified, so callers are given copies of the cached ones.
+    return [copy.copy(block) for block in blocks]
+
+
+@dataclasses.dataclass
+class BlockUpdate:
+    """The result of update_toplevel_blocks().
+
+    text is the edited text and blocks its top-level blocks. changed holds the
+    blocks of the edited text which are new or whose contents differ from any
+    previous block they replaced, and removed the previous blocks which no
+    longer exist. Blocks which only moved because of the edit are in neither.
+    """
+
+    text: str
+    blocks: List[Union[BlockData, BlockTag]]
+    changed: List[Union[BlockData, BlockTag]]
+    removed: List[Union[BlockData, BlockTag]]
+
 
-    tag_iterator = TagIterator(text)
-    blocks = BlockIterator(tag_iterator, warning_callback).lex_for_blocks(
-        allowed_blocks=allowed_blocks, collect_raw_data=collect_raw_data
+def _block_key(block: Union[BlockData, BlockTag]) -> Tuple[str, Optional[str], Optional[str]]:
+    return block.block_type_name, getattr(block, "block_name", None), block.full_block
+
+
+def _shift_block(
+    block: Union[BlockData, BlockTag], delta: int, source: Optional[str]
+) -> Union[BlockData, BlockTag]:
+    if isinstance(block, BlockData):
+        return BlockData(
+            None if source is not None else block.contents,
+            source=source,
+            start=block.start + delta,
+            end=block.end + delta,
+        )
+    return BlockTag(
+        block.block_type_name,
+        block.block_name,
+        contents=None if source is not None else block.contents,
+        full_block=None if source is not None else block.full_block,
+        source=source,
+        start=block.start + delta,
+        end=block.end + delta,
+        contents_start=block.contents_start + delta,
+        contents_end=block.contents_end + delta,
     )
 
-    if test_caching_enabled():
-        hash = _get_blocks_hash(text, allowed_blocks, collect_raw_data)
-        _TESTING_BLOCKS_CACHE[hash] = blocks
 
-    return blocks
+def update_toplevel_blocks(
+    text: str,
+    blocks: List[Union[BlockData, BlockTag]],
+    offset: int,
+    removed_length: int,
+    inserted: str,
+    allowed_blocks: Optional[Set[str]] = None,
+    collect_raw_data: bool = True,
+    warning_callback: Optional[Callable[[ExtractWarning], None]] = None,
+    lazy_contents: bool = False,
+) -> BlockUpdate:
+    """Update the top-level blocks of a file after an edit.
+
+    Rather than extracting the blocks of the whole edited file, lexing
+    restarts at the last block before the edit, and stops as soon as it
+    reaches a block after the edit which started at the same place (allowing
+    for the change in length) before it. Every later block is reused, with its
+    offsets shifted. The result is the same as extracting the blocks of the
+    edited text, but warnings are only reported for the part of it which was
+    lexed again.
+
+    :param text: The text before the edit.
+    :param blocks: The blocks of text, as returned by extract_toplevel_blocks()
+        with the same allowed_blocks and collect_raw_data.
+    :param offset: The position in text at which the edit starts.
+    :param removed_length: The number of characters the edit removes.
+    :param inserted: The text the edit inserts at offset.
+    :param allowed_blocks: As for extract_toplevel_blocks().
+    :param collect_raw_data: As for extract_toplevel_blocks().
+    :param warning_callback: As for extract_toplevel_blocks().
+    :param lazy_contents: As for extract_toplevel_blocks().
+    :return: A `BlockUpdate` with the edited text, its blocks, and the blocks
+        which changed.
+    """
+    if offset < 0 or removed_length < 0 or offset + removed_length > len(text):
+        raise DbtInternalError(
+            f"Edit of {removed_length} characters at {offset} is outside a text of "
+            f"length {len(text)}"
+        )
+
+    new_text = text[:offset] + inserted + text[offset + removed_length :]
+    delta = len(inserted) - removed_length
+    edit_end = offset + removed_length
+
+    # At the start of a block the lexer has no open tags, so it depends only
+    # on the text which follows. Lexing restarts at the last block which is
+    # entirely before the edit, and can stop at the first block which starts
+    # after it, and started at the same place before the edit.
+    keep = 0
+    restart = 0
+    for index, block in enumerate(blocks):
+        if block.end >= offset:
+            break
+        if isinstance(block, BlockTag):
+            keep = index
+            restart = block.start
+
+    old_starts = {
+        block.start: index
+        for index, block in enumerate(blocks[keep:], start=keep)
+        if isinstance(block, BlockTag) and block.start >= edit_end
+    }
+
+    tag_iterator = _new_tag_iterator(new_text)
+    tag_iterator.advance(restart)
+    block_iterator = BlockIterator(tag_iterator, warning_callback)
+    block_iterator.last_position = restart
+
+    lexed: List[Union[BlockData, BlockTag]] = []
+    resync: Optional[int] = None
+    for block in block_iterator.find_blocks(
+        allowed_blocks=allowed_blocks,
+        collect_raw_data=collect_raw_data,
+        lazy_contents=lazy_contents,
+    ):
+        lexed.append(block)
+        if isinstance(block, BlockTag) and block.start - delta in old_starts:
+            resync = old_starts[block.start - delta]
+            break
+
+    source = new_text if lazy_contents else None
+    kept = [_shift_block(block, 0, source) if lazy_contents else block for block in blocks[:keep]]
+    if resync is None:
+        replaced = blocks[keep:]
+        reused: List[Union[BlockData, BlockTag]] = []
+    else:
+        replaced = blocks[keep : resync + 1]
+        reused = [_shift_block(block, delta, source) for block in blocks[resync + 1 :]]
+
+    replaced_keys = {_block_key(block) for block in replaced}
+    lexed_keys = {_block_key(block) for block in lexed}
+    return BlockUpdate(
+        text=new_text,
+        blocks=kept + lexed + reused,
+        changed=[block for block in lexed if _block_key(block) not in replaced_keys],
+        removed=[block for block in replaced if _block_key(block) not in lexed_keys],
+    )
+
+
+# An item for extract_toplevel_blocks_batch(): a path to read the text from, or
+# the text itself, and the allowed blocks.
+BlockExtractionItem = Tuple[Union[str, "os.PathLike[str]"], Optional[Set[str]]]
+
+
+@dataclasses.dataclass
+class BlockExtractionResult:
+    """The result of extracting the blocks from one item of a batch.
+
+    If extraction failed, error holds the CompilationError that
+    extract_toplevel_blocks() raised, or the OSError or UnicodeDecodeError
+    raised reading the item's path, and blocks is empty. path is the path the
+    text was read from, or None if the item was the text itself.
+    """
+
+    index: int
+    path: Optional[str]
+    blocks: List[Union[BlockData, BlockTag]]
+    warnings: List[ExtractWarning]
+    error: Optional[Exception] = None
+
+
+def _extract_blocks_worker(
+    task: Tuple[int, Optional[str], Optional[str], Optional[Set[str]], bool, bool, str]
+) -> Tuple[int, Optional[str], List[Union[BlockData, BlockTag]], List[ExtractWarning], Any]:
+    index, path, text, allowed_blocks, collect_raw_data, lazy_contents, block_scanner = task
+
+    if path is not None:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as exc:
+            # Both pickle, so are sent as they are.
+            return index, path, [], [], exc
+    assert text is not None
+
+    warnings: List[ExtractWarning] = []
+    try:
+        # Worker processes may not have inherited the parent's scanner, so
+        # it is passed with each task.
+        blocks = _extract_toplevel_blocks(
+            text,
+            allowed_blocks=allowed_blocks,
+            collect_raw_data=collect_raw_data,
+            warning_callback=warnings.append,
+            lazy_contents=lazy_contents,
+            block_scanner=block_scanner,
+        )
+    except CompilationError as exc:
+        # The block lexer's errors don't all survive pickling: some hold the
+        # TagIterator (and its re.Match objects), and some can't be rebuilt
+        # from their args. Their message is already rendered, so send the
+        # exception's type, args and state without the tag parser instead.
+        tag_parser = exc.__dict__.get("tag_parser")
+        args = tuple(None if arg is tag_parser else arg for arg in exc.args)
+        state = {k: v for k, v in exc.__dict__.items() if k != "tag_parser"}
+        return index, path, [], warnings, (type(exc), args, state)
+
+    return index, path, blocks, warnings, None
+
+
+def _restore_block_extraction_error(
+    error: Union[Exception, Tuple[Type[CompilationError], Tuple[Any, ...], Dict[str, Any]]]
+) -> Exception:
+    if isinstance(error, Exception):
+        return error
+    exc_cls, args, state = error
+    exc = exc_cls.__new__(exc_cls)
+    exc.args = args
+    exc.__dict__.update(state)
+    return exc
+
+
+def extract_toplevel_blocks_batch(
+    items: Iterable[BlockExtractionItem],
+    collect_raw_data: bool = True,
+    lazy_contents: bool = False,
+    max_workers: Optional[int] = None,
+    chunksize: int = 16,
+) -> Iterator[BlockExtractionResult]:
+    """Extract the top-level blocks of many files in parallel.
+
+    Block extraction is pure python and holds the GIL, so the items are
+    spread across a pool of processes. Results are yielded in the same order
+    as the items, as soon as they are available.
+
+    :param items: Pairs of (source, allowed_blocks). A str source is the text
+        to extract blocks from; an os.PathLike source is a path to a utf-8
+        file to read the text from. allowed_blocks is as for
+        extract_toplevel_blocks().
+    :param collect_raw_data: As for extract_toplevel_blocks().
+    :param lazy_contents: As for extract_toplevel_blocks().
+    :param max_workers: The number of worker processes; defaults to the
+        number of CPUs. With a single worker, items are processed in this
+        process.
+    :param chunksize: The number of items sent to a worker at a time.
+    :return: An iterator of `BlockExtractionResult`s. Compilation errors, and
+        errors reading a path, are reported on the result of the item which
+        caused them, rather than raised, so that one bad file does not stop
+        the batch.
+    """
+    tasks = (
+        (
+            index,
+            os.fspath(source) if isinstance(source, os.PathLike) else None,
+            None if isinstance(source, os.PathLike) else source,
+            allowed_blocks,
+            collect_raw_data,
+            lazy_contents,
+            BLOCK_SCANNER,
+        )
+        for index, (source, allowed_blocks) in enumerate(items)
+    )
+
+    def to_result(task_result) -> BlockExtractionResult:
+        index, path, blocks, warnings, error = task_result
+        return BlockExtractionResult(
+            index=index,
+            path=path,
+            blocks=blocks,
+            warnings=warnings,
+            error=None if error is None else _restore_block_extraction_error(error),
+        )
+
+    if max_workers == 1:
+        for task in tasks:
+            yield to_result(_extract_blocks_worker(task))
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for task_result in executor.map(_extract_blocks_worker, tasks, chunksize=chunksize):
+            yield to_result(task_result)
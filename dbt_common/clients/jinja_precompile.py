@@ -0,0 +1,279 @@
+"""Ahead-of-time compilation of macros into an importable python package.
+
+Compiling macros dominates the startup time of short commands. Instead of
+compiling each macro when it is first called, a macro library can be compiled
+once into a package with one python module per macro, which later processes
+import. Imports of the package go through python's own machinery, so the
+interpreter caches their bytecode, and they show up in `python -X importtime`.
+
+    precompile_macros(macros, "/path/to/dbt_macros")
+    use_precompiled_macros("/path/to/dbt_macros")
+
+The package can also be written to, and imported from, a zip archive. It can
+be built from the macros in a set of files with:
+
+    python -m dbt_common.clients.jinja_precompile OUTPUT FILE [FILE ...]
+
+A package only contains code for the versions of dbt-common and jinja which
+wrote it, and is ignored by other versions.
+"""
+import argparse
+import dataclasses
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+import zipimport
+from types import ModuleType
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import jinja2
+
+from dbt_common.__about__ import version as dbt_common_version
+from dbt_common.clients._jinja_cache import content_digest
+from dbt_common.clients.jinja import (
+    BlockTag,
+    MacroProtocol,
+    catch_jinja,
+    extract_toplevel_blocks,
+    get_pooled_environment,
+    template_cache,
+)
+from dbt_common.exceptions import CompilationError, DbtInternalError
+
+# Bumped whenever the layout of generated packages changes.
+FORMAT_VERSION = 1
+
+# The blocks of a file which are compiled by the command line tool. These are
+# the blocks which get_environment() compiles into macros.
+MACRO_BLOCKS = {"macro", "materialization", "test"}
+
+
+def package_stamp() -> str:
+    """Identify the versions a precompiled package was written for."""
+    return content_digest(str(FORMAT_VERSION), dbt_common_version, jinja2.__version__)
+
+
+def _module_name(digest: str) -> str:
+    return f"m_{digest}"
+
+
+def _manifest_source(modules: Dict[str, str], names: Dict[str, str]) -> str:
+    lines = [
+        "# Generated by dbt_common.clients.jinja_precompile. Do not edit.",
+        f"STAMP = {package_stamp()!r}",
+        "TEMPLATES = {",
+    ]
+    for digest in sorted(modules):
+        lines.append(f"    {digest!r}: {modules[digest]!r},  # {names[digest]}")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def precompile_macros(
+    macros: Iterable[MacroProtocol],
+    path: str,
+    on_error: Optional[Callable[[MacroProtocol, CompilationError], None]] = None,
+) -> List[str]:
+    """Compile macros into a python package at path.
+
+    The package is written as a zip archive if path ends with '.zip', and as
+    a directory otherwise. Its name is the last component of path, without
+    the extension, and must be a valid python identifier. Any existing
+    package at path is replaced.
+
+    :param macros: The macros to compile. Macros with the same source are
+        only compiled once.
+    :param path: Where to write the package.
+    :param on_error: Called with each macro which fails to compile, and its
+        error, in which case the macro is left out of the package. If None,
+        the first error is raised.
+    :return: The digests of the compiled macro sources, as used by
+        TemplateCache.
+    """
+    package = _package_name(path)
+    env = get_pooled_environment()
+
+    sources: Dict[str, str] = {}
+    modules: Dict[str, str] = {}
+    names: Dict[str, str] = {}
+    for macro in macros:
+        digest = content_digest(macro.macro_sql)
+        if digest in modules:
+            continue
+        # This is the same compilation get_template() does, but returns the
+        # generated python source rather than a code object. As for jinja's
+        # own ModuleLoader, the environment is deferred until the template is
+        # loaded, as it isn't available when the module is imported.
+        try:
+            with catch_jinja(macro):
+                sources[digest] = env.compile(macro.macro_sql, raw=True, defer_init=True)
+        except CompilationError as exc:
+            if on_error is None:
+                raise
+            on_error(macro, exc)
+            continue
+        modules[digest] = _module_name(digest)
+        names[digest] = macro.name
+
+    files = {
+        f"{package}/__init__.py": _manifest_source(modules, names),
+        **{f"{package}/{modules[digest]}.py": source for digest, source in sources.items()},
+    }
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    # Write to a temporary location and move it into place, so that a
+    # process importing the package never sees a partially written one.
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=f".{package}.")
+    try:
+        if path.endswith(".zip"):
+            tmp_path = os.path.join(tmp_dir, "package.zip")
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name, contents in files.items():
+                    archive.writestr(name, contents)
+            os.replace(tmp_path, path)
+        else:
+            for name, contents in files.items():
+                os.makedirs(os.path.join(tmp_dir, os.path.dirname(name)), exist_ok=True)
+                with open(os.path.join(tmp_dir, name), "w", encoding="utf-8") as f:
+                    f.write(contents)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(os.path.join(tmp_dir, package), path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return sorted(modules)
+
+
+def _package_name(path: str) -> str:
+    package = os.path.basename(os.path.normpath(path))
+    if package.endswith(".zip"):
+        package = package[: -len(".zip")]
+    if not package.isidentifier():
+        raise DbtInternalError(
+            f"Cannot write precompiled macros to {path}: '{package}' is not a valid package name"
+        )
+    return package
+
+
+def _import_package(path: str) -> ModuleType:
+    package = _package_name(path)
+    location = os.path.abspath(path)
+    existing = sys.modules.get(package)
+    if existing is not None:
+        if getattr(existing, "__precompiled_path__", None) != location:
+            raise DbtInternalError(
+                f"Cannot import precompiled macros from {path}: a different module named "
+                f"'{package}' has already been imported"
+            )
+        return existing
+
+    spec: Optional[importlib.machinery.ModuleSpec]
+    if zipfile.is_zipfile(path):
+        spec = zipimport.zipimporter(path).find_spec(package)
+    else:
+        spec = importlib.util.spec_from_file_location(
+            package, os.path.join(path, "__init__.py"), submodule_search_locations=[path]
+        )
+    if spec is None or spec.loader is None:
+        raise DbtInternalError(f"No precompiled macros found at {path}")
+
+    module = importlib.util.module_from_spec(spec)
+    module.__precompiled_path__ = location  # type: ignore
+    sys.modules[package] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[package]
+        raise
+    return module
+
+
+class PrecompiledMacros:
+    """Templates for macros compiled by precompile_macros().
+
+    Each template's module is only imported when it is first requested. If the
+    package was written by other versions of dbt-common or jinja, it provides
+    no templates.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.package = _import_package(path)
+        self.is_current: bool = getattr(self.package, "STAMP", None) == package_stamp()
+        self.modules: Dict[str, str] = self.package.TEMPLATES if self.is_current else {}
+
+    def __len__(self) -> int:
+        return len(self.modules)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.modules
+
+    def get_template(self, digest: str) -> Optional[jinja2.Template]:
+        """Return a template for the macro source with the given digest, if there is one."""
+        module_name = self.modules.get(digest)
+        if module_name is None:
+            return None
+
+        module = importlib.import_module(f"{self.package.__name__}.{module_name}")
+        env = get_pooled_environment()
+        return env.template_class.from_module_dict(env, module.__dict__, env.make_globals({}))
+
+
+def use_precompiled_macros(path: Optional[str]) -> Optional[PrecompiledMacros]:
+    """Have the template cache use the macros precompiled at path, or none if None."""
+    precompiled = None if path is None else PrecompiledMacros(path)
+    template_cache.precompiled = precompiled
+    return precompiled
+
+
+@dataclasses.dataclass
+class _FileMacro:
+    name: str
+    macro_sql: str
+    original_file_path: str
+
+
+def _macros_from_files(paths: Sequence[str]) -> Iterable[_FileMacro]:
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        for block in extract_toplevel_blocks(
+            text, allowed_blocks=MACRO_BLOCKS, collect_raw_data=False
+        ):
+            if isinstance(block, BlockTag) and block.full_block is not None:
+                yield _FileMacro(block.block_name, block.full_block, path)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m dbt_common.clients.jinja_precompile",
+        description="Compile the macros in a set of files into an importable python package.",
+    )
+    parser.add_argument("output", help="The package directory, or zip archive, to write.")
+    parser.add_argument("files", nargs="+", help="The files containing the macros to compile.")
+    args = parser.parse_args(argv)
+
+    failed = 0
+
+    def report(macro: MacroProtocol, exc: CompilationError) -> None:
+        nonlocal failed
+        failed += 1
+        print(f"Skipping macro {macro.name}: {exc}", file=sys.stderr)
+
+    digests = precompile_macros(_macros_from_files(args.files), args.output, on_error=report)
+    print(f"Compiled {len(digests)} macros into {args.output}")
+    if failed:
+        print(f"{failed} macros failed to compile", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
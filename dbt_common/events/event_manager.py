@@ -1,16 +1,37 @@
 import os
 import traceback
 from collections import defaultdict
-from typing import Any, List, Optional, Protocol, Tuple, Union, DefaultDict, NamedTuple
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+    DefaultDict,
+    NamedTuple,
+)
 
 from dbt_common.events.base_types import (
     BaseEvent,
     EventLevel,
+    EventMsg,
     msg_from_base_event,
     TCallback,
     EventGroupType,
 )
-from dbt_common.events.logger import LoggerConfig, _Logger, _TextLogger, _JsonLogger, LineFormat
+from dbt_common.events.logger import (
+    LoggerConfig,
+    _Logger,
+    _TextLogger,
+    _JsonLogger,
+    LineFormat,
+    _log_level_map,
+    python_log_level,
+)
 from dbt_common.exceptions.events import EventCompilationError
 from dbt_common.helper_types import WarnErrorOptions, WarnErrorOptionsV2
 
@@ -22,6 +43,107 @@ class FireEventArgs(NamedTuple):
     force_warn_or_error_handling: bool
 
 
+# Higher than the python log level of any event.
+_NO_EVENTS = 1000
+
+
+class CallbackFilter(NamedTuple):
+    """The events a callback is called with. None means events of any level, or name."""
+
+    levels: Optional[FrozenSet[EventLevel]]
+    event_names: Optional[FrozenSet[str]]
+
+    def accepts(self, name: str, level: EventLevel) -> bool:
+        return (self.levels is None or level in self.levels) and (
+            self.event_names is None or name in self.event_names
+        )
+
+
+class _FilteredCallback:
+    """A callback added with add_callback() for only some events.
+
+    It is stored in EventManager.callbacks in place of the callback, and
+    compares equal to it, so the callback can still be found in, and removed
+    from, the list.
+    """
+
+    __slots__ = ("callback", "callback_filter")
+
+    def __init__(self, callback: TCallback, callback_filter: CallbackFilter) -> None:
+        self.callback = callback
+        self.callback_filter = callback_filter
+
+    def __call__(self, msg: EventMsg) -> None:
+        if self.callback_filter.accepts(msg.info.name, EventLevel(msg.info.level)):
+            self.callback(msg)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, _FilteredCallback):
+            return (self.callback, self.callback_filter) == (
+                other.callback,
+                other.callback_filter,
+            )
+        return self.callback == other
+
+    def __hash__(self) -> int:
+        return hash(self.callback)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.callback!r}, {self.callback_filter!r})"
+
+
+class _EventGate:
+    """The lowest levels at which any logger or callback wants an event.
+
+    Events below them are dropped before their EventMsg is built, as building
+    it is the most expensive part of firing an event.
+    """
+
+    def __init__(self, loggers: List[_Logger], callbacks: List[TCallback]) -> None:
+        # The loggers and callbacks the gate was built for. Holding them,
+        # rather than their ids, means their ids can't be reused by others.
+        self.loggers = tuple(loggers)
+        self.callbacks = tuple(callbacks)
+        # The python log level above which a logger writes events.
+        self.logger_level = min(
+            (getattr(logger, "min_log_level", 0) for logger in loggers), default=_NO_EVENTS
+        )
+        # The python log level above which a callback wants events of any name.
+        self.callback_level = _NO_EVENTS
+        # The levels above which callbacks want events with specific names.
+        self.named_levels: Dict[str, int] = {}
+        for callback in callbacks:
+            if not isinstance(callback, _FilteredCallback):
+                self.callback_level = 0
+                break
+            callback_filter = callback.callback_filter
+            level = (
+                0
+                if callback_filter.levels is None
+                else min(_log_level_map[level] for level in callback_filter.levels)
+            )
+            if callback_filter.event_names is None:
+                self.callback_level = min(self.callback_level, level)
+            else:
+                for name in callback_filter.event_names:
+                    self.named_levels[name] = min(self.named_levels.get(name, _NO_EVENTS), level)
+
+    def is_for(self, loggers: List[_Logger], callbacks: List[TCallback]) -> bool:
+        return _same_entries(self.loggers, loggers) and _same_entries(self.callbacks, callbacks)
+
+    def allows(self, name: str, level: EventLevel) -> bool:
+        if python_log_level(name, level) >= self.logger_level:
+            return True
+        log_level = _log_level_map[level]
+        return log_level >= self.callback_level or log_level >= self.named_levels.get(
+            name, _NO_EVENTS
+        )
+
+
+def _same_entries(entries: Tuple[Any, ...], current: List[Any]) -> bool:
+    return len(entries) == len(current) and all(a is b for a, b in zip(entries, current))
+
+
 class EventManager:
     def __init__(self) -> None:
         self.loggers: List[_Logger] = []
@@ -33,6 +155,7 @@ class EventManager:
         ] = defaultdict(list)
         self.require_warn_or_error_handling: bool = False
         self.allow_deferral: bool = False
+        self._gate: Optional[_EventGate] = None
 
     @property
     def warn_error(self) -> bool:
@@ -71,10 +194,10 @@ class EventManager:
         node: Any = None,
         force_warn_or_error_handling: bool = False,
     ) -> None:
-        msg = msg_from_base_event(e, level=level)
+        event_level = level or e.level_tag()
 
         if force_warn_or_error_handling or (
-            self.require_warn_or_error_handling and msg.info.level == "warn"
+            self.require_warn_or_error_handling and event_level == EventLevel.WARN
         ):
             if self.warn_error or self.warn_error_options.errors(e):
                 # This has the potential to create an infinite loop if the handling of the raised
@@ -84,7 +207,15 @@ class EventManager:
                 # Return early if the event is silenced
                 return
 
-        if os.environ.get("DBT_TEST_BINARY_SERIALIZATION"):
+        binary_serialization = os.environ.get("DBT_TEST_BINARY_SERIALIZATION")
+        if not binary_serialization and not self._event_gate().allows(
+            type(e).__name__, event_level
+        ):
+            return
+
+        msg = msg_from_base_event(e, level=level)
+
+        if binary_serialization:
             print(f"--- {msg.info.name}")
             try:
                 msg.SerializeToString()
@@ -101,14 +232,43 @@ class EventManager:
         for callback in self.callbacks:
             callback(msg)
 
+    def _event_gate(self) -> _EventGate:
+        # The loggers and callbacks are public lists, which are also changed
+        # directly, so the gate is rebuilt whenever their entries change.
+        gate = self._gate
+        if gate is None or not gate.is_for(self.loggers, self.callbacks):
+            gate = self._gate = _EventGate(self.loggers, self.callbacks)
+        return gate
+
     def add_logger(self, config: LoggerConfig) -> None:
         logger = (
             _JsonLogger(config) if config.line_format == LineFormat.Json else _TextLogger(config)
         )
         self.loggers.append(logger)
+        self._gate = None
 
-    def add_callback(self, callback: TCallback) -> None:
+    def add_callback(
+        self,
+        callback: TCallback,
+        levels: Optional[Collection[EventLevel]] = None,
+        event_names: Optional[Collection[str]] = None,
+    ) -> None:
+        """Call callback with the events fired.
+
+        :param levels: If given, only call callback with events of these levels.
+        :param event_names: If given, only call callback with events of these
+            names, such as "MainReportVersion".
+        """
+        if levels is not None or event_names is not None:
+            callback = _FilteredCallback(
+                callback,
+                CallbackFilter(
+                    levels=None if levels is None else frozenset(levels),
+                    event_names=None if event_names is None else frozenset(event_names),
+                ),
+            )
         self.callbacks.append(callback)
+        self._gate = None
 
     def flush(self) -> None:
         for logger in self.loggers:
@@ -189,7 +349,12 @@ class IEventManager(Protocol):
     def add_logger(self, config: LoggerConfig) -> None:
         ...
 
-    def add_callback(self, callback: TCallback) -> None:
+    def add_callback(
+        self,
+        callback: TCallback,
+        levels: Optional[Collection[EventLevel]] = None,
+        event_names: Optional[Collection[str]] = None,
+    ) -> None:
         ...
 
 
@@ -230,5 +395,10 @@ class TestEventManager(IEventManager):
     def add_logger(self, config: LoggerConfig) -> None:
         raise NotImplementedError()
 
-    def add_callback(self, callback: TCallback) -> None:
+    def add_callback(
+        self,
+        callback: TCallback,
+        levels: Optional[Collection[EventLevel]] = None,
+        event_names: Optional[Collection[str]] = None,
+    ) -> None:
         raise NotImplementedError()
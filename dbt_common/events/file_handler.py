@@ -0,0 +1,159 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import IO, List, Optional
+
+
+class BufferedRotatingFileHandler(logging.Handler):
+    """A logging handler which buffers lines and writes them to a rotating file.
+
+    Lines are held in memory until buffer_size bytes are pending, or
+    flush_interval seconds have passed since the first pending line, or the
+    handler is flushed or closed. Lines which are due are written by a single
+    flusher thread, started with the first line. The file is rotated like a
+    RotatingFileHandler's, into backup_count numbered backups, once writing a
+    line would take it to max_bytes. The size of the file is tracked from
+    the bytes written to it, rather than by checking the file for each line.
+
+    Records are written as their message alone, as dbt's loggers format
+    their lines themselves.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: Optional[int] = None,
+        backup_count: int = 0,
+        encoding: str = "utf8",
+        buffer_size: int = 256 * 1024,
+        flush_interval: Optional[float] = 1.0,
+    ) -> None:
+        super().__init__()
+        self.baseFilename = os.path.abspath(filename)
+        self.max_bytes = max_bytes or 0
+        self.backup_count = backup_count
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+
+        self._stream: Optional[IO[bytes]] = None
+        self._rotate = False
+        self._file_size = 0
+        self._pending: List[bytes] = []
+        self._pending_size = 0
+        # When the oldest pending line was buffered, by time.monotonic().
+        self._pending_since: Optional[float] = None
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        # Wakes the flusher when lines are buffered, or the handler is closed.
+        self._wakeup = threading.Condition(self.lock)
+
+    def _open(self) -> IO[bytes]:
+        if self._stream is None:
+            self._stream = open(self.baseFilename, "ab")
+            self._file_size = self._stream.tell()
+            # Like RotatingFileHandler, only rotate if there are backups to
+            # rotate into, and never rotate special files such as /dev/null
+            self._rotate = (
+                self.max_bytes > 0 and self.backup_count > 0 and os.path.isfile(self.baseFilename)
+            )
+        return self._stream
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            data = (record.getMessage() + "\n").encode(self.encoding)
+            stream = self._open()
+
+            if self._rotate and self._file_size + self._pending_size + len(data) >= self.max_bytes:
+                self._write_pending(stream)
+                if self._file_size > 0:
+                    self._do_rollover()
+
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= self.buffer_size:
+                self._write_pending(self._open())
+            elif self._pending_since is None and self.flush_interval is not None:
+                self._pending_since = time.monotonic()
+                self._wake_flusher()
+        except Exception:
+            self.handleError(record)
+
+    def _wake_flusher(self) -> None:
+        with self._wakeup:
+            # The thread is also restarted in a forked child, which has none.
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._run_flusher, name="dbt-log-flusher", daemon=True
+                )
+                self._flusher.start()
+            else:
+                self._wakeup.notify()
+
+    def _run_flusher(self) -> None:
+        with self._wakeup:
+            while not self._closed:
+                if self._pending_since is None or self.flush_interval is None:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._pending_since + self.flush_interval - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                try:
+                    self._write_pending(self._open())
+                except Exception:
+                    # As Handler.handleError() does, without a record to report.
+                    self._pending_since = None
+                    if logging.raiseExceptions:
+                        traceback.print_exc(file=sys.stderr)
+
+    def _write_pending(self, stream: IO[bytes]) -> None:
+        if self._pending:
+            data = b"".join(self._pending)
+            self._pending.clear()
+            self._pending_size = 0
+            stream.write(data)
+            stream.flush()
+            self._file_size += len(data)
+        self._pending_since = None
+
+    def _do_rollover(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.baseFilename}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.baseFilename}.{i + 1}")
+        os.replace(self.baseFilename, f"{self.baseFilename}.1")
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self._pending:
+                self._write_pending(self._open())
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            try:
+                if self._pending:
+                    self._write_pending(self._open())
+            finally:
+                self._closed = True
+                self._wakeup.notify_all()
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+                super().close()
+        finally:
+            self.release()
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.baseFilename} ({logging.getLevelName(self.level)})>"
@@ -0,0 +1,244 @@
+"""Serialization of event messages straight to JSON.
+
+The JSON logger's lines were made by converting each message to a dict with
+protobuf's MessageToDict() and then dumping it with json.dumps(). This module
+writes the same JSON, byte for byte, directly from the message: each message
+type's fields are looked up in its descriptor once, and compiled into a plan
+of writers, already in the sorted order json.dumps(sort_keys=True) produces.
+"""
+import base64
+import json
+import math
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.internal import type_checkers
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message
+
+from dbt_common.events.base_types import _is_repeated
+from dbt_common.utils.encoding import ForgivingJSONEncoder
+
+Writer = Callable[[Any], str]
+
+# For each field of a message, in the order they are written: the field's
+# name, the JSON written before its value, whether it is only written when
+# set, and the writer for its value.
+_Plan = List[Tuple[str, str, bool, Writer]]
+
+_PLANS: Dict[Descriptor, _Plan] = {}
+
+_INT64_TYPES = {
+    FieldDescriptor.CPPTYPE_INT64,
+    FieldDescriptor.CPPTYPE_UINT64,
+}
+_INT32_TYPES = {
+    FieldDescriptor.CPPTYPE_INT32,
+    FieldDescriptor.CPPTYPE_UINT32,
+}
+
+# The JSON for a dict or list, as json.dumps() writes it by default.
+_ITEM_SEPARATOR = ", "
+_KEY_SEPARATOR = ": "
+
+
+def _message_to_dict(message: Message) -> Any:
+    return MessageToDict(
+        message,
+        preserving_proto_field_name=True,
+        always_print_fields_with_no_presence=True,
+    )
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, cls=ForgivingJSONEncoder)
+
+
+def _is_map(field: FieldDescriptor) -> bool:
+    return field.message_type is not None and field.message_type.GetOptions().map_entry
+
+
+def _write_float(value: float) -> str:
+    if math.isinf(value):
+        return '"-Infinity"' if value < 0.0 else '"Infinity"'
+    if math.isnan(value):
+        return '"NaN"'
+    return float.__repr__(value)
+
+
+def _write_short_float(value: float) -> str:
+    if math.isinf(value) or math.isnan(value):
+        return _write_float(value)
+    return float.__repr__(type_checkers.ToShortestFloat(value))
+
+
+def _write_bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
+def _write_bytes(value: bytes) -> str:
+    return encode_basestring_ascii(base64.b64encode(value).decode("utf-8"))
+
+
+def _write_int64(value: int) -> str:
+    return f'"{value}"'
+
+
+def _write_timestamp(value: Message) -> str:
+    return encode_basestring_ascii(value.ToJsonString())  # type: ignore[attr-defined]
+
+
+def _write_converted(value: Message) -> str:
+    # Other well known types, such as Struct and Duration, have their own
+    # JSON forms, so are left to MessageToDict().
+    return _dumps(_message_to_dict(value))
+
+
+def _enum_writer(field: FieldDescriptor) -> Writer:
+    enum_type = field.enum_type
+    if enum_type.full_name == "google.protobuf.NullValue":
+        return lambda value: "null"
+    names = {
+        number: encode_basestring_ascii(v.name) for number, v in enum_type.values_by_number.items()
+    }
+
+    def write_enum(value: int) -> str:
+        name = names.get(value)
+        if name is not None:
+            return name
+        if enum_type.is_closed:
+            raise ValueError(f"{value} is not a value of {enum_type.full_name}")
+        return int.__repr__(value)
+
+    return write_enum
+
+
+def _message_writer(descriptor: Descriptor) -> Writer:
+    if descriptor.full_name == "google.protobuf.Timestamp":
+        return _write_timestamp
+    if descriptor.full_name.startswith("google.protobuf."):
+        return _write_converted
+    return write_message
+
+
+def _value_writer(field: FieldDescriptor) -> Writer:
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return _message_writer(field.message_type)
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return _enum_writer(field)
+    if cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        if field.type == FieldDescriptor.TYPE_BYTES:
+            return _write_bytes
+        return encode_basestring_ascii
+    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+        return _write_bool
+    if cpp_type in _INT64_TYPES:
+        return _write_int64
+    if cpp_type in _INT32_TYPES:
+        return int.__repr__
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return _write_short_float
+    return _write_float
+
+
+def _map_key(key: Any) -> str:
+    if isinstance(key, bool):
+        return "true" if key else "false"
+    return str(key)
+
+
+def _field_writer(field: FieldDescriptor) -> Writer:
+    if _is_map(field):
+        write_value = _value_writer(field.message_type.fields_by_name["value"])
+
+        def write_map(value: Any) -> str:
+            if not value:
+                return "{}"
+            items = sorted((_map_key(key), item) for key, item in value.items())
+            return (
+                "{"
+                + _ITEM_SEPARATOR.join(
+                    f"{encode_basestring_ascii(key)}{_KEY_SEPARATOR}{write_value(item)}"
+                    for key, item in items
+                )
+                + "}"
+            )
+
+        return write_map
+
+    write_item = _value_writer(field)
+    if _is_repeated(field):
+
+        def write_list(value: Any) -> str:
+            if not value:
+                return "[]"
+            return "[" + _ITEM_SEPARATOR.join(write_item(item) for item in value) + "]"
+
+        return write_list
+    return write_item
+
+
+def _plan(descriptor: Descriptor) -> _Plan:
+    plan = _PLANS.get(descriptor)
+    if plan is None:
+        plan = [
+            (
+                field.name,
+                encode_basestring_ascii(field.name) + _KEY_SEPARATOR,
+                # Fields with presence are only written when they are set,
+                # as with always_print_fields_with_no_presence.
+                field.has_presence,
+                _field_writer(field),
+            )
+            for field in sorted(descriptor.fields, key=lambda field: field.name)
+        ]
+        _PLANS[descriptor] = plan
+    return plan
+
+
+def write_message(message: Message, skip: Optional[Callable[[str, Any], bool]] = None) -> str:
+    """Return the JSON for message, as json.dumps(MessageToDict(message), sort_keys=True) would.
+
+    MessageToDict() is called with preserving_proto_field_name and
+    always_print_fields_with_no_presence. If skip is given, fields for
+    which skip(name, value) is true are left out.
+    """
+    parts = []
+    for name, key, has_presence, writer in _plan(message.DESCRIPTOR):
+        if has_presence and not message.HasField(name):
+            continue
+        value = getattr(message, name)
+        if skip is not None and skip(name, value):
+            continue
+        parts.append(key + writer(value))
+    return "{" + _ITEM_SEPARATOR.join(parts) + "}"
+
+
+def _skip_empty_node_info(name: str, value: Any) -> bool:
+    # We don't want an empty NodeInfo in output, see msg_to_dict()
+    return name == "node_info" and getattr(value, "node_name", None) == ""
+
+
+def msg_to_json_line(msg: Any) -> str:
+    """Return the JSON for an EventMsg, the same as msg_to_json() without the conversion to a dict.
+
+    Messages which can't be written directly, such as ones with enum values
+    MessageToDict() rejects, are converted by msg_to_json().
+    """
+    try:
+        parts = []
+        for name, key, has_presence, writer in _plan(msg.DESCRIPTOR):
+            if has_presence and not msg.HasField(name):
+                continue
+            value = getattr(msg, name)
+            if name == "data" and isinstance(value, Message):
+                parts.append(key + write_message(value, _skip_empty_node_info))
+            else:
+                parts.append(key + writer(value))
+        return "{" + _ITEM_SEPARATOR.join(parts) + "}"
+    except Exception:
+        from dbt_common.events.functions import msg_to_json
+
+        return msg_to_json(msg)
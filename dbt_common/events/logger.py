@@ -1,17 +1,22 @@
-import json
+import atexit
 import logging
+import os
+import queue
+import sys
 import threading
+import traceback
+import weakref
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum
-from logging.handlers import RotatingFileHandler
-from typing import Optional, TextIO, Any, Callable
+from typing import Optional, TextIO, Any, Callable, List
 
 from colorama import Style
 
 from dbt_common.events.base_types import EventLevel, EventMsg
+from dbt_common.events.file_handler import BufferedRotatingFileHandler
+from dbt_common.events.json_serializer import msg_to_json_line
 from dbt_common.events.format import timestamp_to_datetime_string
-from dbt_common.utils.encoding import ForgivingJSONEncoder
 
 PRINT_EVENT_NAMES = ("PrintEvent", "ShowNode", "CompiledNode")
 
@@ -45,6 +50,17 @@ class LineFormat(Enum):
     Json = 3
 
 
+# What a logger writing in the background does with events fired while its
+# queue is full.
+class OverflowPolicy(Enum):
+    # Wait for the writer to make room
+    Block = 1
+    # Drop the event being fired
+    DropNewest = 2
+    # Drop the oldest event in the queue
+    DropOldest = 3
+
+
 # Map from dbt event levels to python log levels
 _log_level_map = {
     EventLevel.DEBUG: 10,
@@ -55,6 +71,14 @@ _log_level_map = {
 }
 
 
+# The python log level events are written at by loggers, for each event level.
+# Print events are always written at the error level, see _Logger.write_line().
+def python_log_level(name: str, level: EventLevel) -> int:
+    if name in PRINT_EVENT_NAMES:
+        return _log_level_map[EventLevel.ERROR]
+    return _log_level_map[level]
+
+
 # We need this function for now because the numeric log severity levels in
 # Python do not match those for logbook, so we have to explicitly call the
 # correct function by name.
@@ -87,7 +111,16 @@ class LoggerConfig:
     output_stream: Optional[TextIO] = None
     output_file_name: Optional[str] = None
     output_file_max_bytes: Optional[int] = 10 * 1024 * 1024  # 10 mb
+    # Lines are written to the file once this many bytes are buffered, or the
+    # first buffered line is this many seconds old, or the logger is flushed.
+    output_file_buffer_size: int = 256 * 1024  # 256 kb
+    output_file_flush_interval: Optional[float] = 1.0
     logger: Optional[Any] = None
+    # If set, events are queued by the threads firing them, and formatted and
+    # written by a background thread.
+    async_write: bool = False
+    async_queue_size: int = 10000
+    async_overflow: OverflowPolicy = OverflowPolicy.Block
 
 
 class _Logger:
@@ -98,24 +131,49 @@ class _Logger:
         self.level: EventLevel = config.level
         self.invocation_id: Optional[str] = config.invocation_id
         self._python_logger: Optional[logging.Logger] = config.logger
+        self._writer: Optional[_AsyncWriter] = None
 
         if config.output_stream is not None:
             stream_handler = logging.StreamHandler(config.output_stream)
             self._python_logger = self._get_python_log_for_handler(stream_handler)
 
         if config.output_file_name:
-            file_handler = RotatingFileHandler(
+            file_handler = BufferedRotatingFileHandler(
                 filename=str(config.output_file_name),
                 encoding="utf8",
-                maxBytes=config.output_file_max_bytes,  # type: ignore
-                backupCount=5,
+                max_bytes=config.output_file_max_bytes,
+                backup_count=5,
+                buffer_size=config.output_file_buffer_size,
+                flush_interval=config.output_file_flush_interval,
             )
             self._python_logger = self._get_python_log_for_handler(file_handler)
 
+        # The lowest python log level this logger writes, which lets the event
+        # manager skip events no logger will write. A python logger passed in
+        # the config has its own level, which may change, so isn't gated.
+        self.min_log_level: int
+        if self._python_logger is None:
+            self.min_log_level = logging.CRITICAL + 1
+        elif self._python_logger is config.logger:
+            self.min_log_level = logging.NOTSET
+        else:
+            self.min_log_level = _log_level_map[self.level]
+
+        # Lines are only joined into one record for the handlers set up here,
+        # as a python logger passed in the config may have its own handlers
+        # and filters, which expect a record per event.
+        self._join_lines: bool = self._python_logger is not config.logger
+
+        if config.async_write and self._python_logger is not None:
+            self._writer = _AsyncWriter(self, config.async_queue_size, config.async_overflow)
+
     def _get_python_log_for_handler(self, handler: logging.Handler):
         log = logging.getLogger(self.name)
         log.setLevel(_log_level_map[self.level])
         handler.setFormatter(logging.Formatter(fmt="%(message)s"))
+        # Handlers may buffer lines, which would be lost with them
+        for old_handler in log.handlers:
+            old_handler.flush()
         log.handlers.clear()
         log.propagate = False
         log.addHandler(handler)
@@ -125,18 +183,47 @@ class _Logger:
         raise NotImplementedError()
 
     def write_line(self, msg: EventMsg):
+        if self._writer is not None:
+            self._writer.put(msg)
+            return
+
         line = self.create_line(msg)
         if self._python_logger is not None:
-            # We send PrintEvent to logger as error so it goes to stdout
-            # when --quiet flag is set.
-            # --quiet flag will filter out all events lower than ERROR.
-            if _is_print_event(msg):
-                level = "error"
-            else:
-                level = msg.info.level
-            send_to_logger(self._python_logger, level, line)
+            send_to_logger(self._python_logger, self._line_level(msg), line)
+
+    def _line_level(self, msg: EventMsg) -> str:
+        # We send PrintEvent to logger as error so it goes to stdout
+        # when --quiet flag is set.
+        # --quiet flag will filter out all events lower than ERROR.
+        if _is_print_event(msg):
+            return "error"
+        return msg.info.level
+
+    def _write_batch(self, msgs: List[EventMsg]) -> None:
+        if not self._join_lines:
+            for msg in msgs:
+                send_to_logger(
+                    self._python_logger, self._line_level(msg), self.create_line(msg)  # type: ignore
+                )
+            return
+
+        # Consecutive lines of the same level are written as a single record,
+        # so the handler's lock is taken once for them.
+        lines: List[str] = []
+        level: Optional[str] = None
+        for msg in msgs:
+            msg_level = self._line_level(msg)
+            if lines and msg_level != level:
+                send_to_logger(self._python_logger, level, "\n".join(lines))  # type: ignore
+                lines = []
+            level = msg_level
+            lines.append(self.create_line(msg))
+        if lines:
+            send_to_logger(self._python_logger, level, "\n".join(lines))  # type: ignore
 
     def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
         if self._python_logger is not None:
             for handler in self._python_logger.handlers:
                 handler.flush()
@@ -156,7 +243,11 @@ class _TextLogger(_Logger):
         if _is_print_event(msg):
             # PrintEvent is a special case, we don't want to add a timestamp
             return scrubbed_msg
-        ts: str = datetime.now(timezone.utc).replace(tzinfo=None).strftime("%H:%M:%S")
+        # Lines may be written after the event was fired, so use its time
+        if msg.info.HasField("ts"):
+            ts: str = msg.info.ts.ToDatetime().strftime("%H:%M:%S")
+        else:
+            ts = datetime.now(timezone.utc).replace(tzinfo=None).strftime("%H:%M:%S")
         return f"{self._get_color_tag()}{ts}  {scrubbed_msg}"
 
     def create_debug_line(self, msg: EventMsg) -> str:
@@ -170,17 +261,19 @@ class _TextLogger(_Logger):
         scrubbed_msg: str = self.scrubber(msg.info.msg)  # type: ignore
         level = msg.info.level
         log_line += (
-            f"{self._get_color_tag()}{ts} [{level:<5}]{self._get_thread_name()} {scrubbed_msg}"
+            f"{self._get_color_tag()}{ts} [{level:<5}]{self._get_thread_name(msg)} {scrubbed_msg}"
         )
         return log_line
 
     def _get_color_tag(self) -> str:
         return "" if not self.use_colors else Style.RESET_ALL
 
-    def _get_thread_name(self) -> str:
+    def _get_thread_name(self, msg: EventMsg) -> str:
         thread_name = ""
-        if threading.current_thread().name:
-            thread_name = threading.current_thread().name
+        # The thread which fired the event, which may not be the one writing it
+        name = msg.info.thread or threading.current_thread().name
+        if name:
+            thread_name = name
             thread_name = thread_name[:10]
             thread_name = thread_name.ljust(10, " ")
             thread_name = f" [{thread_name}]:"
@@ -189,9 +282,117 @@ class _TextLogger(_Logger):
 
 class _JsonLogger(_Logger):
     def create_line(self, msg: EventMsg) -> str:
-        from dbt_common.events.functions import msg_to_dict
-
-        msg_dict = msg_to_dict(msg)
-        raw_log_line = json.dumps(msg_dict, sort_keys=True, cls=ForgivingJSONEncoder)
+        raw_log_line = msg_to_json_line(msg)
         line = self.scrubber(raw_log_line)  # type: ignore
         return line
+
+
+# Every writer, so that they can be reset in forked children.
+_ASYNC_WRITERS: "weakref.WeakSet[_AsyncWriter]" = weakref.WeakSet()
+
+
+def _reset_async_writers_after_fork() -> None:
+    for writer in list(_ASYNC_WRITERS):
+        writer._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_async_writers_after_fork)
+
+
+class _AsyncWriter:
+    """Formats and writes the lines of a logger on a background thread.
+
+    Events are queued by the threads firing them, so those threads never wait
+    on formatting or I/O, unless the queue is full and the overflow policy is
+    to block. The thread is started when the first event is queued.
+    """
+
+    # The most events formatted and written at once.
+    batch_size = 256
+
+    def __init__(self, logger: _Logger, queue_size: int, overflow: OverflowPolicy) -> None:
+        self.logger = logger
+        self.overflow = overflow
+        self.dropped = 0
+        self._queue_size = max(queue_size, 1)
+        self._queue: "queue.Queue[EventMsg]" = queue.Queue(maxsize=self._queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._flush_at_exit = False
+        _ASYNC_WRITERS.add(self)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"{self.logger.name}-writer", daemon=True
+                )
+                self._thread.start()
+                if not self._flush_at_exit:
+                    atexit.register(self.flush)
+                    self._flush_at_exit = True
+
+    def _reset_after_fork(self) -> None:
+        # A forked child has no writer thread, and its copies of the queue
+        # and lock may be in any state, so it starts again with new ones.
+        # The events queued before the fork are the parent's to write.
+        self._queue = queue.Queue(maxsize=self._queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, msg: EventMsg) -> None:
+        if self._thread is None:
+            self._start()
+        elif threading.current_thread() is self._thread:
+            # An event fired while writing, which can't wait for the queue.
+            self.logger._write_batch([msg])
+            return
+
+        if self.overflow == OverflowPolicy.Block:
+            self._queue.put(msg)
+        elif self.overflow == OverflowPolicy.DropNewest:
+            try:
+                self._queue.put_nowait(msg)
+            except queue.Full:
+                self._count_dropped()
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(msg)
+                    return
+                except queue.Full:
+                    pass
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self._queue.task_done()
+                self._count_dropped()
+
+    def _count_dropped(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.logger._write_batch(batch)
+            except Exception:
+                # There is nowhere to raise to, so report the error and keep
+                # writing later events.
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """Wait until every queued event has been written."""
+        if self._thread is not None:
+            self._queue.join()
@@ -0,0 +1,46 @@
+"""Benchmark rendering templates with capture_macros.
+
+Compares the shared CaptureUndefined type against building an undefined type
+(and an environment overlay to hold it) for every template, as was done
+before it existed.
+
+Run with: python -m tests.benchmarks.bench_capture_undefined
+"""
+import timeit
+
+from dbt_common.clients.jinja import CaptureUndefined, get_pooled_environment, get_template
+
+TEMPLATE = "select {{ missing_macro() }}, {{ config.get('x') }} from {{ ref('model') }}"
+NUMBER = 5000
+
+
+class FakeNode:
+    name = "my_model"
+
+
+def render_per_node_type(node: FakeNode) -> None:
+    env = get_pooled_environment(capture_macros=True)
+    undefined = type("Undefined", (CaptureUndefined,), {"node_name": node.name})
+    env = env.overlay(undefined=undefined)
+    env.from_string(TEMPLATE, globals={}).render({})
+
+
+def render_shared_type(node: FakeNode) -> None:
+    get_template(TEMPLATE, {}, node=node, capture_macros=True).render({})
+
+
+def main() -> None:
+    node = FakeNode()
+    results = {}
+    for func in (render_per_node_type, render_shared_type):
+        func(node)
+        best = min(timeit.repeat(lambda: func(node), number=NUMBER, repeat=5))
+        results[func.__name__] = best / NUMBER * 1e6
+        print(f"{func.__name__:<24}{results[func.__name__]:8.1f} us/call")
+
+    saved = results["render_per_node_type"] - results["render_shared_type"]
+    print(f"{'saved':<24}{saved:8.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
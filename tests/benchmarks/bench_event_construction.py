@@ -0,0 +1,72 @@
+"""Benchmark building events and their EventMsg.
+
+Compares constructing event payloads and EventInfo with ParseDict(), as was
+done before message_from_dict() and the direct EventInfo construction in
+msg_from_base_event(), against the current path.
+
+Run with: python -m tests.benchmarks.bench_event_construction
+"""
+import timeit
+
+from google.protobuf.json_format import ParseDict
+
+from dbt_common.events.base_types import (
+    get_global_metadata_vars,
+    get_pid,
+    get_thread_name,
+    msg_from_base_event,
+)
+from dbt_common.events.helpers import get_json_string_utcnow
+from dbt_common.events.types import Note, RetryExternalCall
+from dbt_common.events import types_pb2
+from dbt_common.invocation import get_invocation_id
+
+NUMBER = 20000
+
+
+def parse_dict_event(event_cls: type, **kwargs) -> None:  # type: ignore[no-untyped-def]
+    class_name = event_cls.__name__
+    pb_msg = ParseDict(kwargs, getattr(types_pb2, class_name)())
+    event = event_cls.__new__(event_cls)
+    event.pb_msg = pb_msg
+    event_info = {
+        "level": event.level_tag().value,
+        "msg": event.message(),
+        "invocation_id": get_invocation_id(),
+        "extra": get_global_metadata_vars(),
+        "ts": get_json_string_utcnow(),
+        "pid": get_pid(),
+        "thread": get_thread_name(),
+        "code": event.code(),
+        "name": class_name,
+    }
+    msg = ParseDict({"info": event_info}, getattr(types_pb2, f"{class_name}Msg")())
+    msg.data.CopyFrom(pb_msg)
+
+
+def direct_event(event_cls: type, **kwargs) -> None:  # type: ignore[no-untyped-def]
+    msg_from_base_event(event_cls(**kwargs))
+
+
+CASES = [
+    (RetryExternalCall, {"attempt": 3, "max": 5}),
+    (Note, {"msg": "A note about something which happened."}),
+]
+
+
+def main() -> None:
+    for event_cls, kwargs in CASES:
+        rates = {}
+        for func in (parse_dict_event, direct_event):
+            func(event_cls, **kwargs)
+            best = min(timeit.repeat(lambda: func(event_cls, **kwargs), number=NUMBER, repeat=5))
+            rates[func.__name__] = NUMBER / best
+            print(
+                f"{event_cls.__name__:<20}{func.__name__:<20}{rates[func.__name__]:>10.0f} events/s"
+            )
+        speedup = rates["direct_event"] / rates["parse_dict_event"]
+        print(f"{event_cls.__name__:<20}{'speedup':<20}{speedup:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
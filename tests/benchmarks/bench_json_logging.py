@@ -0,0 +1,33 @@
+"""Benchmark serializing events for the JSON logger.
+
+Compares converting the message to a dict with MessageToDict() and dumping
+it with json.dumps(), as msg_to_json() does and the JSON logger did before,
+against msg_to_json_line().
+
+Run with: python -m tests.benchmarks.bench_json_logging
+"""
+import timeit
+
+from dbt_common.events.base_types import msg_from_base_event
+from dbt_common.events.functions import msg_to_json
+from dbt_common.events.json_serializer import msg_to_json_line
+from dbt_common.events.types import Note, RetryExternalCall
+
+NUMBER = 20000
+
+
+def main() -> None:
+    for event in (RetryExternalCall(attempt=3, max=5), Note(msg="A note about a model.")):
+        msg = msg_from_base_event(event)
+        assert msg_to_json_line(msg) == msg_to_json(msg)
+        results = {}
+        for func in (msg_to_json, msg_to_json_line):
+            best = min(timeit.repeat(lambda: func(msg), number=NUMBER, repeat=5))
+            results[func.__name__] = best / NUMBER * 1e6
+            print(f"{type(event).__name__:<20}{func.__name__:<20}{results[func.__name__]:8.2f} us")
+        speedup = results["msg_to_json"] / results["msg_to_json_line"]
+        print(f"{type(event).__name__:<20}{'speedup':<20}{speedup:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark compiling the same macros from many threads at once.
+
+Compares the single-flight TemplateCache against a cache which checks for a
+template, compiles it and inserts it without coordinating threads, as
+TemplateCache did before. Each run starts with an empty cache, as at the
+start of an invocation, and every thread requests every macro.
+
+Run with: python -m tests.benchmarks.bench_template_cache
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List
+
+import jinja2
+
+import dbt_common.clients.jinja
+from dbt_common.clients._jinja_cache import content_digest
+from dbt_common.clients.jinja import TemplateCache, _estimate_template_size
+
+MACROS = 100
+THREADS = (1, 4, 16)
+REPEAT = 2
+
+
+@dataclass
+class FakeMacro:
+    name: str
+    macro_sql: str
+
+
+class UncoordinatedTemplateCache(TemplateCache):
+    def get_node_template(self, node) -> jinja2.Template:  # type: ignore[no-untyped-def]
+        key = content_digest(node.macro_sql)
+        template = self.file_cache.get(key)
+        if template is None:
+            template = dbt_common.clients.jinja.get_template(
+                string=node.macro_sql, ctx={}, node=node
+            )
+            self.file_cache.put(key, template, _estimate_template_size(node.macro_sql))
+        return template
+
+
+def make_macros() -> List[FakeMacro]:
+    body = " ".join(f"{{% if x == {j} %}}{{{{ y[{j}] }}}}{{% endif %}}" for j in range(20))
+    return [
+        FakeMacro(f"m{i}", f"{{% macro m{i}(x, y) %}}select {i} {body}{{% endmacro %}}")
+        for i in range(MACROS)
+    ]
+
+
+def run(cache_type: type, macros: List[FakeMacro], threads: int) -> float:
+    cache = cache_type()
+    barrier = threading.Barrier(threads)
+
+    def work(thread: int) -> None:
+        barrier.wait()
+        for i in range(len(macros)):
+            # Start each thread at a different macro, as threads running
+            # different nodes would.
+            cache.get_node_template(macros[(i + thread * 7) % len(macros)])
+
+    with ThreadPoolExecutor(threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(work, range(threads)))
+        return time.perf_counter() - start
+
+
+def count_compilations(cache_type: type, macros: List[FakeMacro], threads: int) -> int:
+    calls = 0
+    lock = threading.Lock()
+    original = dbt_common.clients.jinja.get_template
+
+    def counting_get_template(*args, **kwargs):  # type: ignore[no-untyped-def]
+        nonlocal calls
+        with lock:
+            calls += 1
+        return original(*args, **kwargs)
+
+    dbt_common.clients.jinja.get_template = counting_get_template  # type: ignore[assignment]
+    try:
+        run(cache_type, macros, threads)
+    finally:
+        dbt_common.clients.jinja.get_template = original  # type: ignore[assignment]
+    return calls
+
+
+def main() -> None:
+    macros = make_macros()
+    print(f"{'cache':<30}{'threads':>8}{'compiles':>10}{'seconds':>10}")
+    for threads in THREADS:
+        for cache_type in (UncoordinatedTemplateCache, TemplateCache):
+            compiles = count_compilations(cache_type, macros, threads)
+            best = min(run(cache_type, macros, threads) for _ in range(REPEAT))
+            print(f"{cache_type.__name__:<30}{threads:>8}{compiles:>10}{best:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from dbt_common.events.base_types import EventLevel
+from dbt_common.events.event_manager import EventManager
+from dbt_common.events.file_handler import BufferedRotatingFileHandler
+from dbt_common.events.logger import LoggerConfig
+from dbt_common.events.types import Note
+
+
+def _record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, msg, None, None)
+
+
+def test_writes_when_buffer_is_full(tmp_path: Path) -> None:
+    path = tmp_path / "dbt.log"
+    handler = BufferedRotatingFileHandler(str(path), buffer_size=20, flush_interval=None)
+    handler.emit(_record("first"))
+    handler.emit(_record("second"))
+    assert path.read_text() == ""
+
+    handler.emit(_record("third line"))
+    assert path.read_text() == "first\nsecond\nthird line\n"
+
+    handler.emit(_record("fourth"))
+    handler.flush()
+    assert path.read_text().endswith("fourth\n")
+    handler.close()
+
+
+def test_writes_after_flush_interval(tmp_path: Path) -> None:
+    path = tmp_path / "dbt.log"
+    handler = BufferedRotatingFileHandler(str(path), flush_interval=0.01)
+    handler.emit(_record("line"))
+
+    deadline = time.monotonic() + 5
+    while path.read_text() == "" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert path.read_text() == "line\n"
+    handler.close()
+
+
+def test_one_flusher_thread_for_steady_logging(tmp_path: Path, mocker: MockerFixture) -> None:
+    path = tmp_path / "dbt.log"
+    handler = BufferedRotatingFileHandler(str(path), flush_interval=0.005)
+    start = mocker.spy(threading.Thread, "start")
+    for i in range(20):
+        handler.emit(_record(f"line {i}"))
+        # longer than the flush interval, so every line is written on its own
+        time.sleep(0.01)
+
+    assert start.call_count == 1
+    handler.close()
+    assert path.read_text() == "".join(f"line {i}\n" for i in range(20))
+
+
+def test_rotates_like_rotating_file_handler(tmp_path: Path) -> None:
+    (tmp_path / "expected").mkdir()
+    (tmp_path / "actual").mkdir()
+    expected = RotatingFileHandler(
+        str(tmp_path / "expected" / "dbt.log"), maxBytes=100, backupCount=2, encoding="utf8"
+    )
+    actual = BufferedRotatingFileHandler(
+        str(tmp_path / "actual" / "dbt.log"), max_bytes=100, backup_count=2, buffer_size=64
+    )
+    for i in range(40):
+        record = _record(f"line {i}" + "." * (i % 13))
+        expected.emit(record)
+        actual.emit(record)
+    expected.close()
+    actual.close()
+
+    names = sorted(p.name for p in (tmp_path / "expected").iterdir())
+    assert names == ["dbt.log", "dbt.log.1", "dbt.log.2"]
+    assert sorted(p.name for p in (tmp_path / "actual").iterdir()) == names
+    for name in names:
+        assert (tmp_path / "actual" / name).read_bytes() == (
+            tmp_path / "expected" / name
+        ).read_bytes()
+
+
+def test_event_manager_flush_writes_file(tmp_path: Path) -> None:
+    path = tmp_path / "dbt.log"
+    manager = EventManager()
+    manager.add_logger(
+        LoggerConfig(
+            name="test_file_handler",
+            level=EventLevel.INFO,
+            output_file_name=str(path),
+            output_file_flush_interval=None,
+        )
+    )
+    manager.fire_event(Note(msg="a note"))
+    assert path.read_text() == ""
+
+    manager.flush()
+    assert path.read_text().endswith("a note\n")
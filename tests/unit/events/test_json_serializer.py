@@ -0,0 +1,205 @@
+import math
+import random
+from datetime import datetime
+from typing import Any
+
+import pytest
+from google.protobuf import (
+    descriptor_pb2,
+    descriptor_pool,
+    message_factory,
+    struct_pb2,
+    text_format,
+    timestamp_pb2,
+    wrappers_pb2,
+)
+
+import tests.unit.test_events as test_events
+from dbt_common.events.base_types import msg_from_base_event
+from dbt_common.events.functions import msg_to_json
+from dbt_common.events.json_serializer import msg_to_json_line, write_message
+from dbt_common.events.types import RetryExternalCall
+
+ALL_TYPES_PROTO = """
+name: "test_all_types.proto"
+package: "test"
+syntax: "proto3"
+dependency: "google/protobuf/struct.proto"
+dependency: "google/protobuf/timestamp.proto"
+dependency: "google/protobuf/wrappers.proto"
+enum_type { name: "Color" value { name: "RED" number: 0 } value { name: "GREEN" number: 1 } }
+message_type {
+  name: "NodeInfo"
+  field { name: "node_name" number: 1 type: TYPE_STRING label: LABEL_OPTIONAL }
+  field { name: "unique_id" number: 2 type: TYPE_STRING label: LABEL_OPTIONAL }
+}
+message_type {
+  name: "AllTypes"
+  field { name: "s" number: 1 type: TYPE_STRING label: LABEL_OPTIONAL }
+  field { name: "b" number: 2 type: TYPE_BYTES label: LABEL_OPTIONAL }
+  field { name: "flag" number: 3 type: TYPE_BOOL label: LABEL_OPTIONAL }
+  field { name: "i32" number: 4 type: TYPE_INT32 label: LABEL_OPTIONAL }
+  field { name: "i64" number: 5 type: TYPE_INT64 label: LABEL_OPTIONAL }
+  field { name: "u64" number: 6 type: TYPE_UINT64 label: LABEL_OPTIONAL }
+  field { name: "f" number: 7 type: TYPE_FLOAT label: LABEL_OPTIONAL }
+  field { name: "d" number: 8 type: TYPE_DOUBLE label: LABEL_OPTIONAL }
+  field { name: "color" number: 9 type: TYPE_ENUM type_name: ".test.Color" label: LABEL_OPTIONAL }
+  field { name: "names" number: 10 type: TYPE_STRING label: LABEL_REPEATED }
+  field { name: "counts" number: 11 type: TYPE_INT64 label: LABEL_REPEATED }
+  field {
+    name: "by_name" number: 12 type: TYPE_MESSAGE type_name: ".test.AllTypes.ByNameEntry"
+    label: LABEL_REPEATED
+  }
+  field {
+    name: "by_flag" number: 13 type: TYPE_MESSAGE type_name: ".test.AllTypes.ByFlagEntry"
+    label: LABEL_REPEATED
+  }
+  field {
+    name: "meta" number: 14 type: TYPE_MESSAGE type_name: ".google.protobuf.Struct"
+    label: LABEL_OPTIONAL
+  }
+  field {
+    name: "ts" number: 15 type: TYPE_MESSAGE type_name: ".google.protobuf.Timestamp"
+    label: LABEL_OPTIONAL
+  }
+  field {
+    name: "opt" number: 16 type: TYPE_STRING label: LABEL_OPTIONAL oneof_index: 1
+    proto3_optional: true
+  }
+  field {
+    name: "node_info" number: 17 type: TYPE_MESSAGE type_name: ".test.NodeInfo"
+    label: LABEL_OPTIONAL
+  }
+  field {
+    name: "nodes" number: 18 type: TYPE_MESSAGE type_name: ".test.NodeInfo"
+    label: LABEL_REPEATED
+  }
+  field { name: "choice_a" number: 19 type: TYPE_STRING label: LABEL_OPTIONAL oneof_index: 0 }
+  field { name: "choice_b" number: 20 type: TYPE_INT32 label: LABEL_OPTIONAL oneof_index: 0 }
+  field {
+    name: "wrapped" number: 21 type: TYPE_MESSAGE type_name: ".google.protobuf.Int64Value"
+    label: LABEL_OPTIONAL
+  }
+  nested_type {
+    name: "ByNameEntry"
+    field { name: "key" number: 1 type: TYPE_STRING label: LABEL_OPTIONAL }
+    field { name: "value" number: 2 type: TYPE_INT32 label: LABEL_OPTIONAL }
+    options { map_entry: true }
+  }
+  nested_type {
+    name: "ByFlagEntry"
+    field { name: "key" number: 1 type: TYPE_BOOL label: LABEL_OPTIONAL }
+    field { name: "value" number: 2 type: TYPE_MESSAGE type_name: ".test.NodeInfo"
+            label: LABEL_OPTIONAL }
+    options { map_entry: true }
+  }
+  oneof_decl { name: "choice" }
+  oneof_decl { name: "_opt" }
+}
+message_type {
+  name: "AllTypesMsg"
+  field { name: "info" number: 1 type: TYPE_MESSAGE type_name: ".test.NodeInfo" label: LABEL_OPTIONAL }
+  field { name: "data" number: 2 type: TYPE_MESSAGE type_name: ".test.AllTypes" label: LABEL_OPTIONAL }
+}
+"""
+
+
+@pytest.fixture(scope="module")
+def all_types_msg() -> Any:
+    pool = descriptor_pool.DescriptorPool()
+    for module in (struct_pb2, timestamp_pb2, wrappers_pb2):
+        pool.AddSerializedFile(module.DESCRIPTOR.serialized_pb)
+    pool.Add(text_format.Parse(ALL_TYPES_PROTO, descriptor_pb2.FileDescriptorProto()))
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("test.AllTypesMsg"))
+
+
+def test_golden_line() -> None:
+    msg = msg_from_base_event(RetryExternalCall(attempt=3, max=5))
+    msg.info.ts.FromDatetime(datetime(2024, 1, 2, 3, 4, 5, 678000))
+    msg.info.pid = 1234
+    msg.info.thread = 'Thread-1 "é"'
+    msg.info.invocation_id = "abc"
+    msg.info.extra.clear()
+    msg.info.extra.update({"b": "2", "a": "1"})
+
+    expected = (
+        '{"data": {"attempt": 3, "max": 5}, "info": {"category": "", "code": "M020", '
+        '"extra": {"a": "1", "b": "2"}, "invocation_id": "abc", "level": "debug", '
+        '"msg": "Retrying external call. Attempt: 3 Max attempts: 5", "name": '
+        '"RetryExternalCall", "pid": 1234, "thread": "Thread-1 \\"\\u00e9\\"", '
+        '"ts": "2024-01-02T03:04:05.678Z"}}'
+    )
+    assert msg_to_json(msg) == expected
+    assert msg_to_json_line(msg) == expected
+
+
+def test_sample_events_match_msg_to_json() -> None:
+    for event in test_events.TestEventJSONSerialization.SAMPLE_VALUES:
+        msg = msg_from_base_event(event)
+        assert msg_to_json_line(msg) == msg_to_json(msg)
+
+
+_TEXT = ["", "a", 'quote"', "back\\slash", "new\nline", "\x01", "é", "中文", "\U0001f600"]
+_FLOATS = [0.0, -0.0, 1.5, -2.25, 0.1, 1e300, -1e-300, 3.4e38, math.inf, -math.inf, math.nan]
+
+
+def _text(rng: random.Random) -> str:
+    return "".join(rng.choice(_TEXT) for _ in range(rng.randint(0, 3)))
+
+
+def _node_info(node: Any, rng: random.Random) -> None:
+    node.node_name = rng.choice(["", "model.a"])
+    node.unique_id = _text(rng)
+
+
+def _random_all_types(msg_cls: Any, rng: random.Random) -> Any:
+    msg = msg_cls()
+    data = msg.data
+    if rng.random() < 0.5:
+        _node_info(msg.info, rng)
+    if rng.random() < 0.1:
+        return msg
+    for name, set_value in [
+        ("s", lambda: setattr(data, "s", _text(rng))),
+        ("b", lambda: setattr(data, "b", bytes(rng.randrange(256) for _ in range(5)))),
+        ("flag", lambda: setattr(data, "flag", rng.random() < 0.5)),
+        ("i32", lambda: setattr(data, "i32", rng.randint(-(2**31), 2**31 - 1))),
+        ("i64", lambda: setattr(data, "i64", rng.randint(-(2**63), 2**63 - 1))),
+        ("u64", lambda: setattr(data, "u64", rng.randint(0, 2**64 - 1))),
+        ("f", lambda: setattr(data, "f", rng.choice(_FLOATS + [rng.uniform(-1e6, 1e6)]))),
+        ("d", lambda: setattr(data, "d", rng.choice(_FLOATS + [rng.uniform(-1e6, 1e6)]))),
+        ("color", lambda: setattr(data, "color", rng.choice([0, 1, 7]))),
+        ("names", lambda: data.names.extend(_text(rng) for _ in range(rng.randint(0, 3)))),
+        ("counts", lambda: data.counts.extend(rng.randint(-5, 5) for _ in range(3))),
+        (
+            "by_name",
+            lambda: data.by_name.update({_text(rng): rng.randint(-9, 9) for _ in range(3)}),
+        ),
+        ("by_flag", lambda: _node_info(data.by_flag[rng.random() < 0.5], rng)),
+        ("meta", lambda: data.meta.update({"k": [1, "v", None, {"x": True}], "n": 2.5})),
+        ("ts", lambda: data.ts.FromNanoseconds(rng.randint(0, 2**62))),
+        ("opt", lambda: setattr(data, "opt", _text(rng))),
+        ("node_info", lambda: _node_info(data.node_info, rng)),
+        ("nodes", lambda: _node_info(data.nodes.add(), rng)),
+        ("choice_a", lambda: setattr(data, "choice_a", _text(rng))),
+        ("choice_b", lambda: setattr(data, "choice_b", rng.randint(-9, 9))),
+        ("wrapped", lambda: setattr(data.wrapped, "value", rng.randint(-9, 9))),
+    ]:
+        if rng.random() < 0.6:
+            set_value()
+    return msg
+
+
+def test_all_field_types_match_msg_to_json(all_types_msg: Any) -> None:
+    rng = random.Random(0)
+    for _ in range(500):
+        msg = _random_all_types(all_types_msg, rng)
+        assert msg_to_json_line(msg) == msg_to_json(msg)
+
+
+def test_write_message_skips_fields(all_types_msg: Any) -> None:
+    msg = all_types_msg()
+    msg.info.node_name = "a"
+    msg.info.unique_id = "b"
+    assert write_message(msg.info) == '{"node_name": "a", "unique_id": "b"}'
+    assert write_message(msg.info, lambda name, value: name == "node_name") == '{"unique_id": "b"}'
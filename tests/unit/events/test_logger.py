@@ -1,7 +1,26 @@
+import io
 import json
-from dbt_common.events.logger import LoggerConfig, _TextLogger, _JsonLogger
+import logging
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dbt_common.events.event_manager import EventManager
+from dbt_common.events.logger import (
+    LineFormat,
+    LoggerConfig,
+    OverflowPolicy,
+    _AsyncWriter,
+    _TextLogger,
+    _JsonLogger,
+)
 from dbt_common.events.base_types import EventLevel, msg_from_base_event
-from dbt_common.events.types import PrintEvent
+from dbt_common.events.types import Note, PrintEvent
 
 
 def test_create_print_line():
@@ -38,3 +57,142 @@ def test_create_print_json():
     actual_json["info"].pop("ts")
     actual_json["info"].pop("pid")
     assert actual_json == expected_json
+
+
+def _fire_notes(manager: EventManager, threads: int, events: int) -> None:
+    def fire(thread: int) -> None:
+        for i in range(events):
+            manager.fire_event(Note(msg=f"{thread}-{i}"))
+
+    workers = [
+        threading.Thread(target=fire, args=(t,), name=f"Thread-{t}") for t in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+@pytest.mark.parametrize("line_format", [LineFormat.DebugText, LineFormat.Json])
+def test_async_write_matches_sync(line_format: LineFormat) -> None:
+    outputs = []
+    for async_write in (False, True):
+        stream = io.StringIO()
+        manager = EventManager()
+        manager.add_logger(
+            LoggerConfig(
+                name=f"test_async_{async_write}",
+                level=EventLevel.INFO,
+                line_format=line_format,
+                output_stream=stream,
+                async_write=async_write,
+                async_queue_size=16,
+            )
+        )
+        _fire_notes(manager, threads=4, events=250)
+        manager.flush()
+        outputs.append(stream.getvalue().splitlines())
+
+    sync_lines, async_lines = outputs
+    assert len(async_lines) == 1000
+
+    def without_time(line: str) -> str:
+        if line_format == LineFormat.Json:
+            info = json.loads(line)["info"]
+            info.pop("ts")
+            return json.dumps(info, sort_keys=True)
+        return line[line.index("[") :]
+
+    # lines name the thread which fired the event, not the writer
+    assert sorted(map(without_time, async_lines)) == sorted(map(without_time, sync_lines))
+
+
+@pytest.mark.parametrize(
+    "overflow,dropped,kept",
+    [
+        (OverflowPolicy.DropNewest, 3, ["0", "1"]),
+        (OverflowPolicy.DropOldest, 3, ["3", "4"]),
+    ],
+)
+def test_async_write_overflow(
+    mocker: MockerFixture, overflow: OverflowPolicy, dropped: int, kept: List[str]
+) -> None:
+    # Without a writer thread, nothing is taken from the queue.
+    mocker.patch.object(_AsyncWriter, "_start")
+    config = LoggerConfig(
+        name="test_async_overflow",
+        output_stream=io.StringIO(),
+        async_write=True,
+        async_queue_size=2,
+        async_overflow=overflow,
+    )
+    logger = _TextLogger(config)
+    for i in range(5):
+        logger.write_line(msg_from_base_event(Note(msg=str(i))))
+
+    assert logger._writer is not None
+    assert logger._writer.dropped == dropped
+    assert [msg.info.msg for msg in logger._writer._queue.queue] == kept
+
+
+def test_async_write_to_config_logger_sends_a_record_per_event() -> None:
+    records: List[logging.LogRecord] = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record: logging.LogRecord) -> None:
+            records.append(record)
+
+    python_logger = logging.getLogger("test_async_config_logger")
+    python_logger.setLevel(logging.DEBUG)
+    python_logger.propagate = False
+    python_logger.addHandler(ListHandler())
+    manager = EventManager()
+    manager.add_logger(
+        LoggerConfig(
+            name="test_async_config_logger",
+            level=EventLevel.INFO,
+            logger=python_logger,
+            async_write=True,
+        )
+    )
+    _fire_notes(manager, threads=2, events=50)
+    manager.flush()
+
+    assert len(records) == 100
+    assert all("\n" not in record.getMessage() for record in records)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_async_write_in_forked_child(tmp_path: Path) -> None:
+    path = tmp_path / "dbt.log"
+    manager = EventManager()
+    manager.add_logger(
+        LoggerConfig(
+            name="test_async_fork",
+            level=EventLevel.INFO,
+            line_format=LineFormat.Json,
+            output_file_name=str(path),
+            output_file_flush_interval=None,
+            async_write=True,
+        )
+    )
+    # start the parent's writer thread, which the child won't have
+    manager.fire_event(Note(msg="parent"))
+    manager.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        # a hung child is killed rather than hanging the test run
+        signal.alarm(5)
+        try:
+            manager.fire_event(Note(msg="child"))
+            manager.flush()
+        finally:
+            os._exit(0)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status)
+    assert [json.loads(line)["info"]["msg"] for line in path.read_text().splitlines()] == [
+        "parent",
+        "child",
+    ]
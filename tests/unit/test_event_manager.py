@@ -1,9 +1,20 @@
+import io
+
 import pytest
+from pytest_mock import MockerFixture
 
-from dbt_common.events.base_types import EventGroupType
+from dbt_common.events.base_types import EventGroupType, EventLevel
 from dbt_common.events.event_catcher import EventCatcher
+import dbt_common.events.event_manager as event_manager_module
 from dbt_common.events.event_manager import EventManager
-from dbt_common.events.types import BehaviorChangeEvent, GetMetaKeyWarning
+from dbt_common.events.logger import LoggerConfig
+from dbt_common.events.types import (
+    BehaviorChangeEvent,
+    GetMetaKeyWarning,
+    Note,
+    PrintEvent,
+    RetryExternalCall,
+)
 from dbt_common.exceptions.events import EventCompilationError
 from dbt_common.helper_types import WarnErrorOptionsV2
 
@@ -30,6 +41,95 @@ class TestEventManager:
         assert event_manager.warn_error_options.to_dict() == WarnErrorOptionsV2().to_dict()
 
 
+class TestEventGate:
+    @pytest.fixture
+    def built(self, mocker: MockerFixture, monkeypatch: pytest.MonkeyPatch):
+        monkeypatch.delenv("DBT_TEST_BINARY_SERIALIZATION", raising=False)
+        return mocker.spy(event_manager_module, "msg_from_base_event")
+
+    def test_skips_events_below_every_logger(self, built) -> None:
+        stream = io.StringIO()
+        em = EventManager()
+        em.add_logger(LoggerConfig(name="gate_test", level=EventLevel.INFO, output_stream=stream))
+
+        em.fire_event(RetryExternalCall(attempt=1, max=3))
+        assert built.call_count == 0
+        em.fire_event(Note(msg="info"))
+        em.fire_event(Note(msg="debug"), level=EventLevel.DEBUG)
+        assert built.call_count == 1
+        assert "info" in stream.getvalue()
+
+    def test_print_events_are_written_at_error_level(self, built) -> None:
+        stream = io.StringIO()
+        em = EventManager()
+        em.add_logger(LoggerConfig(name="gate_test", level=EventLevel.ERROR, output_stream=stream))
+
+        em.fire_event(Note(msg="info"))
+        em.fire_event(PrintEvent(msg="printed"))
+        assert built.call_count == 1
+        assert stream.getvalue() == "printed\n"
+
+    def test_callbacks_declare_levels_and_names(self, built) -> None:
+        warnings, notes = EventCatcher(), EventCatcher()
+        em = EventManager()
+        em.add_callback(warnings.catch, levels=[EventLevel.WARN, EventLevel.ERROR])
+        em.add_callback(notes.catch, levels=[EventLevel.DEBUG], event_names=["Note"])
+
+        em.fire_event(RetryExternalCall(attempt=1, max=3))
+        assert built.call_count == 0
+        em.fire_event(Note(msg="debug note"), level=EventLevel.DEBUG)
+        em.fire_event(Note(msg="info note"))
+        em.fire_event(_make_event())
+        assert built.call_count == 3
+
+        assert [e.info.name for e in warnings.caught_events] == ["BehaviorChangeEvent"]
+        assert [e.info.msg for e in notes.caught_events] == ["debug note"]
+
+    def test_follows_changes_to_callbacks(self, built) -> None:
+        em = EventManager()
+        em.fire_event(RetryExternalCall(attempt=1, max=3))
+        assert built.call_count == 0
+
+        catcher = EventCatcher()
+        em.callbacks.append(catcher.catch)
+        em.fire_event(RetryExternalCall(attempt=1, max=3))
+        assert len(catcher.caught_events) == 1
+
+        em.callbacks.clear()
+        em.fire_event(RetryExternalCall(attempt=1, max=3))
+        assert built.call_count == 1
+
+    def test_follows_callbacks_replaced_in_place(self, built) -> None:
+        errors, everything = EventCatcher(), EventCatcher()
+        em = EventManager()
+        em.add_callback(errors.catch, levels=[EventLevel.ERROR])
+        em.fire_event(Note(msg="dropped"))
+        assert built.call_count == 0
+
+        em.callbacks.pop()
+        em.callbacks.append(everything.catch)
+        em.fire_event(Note(msg="kept"))
+        assert [e.info.msg for e in everything.caught_events] == ["kept"]
+        assert errors.caught_events == []
+
+    def test_filtered_callbacks_can_be_removed(self) -> None:
+        catcher = EventCatcher()
+        em = EventManager()
+        em.add_callback(catcher.catch, levels=[EventLevel.INFO])
+        assert catcher.catch in em.callbacks
+
+        em.callbacks.remove(catcher.catch)
+        em.fire_event(Note(msg="info"))
+        assert em.callbacks == []
+        assert catcher.caught_events == []
+
+    def test_warn_error_handling_is_not_skipped(self) -> None:
+        em = EventManager()
+        em.warn_error = True
+        with pytest.raises(EventCompilationError):
+            em.fire_event(_make_event(), force_warn_or_error_handling=True)
+
+
 class TestEventManagerSilencedDeprecation:
     def test_can_silenced_deprecation_event(self) -> None:
         event_catcher = EventCatcher()
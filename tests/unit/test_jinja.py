@@ -1,17 +1,78 @@
+import gc
+import io
+import linecache
+import os
 import jinja2
+import pathlib
+import pickle
+import pstats
+import pytest
+import random
+import threading
+import time
 import unittest
+import weakref
+import zipfile
 
+from ast import literal_eval
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
-from dbt_common.clients._jinja_blocks import BlockTag, ExtractWarning
+from pytest_mock import MockerFixture
+
+import dbt_common.clients.jinja
+from dbt_common.clients._jinja_blocks import (
+    BlockIterator,
+    BlockTag,
+    ExtractWarning,
+    LineIndex,
+    SinglePassTagIterator,
+    TagIterator,
+)
+from dbt_common.clients._jinja_debug import DebugBundle
 from dbt_common.clients.jinja import (
+    UNRESOLVED,
+    analyze,
+    MacroProfiler,
+    MacroUsage,
+    set_macro_profiler,
+    set_macro_usage,
+    register_trusted_type,
+    unregister_trusted_type,
+    template_cache,
+    render_template_to,
+    stream_template,
+    BoolMarker,
+    NativeMarker,
+    NumberMarker,
+    quoted_native_concat,
+    CallableMacroGenerator,
+    CaptureUndefined,
+    create_undefined,
+    current_macro_stack,
+    undefined_node,
     extract_toplevel_blocks,
+    extract_toplevel_blocks_batch,
+    update_toplevel_blocks,
+    get_environment,
+    get_pooled_environment,
     get_template,
     render_template,
+    set_bytecode_cache,
+    MacroBytecodeCache,
+    MacroFuzzEnvironment,
+    MacroFuzzTemplate,
     MacroFuzzParser,
     MacroType,
 )
-from dbt_common.exceptions import CompilationError
+from dbt_common.exceptions import (
+    CompilationError,
+    DbtInternalError,
+    JinjaRenderingError,
+    UndefinedCompilationError,
+    UndefinedMacroError,
+)
+from tests.unit.utils import FakeMacro, FakeNode
 
 
 class TestBlockLexer(unittest.TestCase):
@@ -456,6 +517,140 @@ class TestBlockLexer(unittest.TestCase):
         )
 
 
+class TestSinglePassBlockLexer(TestBlockLexer):
+    """Runs every block lexer test against the single pass scanner."""
+
+    def setUp(self) -> None:
+        self._block_scanner = dbt_common.clients.jinja.BLOCK_SCANNER
+        dbt_common.clients.jinja.BLOCK_SCANNER = "single_pass"
+
+    def tearDown(self) -> None:
+        dbt_common.clients.jinja.BLOCK_SCANNER = self._block_scanner
+
+
+def _lex_or_error(tag_iterator_class, text: str) -> Any:
+    try:
+        blocks = BlockIterator(tag_iterator_class(text)).lex_for_blocks(
+            allowed_blocks={"macro", "docs"}
+        )
+    except CompilationError as exc:
+        return type(exc), str(exc)
+    return [(b.block_type_name, b.contents, b.full_block) for b in blocks]
+
+
+def test_single_pass_scanner_matches_default_scanner() -> None:
+    tokens = [
+        "{{", "}}", "{%", "%}", "{%-", "-%}", "{#", "#}", "'", '"', " ", "\n", "\\",
+        "if", "endif", "for", "endfor", "macro", "endmacro", "raw", "endraw", "docs", "x",
+    ]  # fmt: skip
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 25)))
+        assert _lex_or_error(SinglePassTagIterator, text) == _lex_or_error(TagIterator, text)
+
+
+def test_lazy_blocks_match_eager_blocks() -> None:
+    text = "a {% macro m() %}b{% endmacro %}\n{% docs d %}c{% enddocs %} e"
+    eager = extract_toplevel_blocks(text, allowed_blocks={"macro", "docs"})
+    lazy = extract_toplevel_blocks(text, allowed_blocks={"macro", "docs"}, lazy_contents=True)
+
+    def describe(block):
+        return (
+            type(block),
+            block.block_type_name,
+            getattr(block, "block_name", None),
+            block.contents,
+            block.full_block,
+            block.start,
+            block.end,
+        )
+
+    assert [describe(b) for b in lazy] == [describe(b) for b in eager]
+    assert all(b.source is text for b in lazy)
+    assert all(b.source is None for b in eager)
+    assert not hasattr(lazy[0], "__dict__")
+
+    # the source is pickled once, and shared by the unpickled blocks
+    unpickled = pickle.loads(pickle.dumps(lazy))
+    assert [describe(b) for b in unpickled] == [describe(b) for b in lazy]
+    assert unpickled[0].source is unpickled[1].source
+
+
+def test_lazy_block_assignment_materializes() -> None:
+    text = "{% macro m() %}b{% endmacro %}"
+    block = extract_toplevel_blocks(text, lazy_contents=True)[0]
+    assert isinstance(block, BlockTag)
+    block.contents = "replaced"
+
+    assert block.source is None
+    assert block.contents == "replaced"
+    assert block.full_block == text
+
+
+def _describe_blocks(blocks):
+    return [
+        (b.block_type_name, getattr(b, "block_name", None), b.contents, b.full_block, b.start)
+        for b in blocks
+    ]
+
+
+def test_update_toplevel_blocks_reuses_unchanged_blocks() -> None:
+    macros = [f"{{% macro m{i}() %}}select {i}{{% endmacro %}}\n" for i in range(5)]
+    text = "".join(macros)
+    blocks = extract_toplevel_blocks(text)
+    offset = text.index("select 2")
+
+    update = update_toplevel_blocks(text, blocks, offset, len("select 2"), "select 'two'")
+
+    assert update.text == text.replace("select 2", "select 'two'")
+    assert _describe_blocks(update.blocks) == _describe_blocks(
+        extract_toplevel_blocks(update.text)
+    )
+    assert [b.block_name for b in update.changed] == ["m2"]
+    assert [b.block_name for b in update.removed] == ["m2"]
+    # the blocks before the edit are the same objects
+    assert update.blocks[:2] == blocks[:2]
+
+
+def test_update_toplevel_blocks_matches_full_extraction() -> None:
+    pieces = [
+        "{% macro m() %}", "{% endmacro %}", "{% docs d %}", "{% enddocs %}", "{% if x %}",
+        "{% endif %}", "{{ 'a' }}", "{# c #}", "x", " ", "\n", "{%- macro n() -%}",
+        "{%- endmacro -%}", "'", "{% raw %}", "{% endraw %}",
+    ]  # fmt: skip
+    rng = random.Random(0)
+
+    def extract_or_error(text):
+        try:
+            return _describe_blocks(extract_toplevel_blocks(text))
+        except CompilationError:
+            return "error"
+
+    for _ in range(5000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 30)))
+        if extract_or_error(text) == "error":
+            continue
+        offset = rng.randint(0, len(text))
+        removed = rng.randint(0, min(8, len(text) - offset))
+        inserted = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 2)))
+        new_text = text[:offset] + inserted + text[offset + removed :]
+
+        try:
+            update = update_toplevel_blocks(
+                text, extract_toplevel_blocks(text), offset, removed, inserted
+            )
+            result = _describe_blocks(update.blocks)
+        except CompilationError:
+            result = "error"
+        assert result == extract_or_error(new_text)
+
+
+def test_unknown_block_scanner(monkeypatch) -> None:
+    monkeypatch.setattr(dbt_common.clients.jinja, "BLOCK_SCANNER", "nonexistent")
+    with pytest.raises(DbtInternalError):
+        extract_toplevel_blocks("{% macro a() %}{% endmacro %}")
+
+
 bar_block = """{% mytype bar %}
 {# a comment
     that inside it has
@@ -598,3 +793,582 @@ def test_stray_block_warnings() -> None:
     assert "set" in warnings[1].msg
     assert warnings[2].warning_type == "unexpected_block"
     assert "endmacro" in warnings[2].msg
+    assert [(w.lineno, w.col) for w in warnings] == [(2, 4), (8, 4), (9, 4)]
+
+
+def test_line_index_positions() -> None:
+    text = "a\nbc\n\nd\n"
+    index = LineIndex(text)
+    for pos in range(len(text) + 1):
+        before = text[:pos]
+        expected = (before.count("\n") + 1, pos - (before.rfind("\n") + 1))
+        assert index.position(pos) == expected
+        assert index.lineno(pos) == expected[0]
+
+    assert LineIndex("").position(0) == (1, 0)
+
+
+def test_missing_close_tag_reports_line() -> None:
+    with pytest.raises(CompilationError, match="searched from line 3"):
+        extract_toplevel_blocks("\n\n{% macro a() %}\nselect 1\n")
+
+
+def test_bytecode_cache_skips_compile_when_warm(tmp_path, mocker: MockerFixture) -> None:
+    template_text = "{% for greeting in ['hello'] %}{{ greeting }} {{ who }}{% endfor %}"
+    set_bytecode_cache(MacroBytecodeCache(str(tmp_path)))
+    try:
+        cold = get_template(template_text, {})
+        assert render_template(cold, {"who": "world"}) == "hello world"
+        assert len(list(tmp_path.iterdir())) == 1
+
+        # A fresh cache object over the same directory stands in for a new process.
+        set_bytecode_cache(MacroBytecodeCache(str(tmp_path)))
+        compile_spy = mocker.spy(MacroFuzzEnvironment, "_compile")
+        warm = get_template(template_text, {})
+        assert render_template(warm, {"who": "world"}) == "hello world"
+        assert compile_spy.call_count == 0
+
+        # Native and capture_macros environments get their own entries.
+        get_template(template_text, {}, native=True)
+        get_template(template_text, {}, capture_macros=True)
+        assert compile_spy.call_count == 2
+        assert len(list(tmp_path.iterdir())) == 3
+    finally:
+        set_bytecode_cache(None)
+
+
+def test_get_template_reuses_pooled_environments(mocker: MockerFixture) -> None:
+    get_template("{{ 1 }}", {})
+    get_template("{{ 1 }}", {}, native=True)
+    init_spy = mocker.spy(MacroFuzzEnvironment, "__init__")
+
+    for _ in range(3):
+        get_template("{{ x }}", {})
+        get_template("{{ x }}", {}, native=True)
+    assert init_spy.call_count == 0
+
+    assert get_pooled_environment() is get_pooled_environment()
+    assert get_pooled_environment(native=True) is not get_pooled_environment()
+
+
+def test_pooled_environment_is_read_only() -> None:
+    env = get_pooled_environment()
+    for mapping in (env.globals, env.filters, env.tests):
+        with pytest.raises(TypeError):
+            mapping["x"] = None  # type: ignore[index]
+
+    assert env.from_string("{{ range(2) | list | as_text }}").render({}) == "[0, 1]"
+
+
+def test_pooled_capture_macros_environment_keeps_node() -> None:
+    first, second = FakeNode(), FakeNode()
+    first_template = get_template(
+        "{{ missing }}", {}, node=first, capture_macros=True, native=True
+    )
+    second_template = get_template(
+        "{{ missing }}", {}, node=second, capture_macros=True, native=True
+    )
+
+    for template, node in ((first_template, first), (second_template, second)):
+        value = template.render({})
+        assert type(value) is CaptureUndefined
+        assert value.node is node
+        assert value.some_attribute.node is node
+        with pytest.raises(UndefinedCompilationError):
+            pickle.dumps(value)
+
+
+def test_capture_undefined_node_binding() -> None:
+    node = FakeNode()
+    template = get_template("{{ missing }}", {}, capture_macros=True, native=True)
+    assert template.render({}).node is None
+    with undefined_node(node):
+        assert template.render({}).node is node
+
+    assert create_undefined(node) is CaptureUndefined
+    with undefined_node(node):
+        with pytest.raises(UndefinedCompilationError):
+            pickle.dumps(CaptureUndefined(name="missing"))
+
+
+@pytest.mark.parametrize("native", [False, True])
+def test_get_environment_binds_node_to_shared_undefined(native: bool) -> None:
+    first, second = FakeNode(), FakeNode()
+    first_env = get_environment(first, capture_macros=True, native=native)
+    second_env = get_environment(second, capture_macros=True, native=native)
+    assert first_env.undefined is second_env.undefined is CaptureUndefined
+
+    for env, node in ((first_env, first), (second_env, second)):
+        seen: List[Any] = []
+        template = env.from_string("{% do seen.append(missing.some_attribute) %}")
+        template.render({"seen": seen})
+        "".join(stream_template(template, {"seen": seen}))
+
+        assert [type(value) for value in seen] == [CaptureUndefined, CaptureUndefined]
+        assert all(value.node is node for value in seen)
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_extract_toplevel_blocks_batch(tmp_path: pathlib.Path, max_workers: int) -> None:
+    good = "{% macro a() %}a{% endmacro %}{% unknown %}"
+    bad = "{% if x %}{% macro a() %}{% endmacro %}{% endif %}"
+    path = tmp_path / "macros.sql"
+    path.write_text("{% docs d %}d{% enddocs %}")
+    items = [(good, None), (bad, None), (path, {"docs"})] * 3
+
+    results = list(extract_toplevel_blocks_batch(items, max_workers=max_workers, chunksize=2))
+
+    assert [r.index for r in results] == list(range(len(items)))
+    for result in results[0::3]:
+        assert result.path is None
+        assert [b.full_block for b in result.blocks] == [
+            b.full_block for b in extract_toplevel_blocks(good)
+        ]
+        assert len(result.warnings) == 1
+        assert result.error is None
+    for result in results[1::3]:
+        assert result.blocks == []
+        assert isinstance(result.error, CompilationError)
+        with pytest.raises(CompilationError) as exc:
+            extract_toplevel_blocks(bad)
+        assert str(result.error) == str(exc.value)
+    for result in results[2::3]:
+        assert result.path == str(path)
+        assert [b.block_name for b in result.blocks] == ["d"]
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_extract_toplevel_blocks_batch_errors(tmp_path: pathlib.Path, max_workers: int) -> None:
+    not_utf8 = tmp_path / "latin1.sql"
+    not_utf8.write_bytes("{% macro \xe9() %}{% endmacro %}".encode("latin-1"))
+    items = [
+        (tmp_path / "missing.sql", None),
+        (not_utf8, None),
+        ("{% macro a() %}", None),
+        ("{% macro b() %}b{% endmacro %}", None),
+    ]
+
+    results = list(extract_toplevel_blocks_batch(items, max_workers=max_workers))
+
+    assert isinstance(results[0].error, FileNotFoundError)
+    assert results[0].path == str(tmp_path / "missing.sql")
+    assert isinstance(results[1].error, UnicodeDecodeError)
+    assert repr(results[2].error) == "MissingCloseTagError('macro', 1)"
+    assert results[3].error is None
+    assert [b.block_name for b in results[3].blocks] == ["b"]
+
+
+def test_macro_generator_reuses_module(mocker: MockerFixture) -> None:
+    macro = FakeMacro("add", "{% macro add(x) %}{{ x + offset }}{% endmacro %}")
+    generator = CallableMacroGenerator(macro, {"offset": 1})
+    make_module = mocker.spy(MacroFuzzTemplate, "make_module")
+
+    assert [generator(i) for i in range(3)] == ["1", "2", "3"]
+    assert make_module.call_count == 1
+
+    # the context is used by reference, so changes to it are seen
+    assert generator.context is not None
+    generator.context["offset"] = 10
+    assert generator(1) == "11"
+    assert make_module.call_count == 1
+
+    generator.context = {"offset": 100}
+    assert generator(1) == "101"
+    assert make_module.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "sql,expected",
+    [
+        ("{% if val %}{% endif %}{% macro m() %}{{ val }}{% endmacro %}", ["1", "2"]),
+        ("{% set top = val %}{% macro m() %}{{ val }}-{{ top }}{% endmacro %}", ["1-1", "2-2"]),
+    ],
+)
+def test_macro_generator_sees_top_level_names(sql: str, expected: List[str]) -> None:
+    generator = CallableMacroGenerator(FakeMacro("m", sql), {"val": 1})
+    first = generator()
+    assert generator.context is not None
+    generator.context["val"] = 2
+    assert [first, generator()] == expected
+
+
+def test_macro_generator_does_not_keep_top_level_state() -> None:
+    sql = (
+        "{% set seen = [] %}"
+        "{% macro m(x) %}{% do seen.append(x) %}{{ seen | length }}{% endmacro %}"
+    )
+    generator = CallableMacroGenerator(FakeMacro("m", sql), {})
+    assert [generator(i) for i in range(3)] == ["1", "1", "1"]
+
+
+def test_macro_generators_compile_lazily(mocker: MockerFixture) -> None:
+    macros = [FakeMacro(f"m{i}", f"{{% macro m{i}() %}}{i}{{% endmacro %}}") for i in range(5)]
+    get_node_template = mocker.spy(template_cache, "get_node_template")
+    usage = MacroUsage()
+    set_macro_usage(usage)
+    try:
+        context: Dict[str, Any] = {}
+        for macro in macros:
+            context[macro.name] = CallableMacroGenerator(macro, context)
+        assert get_node_template.call_count == 0
+
+        assert context["m1"]() == "1"
+        assert context["m3"]() == "3"
+        assert context["m3"]() == "3"
+        CallableMacroGenerator(FakeMacro("broken", "{% macro broken() %}{% if %}"))
+        with pytest.raises(CompilationError):
+            CallableMacroGenerator(FakeMacro("broken", "{% macro broken() %}{% if %}"), lazy=False)
+    finally:
+        set_macro_usage(None)
+
+    assert (usage.registered_count, usage.compiled_count) == (6, 2)
+    assert [macro.name for macro in usage.uncompiled()] == ["m0", "m2", "m4", "broken"]
+
+
+def test_trusted_types_skip_sandbox_checks(mocker: MockerFixture) -> None:
+    class Trusted:
+        name = "trusted"
+        _private = "private"
+
+    class SubTrusted(Trusted):
+        pass
+
+    class Untrusted:
+        name = "untrusted"
+
+    env = get_pooled_environment()
+    is_safe_attribute = mocker.spy(MacroFuzzEnvironment, "is_safe_attribute")
+    template = env.from_string("{{ a.name }} {{ b.name }} {{ c.name }} {{ a.missing }}")
+    ctx = {"a": Trusted(), "b": SubTrusted(), "c": Untrusted()}
+
+    register_trusted_type(Trusted)
+    try:
+        assert template.render(ctx) == "trusted trusted untrusted "
+        assert is_safe_attribute.call_count == 1
+        assert isinstance(env.getattr(Trusted(), "_private"), jinja2.Undefined)
+        assert is_safe_attribute.call_count == 2
+
+        with pytest.raises(DbtInternalError):
+            register_trusted_type(str)
+    finally:
+        unregister_trusted_type(Trusted)
+
+    assert template.render(ctx) == "trusted trusted untrusted "
+    assert is_safe_attribute.call_count == 5
+
+
+def test_trusted_types_getitem_skips_sandbox_checks(mocker: MockerFixture) -> None:
+    class Trusted:
+        name = "trusted"
+
+    env = get_pooled_environment()
+    is_safe_attribute = mocker.spy(MacroFuzzEnvironment, "is_safe_attribute")
+    template = env.from_string("{{ a['name'] }} {{ a['missing'] }}")
+
+    register_trusted_type(Trusted)
+    try:
+        assert template.render({"a": Trusted()}) == "trusted "
+        assert is_safe_attribute.call_count == 0
+        assert isinstance(env.getitem(Trusted(), "_private"), jinja2.Undefined)
+    finally:
+        unregister_trusted_type(Trusted)
+
+
+@pytest.mark.parametrize("expr", ["a.fmt", "a['fmt']"])
+def test_trusted_types_still_sandbox_str_format(expr: str) -> None:
+    class Trusted:
+        @property
+        def fmt(self) -> Any:
+            return "{0.__class__}".format
+
+    env = get_pooled_environment()
+    template = env.from_string("{{ %s(a) }}" % expr)
+
+    register_trusted_type(Trusted)
+    try:
+        # The sandboxed formatter hides the private attribute.
+        assert template.render({"a": Trusted()}) == ""
+    finally:
+        unregister_trusted_type(Trusted)
+
+
+def test_trusted_type_cache_does_not_keep_types() -> None:
+    class Trusted:
+        name = "trusted"
+
+    env = get_pooled_environment()
+    register_trusted_type(Trusted)
+    try:
+        cls = type("Transient", (), {"name": "transient"})
+        assert env.getattr(cls(), "name") == "transient"
+        assert cls in dbt_common.clients.jinja._TRUSTED_TYPE_CACHE
+
+        cls_ref = weakref.ref(cls)
+        del cls
+        gc.collect()
+        assert cls_ref() is None
+    finally:
+        unregister_trusted_type(Trusted)
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        "1", "-0", "12.5", "-1.5e-3", "1.0e999", "007", "1_000", "True", "None", "'it\"s'",
+        '""', "'a\\nb'", "'a\rb'", "[]", "[1, 'a,b', None,]", "[\n  1,\n  2\n]", "{}",
+        "{'a': 1, True: 2, 1: 3}", "{'a': [1]}", "(1, 2)", " 1", "1 ", "[1 2]", "view",
+    ],
+)  # fmt: skip
+def test_quoted_native_concat_matches_literal_eval(raw: str) -> None:
+    marker = NativeMarker(raw)
+    try:
+        expected = literal_eval(marker)
+    except (ValueError, SyntaxError):
+        expected = marker
+
+    for _ in range(2):
+        result = quoted_native_concat(iter([marker]))
+        assert type(result) is type(expected)
+        assert repr(result) == repr(expected)
+
+
+def test_quoted_native_concat_memo_returns_copies() -> None:
+    first = quoted_native_concat(iter([NativeMarker("{'a': [1, 2]}")]))
+    first["a"].append(3)
+    assert quoted_native_concat(iter([NativeMarker("{'a': [1, 2]}")])) == {"a": [1, 2]}
+
+    raw = NativeMarker("not a literal")
+    assert quoted_native_concat(iter([raw])) is raw
+
+
+def test_quoted_native_concat_validates_markers() -> None:
+    assert quoted_native_concat(iter([NativeMarker("1")])) == 1
+    with pytest.raises(JinjaRenderingError):
+        quoted_native_concat(iter([BoolMarker("1")]))
+    with pytest.raises(JinjaRenderingError):
+        quoted_native_concat(iter([NumberMarker("True")]))
+    assert quoted_native_concat(iter([NumberMarker("1.5")])) == 1.5
+
+
+def test_stream_template_matches_render() -> None:
+    template_text = "{% for i in range(n) %}select {{ i }} union all\n{% endfor %}select 0"
+    template = get_template(template_text, {})
+    expected = render_template(template, {"n": 2000})
+
+    chunks = list(stream_template(template, {"n": 2000}, chunk_size=1000))
+    assert "".join(chunks) == expected
+    assert len(chunks) > 1
+    assert all(len(chunk) >= 1000 for chunk in chunks[:-1])
+
+    output = io.StringIO()
+    assert render_template_to(template, {"n": 2000}, output) == len(expected)
+    assert output.getvalue() == expected
+
+
+def test_stream_template_translates_errors() -> None:
+    template = get_template("{% for i in range(3) %}{{ i }}{% endfor %}{{ missing() }}", {})
+    chunks = stream_template(template, {}, chunk_size=1)
+    assert [next(chunks) for _ in range(3)] == ["0", "1", "2"]
+    with pytest.raises(UndefinedMacroError):
+        next(chunks)
+
+
+def test_stream_template_binds_undefined_node() -> None:
+    node = FakeNode()
+    template = get_template(
+        "{{ capture(missing) }}{{ capture(missing) }}", {}, node=node, capture_macros=True
+    )
+    captured = []
+
+    def capture(value):
+        captured.append(value)
+        return "x"
+
+    chunks = stream_template(template, {"capture": capture}, chunk_size=1)
+    assert next(chunks) == "x"
+    # the node is not bound while the stream is suspended
+    assert CaptureUndefined().node is None
+    assert list(chunks) == ["x"]
+    assert [value.node for value in captured] == [node, node]
+
+
+def test_macro_profiler(tmp_path) -> None:
+    context: Dict[str, Any] = {}
+    for name, sql in (
+        ("outer", "{% macro outer() %}{{ inner() }}{{ countdown(2) }}{% endmacro %}"),
+        ("inner", "{% macro inner() %}inner{% endmacro %}"),
+        (
+            "countdown",
+            "{% macro countdown(n) %}{% if n %}{{ countdown(n - 1) }}{% endif %}{% endmacro %}",
+        ),
+    ):
+        context[name] = CallableMacroGenerator(FakeMacro(name, sql), context)
+
+    profiler = MacroProfiler()
+    set_macro_profiler(profiler)
+    try:
+        context["outer"]()
+    finally:
+        set_macro_profiler(None)
+    context["outer"]()
+
+    path = str(tmp_path / "macros.prof")
+    profiler.dump_stats(path)
+    stats = pstats.Stats(path).stats  # type: ignore
+
+    outer, inner, countdown = (("<macro>", 0, name) for name in ("outer", "inner", "countdown"))
+    assert set(stats) == {outer, inner, countdown}
+    assert stats[outer][:2] == (1, 1)
+    assert stats[inner][:2] == (1, 1)
+    assert set(stats[inner][4]) == {outer}
+    # one call from outer, and two recursive calls from itself
+    assert stats[countdown][:2] == (1, 3)
+    assert stats[countdown][4][outer][:2] == (1, 1)
+    assert stats[countdown][4][countdown][:2] == (0, 2)
+
+    # cumulative time includes the macros called, self time doesn't
+    cc, nc, tt, ct, _ = stats[outer]
+    assert ct >= tt
+    assert ct >= stats[inner][3] + stats[countdown][3]
+
+
+def test_current_macro_stack() -> None:
+    seen: List[List[str]] = []
+    context: Dict[str, Any] = {
+        "record": lambda: seen.append([g.get_name() for g in current_macro_stack()])
+    }
+    for name, sql in (
+        ("outer", "{% macro outer() %}{{ record() }}{{ inner() }}{% endmacro %}"),
+        ("inner", "{% macro inner() %}{{ record() }}{{ broken() }}{% endmacro %}"),
+        ("broken", "{% macro broken() %}{{ 1 / 0 }}{% endmacro %}"),
+    ):
+        context[name] = CallableMacroGenerator(FakeMacro(name, sql), context)
+
+    with pytest.raises(ZeroDivisionError):
+        context["outer"]()
+
+    assert seen == [["outer"], ["outer", "inner"]]
+    assert current_macro_stack() == []
+
+
+def test_analyze_finds_calls() -> None:
+    analysis = analyze(
+        """
+        {% macro my_macro(x) %}{{ adapter.dispatch('my_macro', 'pkg')(x) }}{% endmacro %}
+        select * from {{ ref('model', v=2) }}
+        join {{ source('src', 'table') }}
+        where {{ my_macro(var('x')) }} in {{ [1, -2.5, none, {"a": (true,)}] | join }}
+        """
+    )
+
+    assert analysis.macros == {"my_macro"}
+    assert analysis.called_names == {"adapter.dispatch", "ref", "source", "my_macro", "var"}
+    assert not analysis.static
+
+    (ref_call,) = analysis.calls_to("ref")
+    assert (ref_call.args, ref_call.kwargs, ref_call.static) == (("model",), {"v": 2}, True)
+    assert ref_call.lineno == 3
+    assert analysis.calls_to("source")[0].args == ("src", "table")
+
+    (dispatch_call,) = analysis.calls_to("adapter.dispatch")
+    assert dispatch_call.path == ("adapter", "dispatch")
+    assert dispatch_call.static
+    # the result of dispatch is called with a variable
+    dispatched = [call for call in analysis.calls if call.path is None]
+    assert len(dispatched) == 1
+    assert dispatched[0].args == (UNRESOLVED,)
+    assert not dispatched[0].static
+
+    (my_macro_call,) = analysis.calls_to("my_macro")
+    assert my_macro_call.args == (UNRESOLVED,)
+    assert analysis.calls_to("var")[0].static
+
+
+def test_analyze_literal_arguments() -> None:
+    (call,) = analyze("{{ f([1, -2.5, none], {'a': (true,)}, *args) }}").calls
+    assert call.args == ([1, -2.5, None], {"a": (True,)})
+    assert not call.static
+
+    for unhashable in ("{{ f({[1]: 2}) }}", "{{ f({(1, [2]): 3}) }}"):
+        (call,) = analyze(unhashable).calls
+        assert call.args == (UNRESOLVED,)
+        assert not call.static
+
+    assert analyze("{{ ref('a') }}").static
+    assert analyze("{{ ref('a') }}") is analyze("{{ ref('a') }}")
+
+
+@pytest.fixture
+def macro_debugging(monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path) -> pathlib.Path:
+    bundle_path = tmp_path / "debug.zip"
+    monkeypatch.setattr(dbt_common.clients.jinja, "MACRO_DEBUGGING", "bundle")
+    monkeypatch.setattr(dbt_common.clients.jinja, "MACRO_DEBUGGING_BUNDLE", str(bundle_path))
+    yield bundle_path
+    dbt_common.clients.jinja._debug_bundle().close()
+    dbt_common.clients.jinja._LINECACHE_ENTRIES.clear()
+
+
+def test_macro_debugging_bundle(macro_debugging: pathlib.Path) -> None:
+    env = get_environment()
+    sources = ["{{ 1 + 1 }}", "{{ 1 + 1 }}", "{{ [1][3] }}"]
+    filenames = [env.from_string(source).filename for source in sources]
+
+    assert filenames[0] == filenames[1]
+    assert filenames[0] != filenames[2]
+    assert all(f.startswith(str(macro_debugging) + os.sep) for f in filenames)
+    # generated sources are read back from the bundle for tracebacks
+    generated = [line + "\n" for line in env.compile(sources[0], raw=True).splitlines()]
+    assert linecache.getlines(filenames[0]) == generated
+
+    dbt_common.clients.jinja._debug_bundle().close()
+    with zipfile.ZipFile(macro_debugging) as archive:
+        assert sorted(archive.namelist()) == sorted(
+            {os.path.basename(filename) for filename in filenames}
+        )
+
+
+def test_macro_debugging_bundle_from_threads(
+    macro_debugging: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    created = []
+
+    class SlowDebugBundle(DebugBundle):
+        def __init__(self, path: str) -> None:
+            # widen the window in which another thread could create a bundle
+            time.sleep(0.05)
+            super().__init__(path)
+            created.append(self)
+
+    monkeypatch.setattr(dbt_common.clients.jinja, "DebugBundle", SlowDebugBundle)
+    monkeypatch.setattr(dbt_common.clients.jinja, "_DEBUG_BUNDLE", None)
+    sources = [f"{{{{ {i} }}}}" for i in range(32)]
+    barrier = threading.Barrier(8)
+
+    def compile_sources(thread: int) -> None:
+        env = get_environment()
+        barrier.wait()
+        for source in sources[thread::8]:
+            env.from_string(source)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(compile_sources, range(8)))
+
+    assert len(created) == 1
+    created[0].close()
+    with zipfile.ZipFile(macro_debugging) as archive:
+        assert archive.testzip() is None
+        assert len(archive.namelist()) == len(sources)
+
+
+def test_macro_debugging_linecache_bounded(
+    macro_debugging: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(dbt_common.clients.jinja, "MACRO_DEBUGGING", True)
+    monkeypatch.setattr(dbt_common.clients.jinja, "MACRO_DEBUGGING_LINECACHE_SIZE", 2)
+    env = get_environment()
+    filenames = [env.from_string(f"{{{{ {i} }}}}").filename for i in range(3)]
+
+    assert filenames[0] not in linecache.cache
+    assert all(filename in linecache.cache for filename in filenames[1:])
+    assert len(dbt_common.clients.jinja._LINECACHE_ENTRIES) == 2
+    assert not macro_debugging.exists()
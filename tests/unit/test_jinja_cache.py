@@ -0,0 +1,323 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+import pytest
+from pytest_mock import MockerFixture
+
+from dbt_common.clients._jinja_blocks import ExtractWarning
+from dbt_common.clients._jinja_cache import ContentCache, LRUCache, content_digest
+from dbt_common.clients.jinja import (
+    TemplateCache,
+    _macro_digest,
+    blocks_cache,
+    extract_toplevel_blocks,
+    get_pooled_environment,
+    get_template,
+    invalidate_blocks_cache,
+    invalidate_parse_cache,
+    parse,
+    parse_cache,
+)
+from dbt_common.exceptions import CompilationError
+from tests.unit.utils import FakeMacro
+
+
+def _slow_get_template(*args: Any, **kwargs: Any) -> Any:
+    # Widen the window in which other threads request the same template.
+    time.sleep(0.01)
+    return get_template(*args, **kwargs)
+
+
+class TestContentDigest:
+    def test_parts_are_unambiguous(self) -> None:
+        assert content_digest("a\0", "b") != content_digest("a", "\0b")
+        assert content_digest("ab") != content_digest("a", "b")
+
+    def test_is_stable(self) -> None:
+        assert content_digest("select 1") == content_digest("select 1")
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used_by_count(self) -> None:
+        cache: LRUCache[int] = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.stats.evictions == 1
+
+    def test_evicts_by_size(self) -> None:
+        cache: LRUCache[str] = LRUCache(max_size=10)
+        cache.put("a", "a", size=4)
+        cache.put("b", "b", size=4)
+        cache.put("c", "c", size=4)
+
+        assert len(cache) == 2
+        assert "a" not in cache
+        assert cache.stats.size == 8
+
+    def test_keeps_single_oversized_entry(self) -> None:
+        cache: LRUCache[str] = LRUCache(max_size=10)
+        cache.put("a", "a", size=100)
+        assert cache.get("a") == "a"
+
+    def test_counts_hits_and_misses(self) -> None:
+        cache: LRUCache[int] = LRUCache()
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+
+        stats = cache.stats
+        assert (stats.hits, stats.misses, stats.entries) == (2, 1, 1)
+
+    def test_resize_evicts(self) -> None:
+        cache: LRUCache[int] = LRUCache()
+        for i in range(5):
+            cache.put(str(i), i)
+        cache.resize(max_entries=2)
+        assert len(cache) == 2
+        assert "4" in cache
+
+
+class TestTemplateCache:
+    def test_reuses_templates_for_identical_source(self) -> None:
+        cache = TemplateCache()
+        sql = "{% macro my_macro() %}select 1{% endmacro %}"
+        first = cache.get_node_template(FakeMacro("my_macro", sql))
+        second = cache.get_node_template(FakeMacro("other_name", sql))
+
+        assert first is second
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 1
+
+    def test_does_not_keep_source_as_key(self) -> None:
+        cache = TemplateCache()
+        sql = "{% macro my_macro() %}select 1{% endmacro %}"
+        cache.get_node_template(FakeMacro("my_macro", sql))
+        assert sql not in cache.file_cache
+        assert content_digest(sql) in cache.file_cache
+
+    def test_bounded_cache_evicts(self) -> None:
+        cache = TemplateCache(max_entries=2)
+        for i in range(4):
+            sql = f"{{% macro m{i}() %}}select {i}{{% endmacro %}}"
+            cache.get_node_template(FakeMacro(f"m{i}", sql))
+
+        assert cache.stats.entries == 2
+        assert cache.stats.evictions == 2
+        assert cache.stats.size > 0
+
+        cache.configure(max_entries=1)
+        assert cache.stats.entries == 1
+
+    def test_compiles_once_under_threads(self, mocker: MockerFixture) -> None:
+        cache = TemplateCache(lock_stripes=4)
+        compile_template = mocker.patch(
+            "dbt_common.clients.jinja.get_template", side_effect=_slow_get_template
+        )
+        sources = [f"{{% macro m{i}() %}}select {i}{{% endmacro %}}" for i in range(8)]
+        threads = 32
+        barrier = threading.Barrier(threads)
+
+        def get_templates(thread: int) -> List[Any]:
+            barrier.wait()
+            return [
+                cache.get_node_template(FakeMacro(f"m{i}", sources[(i + thread) % len(sources)]))
+                for i in range(len(sources))
+            ]
+
+        with ThreadPoolExecutor(threads) as executor:
+            results = list(executor.map(get_templates, range(threads)))
+
+        assert compile_template.call_count == len(sources)
+        for thread, templates in enumerate(results):
+            for i, template in enumerate(templates):
+                source = sources[(i + thread) % len(sources)]
+                assert template is cache.file_cache.peek(content_digest(source))
+        assert cache.stats.entries == len(sources)
+        assert not any(stripe.pending for stripe in cache._stripes)
+
+    def test_errors_are_raised_in_each_thread(self) -> None:
+        cache = TemplateCache()
+        sql = "{% macro broken() %}{% if %}{% endmacro %}"
+        threads = 8
+        barrier = threading.Barrier(threads)
+
+        def get_template(thread: int) -> Optional[BaseException]:
+            barrier.wait()
+            try:
+                cache.get_node_template(FakeMacro(f"broken_{thread}", sql))
+            except CompilationError as exc:
+                return exc
+            return None
+
+        with ThreadPoolExecutor(threads) as executor:
+            errors = list(executor.map(get_template, range(threads)))
+
+        assert all(isinstance(error, CompilationError) for error in errors)
+        assert [error.node.name for error in errors] == [f"broken_{i}" for i in range(threads)]
+        assert cache.stats.entries == 0
+        assert not any(stripe.pending for stripe in cache._stripes)
+
+
+_forged_loads: List[int] = []
+
+
+class _Forged:
+    def __reduce__(self) -> Any:
+        return (_forged_loads.append, (1,))
+
+
+class TestContentCache:
+    def _cache(self, directory) -> ContentCache[Any]:
+        cache: ContentCache[Any] = ContentCache("test")
+        cache.configure(directory=str(directory))
+        return cache
+
+    def test_shares_entries_through_directory(self, tmp_path) -> None:
+        self._cache(tmp_path).put("k", "value")
+        assert self._cache(tmp_path).get("k") == "value"
+
+    def test_rejects_unsigned_entries(self, tmp_path) -> None:
+        self._cache(tmp_path).put("k", "value")
+        path = tmp_path / "__dbt_test_k.pickle"
+        path.write_bytes(bytes(32) + pickle.dumps((0, _Forged())))
+
+        assert self._cache(tmp_path).get("k") is None
+        assert _forged_loads == []
+
+    def test_rejects_entries_moved_to_another_key(self, tmp_path) -> None:
+        self._cache(tmp_path).put("k", "value")
+        shutil.copy(tmp_path / "__dbt_test_k.pickle", tmp_path / "__dbt_test_other.pickle")
+
+        assert self._cache(tmp_path).get("other") is None
+
+    @pytest.mark.skipif(os.name == "nt", reason="uses posix file modes")
+    def test_ignores_key_others_can_access(self, tmp_path) -> None:
+        key_path = tmp_path / "__dbt_cache.key"
+        key_path.write_bytes(bytes(32))
+        key_path.chmod(0o644)
+
+        self._cache(tmp_path).put("k", "value")
+        assert self._cache(tmp_path).get("k") is None
+
+
+@pytest.fixture
+def enabled_caches(tmp_path):
+    parse_cache.configure(directory=str(tmp_path))
+    blocks_cache.configure(directory=str(tmp_path))
+    yield tmp_path
+    for cache in (parse_cache, blocks_cache):
+        cache.invalidate()
+        cache.configure(enabled=False)
+
+
+class TestParseCache:
+    def test_disabled_by_default(self) -> None:
+        assert parse("{{ 1 }}") is not parse("{{ 1 }}")
+
+    def test_reuses_parse_tree(self, enabled_caches) -> None:
+        assert parse("{{ 1 }}") is parse("{{ 1 }}")
+        assert parse("{{ 1 }}") is not parse("{{ 2 }}")
+
+    def test_persists_to_disk(self, enabled_caches) -> None:
+        first = parse("{% if x %}{{ y }}{% endif %}")
+        # dropping the in-memory entries stands in for a new process
+        parse_cache.entries.clear()
+
+        second = parse("{% if x %}{{ y }}{% endif %}")
+        assert second is not first
+        assert second == first
+        assert second.body[0].environment is get_pooled_environment()
+
+    def test_entries_are_versioned(self, enabled_caches, mocker: MockerFixture) -> None:
+        first = parse("{{ 1 }}")
+        parse_cache.entries.clear()
+        mocker.patch("dbt_common.clients.jinja._CACHE_VERSION", "other")
+
+        assert parse("{{ 1 }}") is not first
+        assert len(list(enabled_caches.glob("__dbt_parse_*"))) == 2
+
+    def test_invalidate(self, enabled_caches) -> None:
+        first = parse("{{ 1 }}")
+        invalidate_parse_cache("{{ 1 }}")
+        assert parse("{{ 1 }}") is not first
+        assert not list(enabled_caches.glob("__dbt_parse_*"))[1:]
+
+        invalidate_parse_cache()
+        assert parse_cache.stats.entries == 0
+        assert not list(enabled_caches.glob("__dbt_parse_*"))
+
+
+class TestBlocksCache:
+    text = "{% macro a() %}a{% endmacro %}{% unknown %}{% docs b %}b{% enddocs %}"
+
+    def test_reuses_blocks_and_replays_warnings(self, enabled_caches) -> None:
+        first_warnings: List[ExtractWarning] = []
+        second_warnings: List[ExtractWarning] = []
+        hits = blocks_cache.stats.hits
+        first = extract_toplevel_blocks(self.text, warning_callback=first_warnings.append)
+        second = extract_toplevel_blocks(self.text, warning_callback=second_warnings.append)
+
+        assert blocks_cache.stats.hits == hits + 1
+        assert [b.full_block for b in second] == [b.full_block for b in first]
+        assert len(first_warnings) == 1
+        assert first_warnings == second_warnings
+
+    def test_callers_get_their_own_blocks(self, enabled_caches) -> None:
+        hits = blocks_cache.stats.hits
+        first = extract_toplevel_blocks(self.text)
+        first[0].contents = "changed"
+        first.clear()
+
+        second = extract_toplevel_blocks(self.text)
+        assert blocks_cache.stats.hits == hits + 1
+        assert [b.contents for b in second] == ["a", "{% unknown %}", "b"]
+
+    def test_distinguishes_arguments(self, enabled_caches) -> None:
+        default_blocks = extract_toplevel_blocks(self.text)
+        no_blocks = extract_toplevel_blocks(self.text, allowed_blocks=set())
+        no_data = extract_toplevel_blocks(self.text, collect_raw_data=False)
+
+        assert len(default_blocks) == 3
+        assert len(no_blocks) == 1
+        assert len(no_data) == 2
+
+    def test_persists_to_disk(self, enabled_caches) -> None:
+        first = extract_toplevel_blocks(self.text)
+        blocks_cache.entries.clear()
+        second = extract_toplevel_blocks(self.text)
+
+        assert second is not first
+        assert [b.full_block for b in second] == [b.full_block for b in first]
+
+    def test_invalidate(self, enabled_caches) -> None:
+        extract_toplevel_blocks(self.text)
+        invalidate_blocks_cache(self.text)
+        hits = blocks_cache.stats.hits
+        extract_toplevel_blocks(self.text)
+        assert blocks_cache.stats.hits == hits
+        invalidate_blocks_cache()
+        assert blocks_cache.stats.entries == 0
+
+
+def test_template_cache_memoizes_digests() -> None:
+    cache = TemplateCache()
+    macro = FakeMacro("my_macro", "{% macro my_macro() %}memoized{% endmacro %}")
+    cache.get_node_template(macro)
+    before = _macro_digest.cache_info()
+
+    for _ in range(3):
+        cache.get_node_template(macro)
+    after = _macro_digest.cache_info()
+    assert (after.hits - before.hits, after.misses - before.misses) == (3, 0)
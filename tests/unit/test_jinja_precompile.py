@@ -0,0 +1,107 @@
+import pytest
+from pytest_mock import MockerFixture
+
+import dbt_common.clients.jinja
+from dbt_common.clients._jinja_cache import content_digest
+from dbt_common.clients.jinja import CallableMacroGenerator, TemplateCache, template_cache
+from dbt_common.clients.jinja_precompile import (
+    PrecompiledMacros,
+    main,
+    precompile_macros,
+    use_precompiled_macros,
+)
+from dbt_common.exceptions import CompilationError, DbtInternalError
+from tests.unit.utils import FakeMacro
+
+
+MACROS = [
+    FakeMacro("add", "{% macro add(x, y) %}{{ x + y }}{% endmacro %}"),
+    FakeMacro("greet", "{% macro greet(who) %}hello {{ who | upper }}{% endmacro %}"),
+]
+
+
+@pytest.fixture
+def cache():
+    template_cache.clear()
+    yield template_cache
+    template_cache.clear()
+    template_cache.precompiled = None
+
+
+@pytest.mark.parametrize("filename", ["dir_macros", "zip_macros.zip"])
+def test_precompiled_templates_are_used(
+    tmp_path, mocker: MockerFixture, cache: TemplateCache, filename: str
+) -> None:
+    path = str(tmp_path / filename)
+    digests = precompile_macros(MACROS * 2, path)
+    assert digests == sorted(content_digest(m.macro_sql) for m in MACROS)
+
+    precompiled = PrecompiledMacros(path)
+    assert precompiled.is_current
+    assert len(precompiled) == 2
+    cache.precompiled = precompiled
+
+    get_template = mocker.spy(dbt_common.clients.jinja, "get_template")
+    add = CallableMacroGenerator(MACROS[0], {})
+    greet = CallableMacroGenerator(MACROS[1], {})
+    assert add(1, 2) == "3"
+    assert greet("world") == "hello WORLD"
+    assert get_template.call_count == 0
+
+    # macros which weren't precompiled are still compiled
+    other = FakeMacro("other", "{% macro other() %}other{% endmacro %}")
+    assert CallableMacroGenerator(other, {})() == "other"
+    assert get_template.call_count == 1
+
+
+def test_stale_package_is_ignored(tmp_path, mocker: MockerFixture) -> None:
+    mocker.patch(
+        "dbt_common.clients.jinja_precompile.package_stamp", side_effect=["old", "new", "new"]
+    )
+    path = str(tmp_path / "stale_macros")
+    precompile_macros(MACROS, path)
+
+    precompiled = PrecompiledMacros(path)
+    assert not precompiled.is_current
+    assert precompiled.get_template(content_digest(MACROS[0].macro_sql)) is None
+
+
+def test_invalid_package_name(tmp_path) -> None:
+    with pytest.raises(DbtInternalError):
+        precompile_macros(MACROS, str(tmp_path / "not-a-package"))
+
+
+def test_command_line(tmp_path, cache: TemplateCache) -> None:
+    macro_file = tmp_path / "macros.sql"
+    macro_file.write_text("".join(m.macro_sql for m in MACROS) + "\nselect 1\n")
+    path = str(tmp_path / "cli_macros")
+
+    assert main([path, str(macro_file)]) == 0
+    precompiled = use_precompiled_macros(path)
+    assert cache.precompiled is precompiled
+    assert all(content_digest(m.macro_sql) in precompiled for m in MACROS)
+
+    use_precompiled_macros(None)
+    assert cache.precompiled is None
+
+
+def test_command_line_skips_macros_which_fail(tmp_path, cache: TemplateCache, capsys) -> None:
+    macro_file = tmp_path / "macros.sql"
+    macro_file.write_text(
+        MACROS[0].macro_sql
+        + "{% macro broken() %}{% if %}{% endmacro %}"
+        + "{% data_test not_a_macro() %}select 1{% enddata_test %}"
+    )
+    path = str(tmp_path / "partial_macros")
+
+    assert main([path, str(macro_file)]) == 1
+    assert "Skipping macro broken" in capsys.readouterr().err
+    precompiled = PrecompiledMacros(path)
+    assert len(precompiled) == 1
+    assert content_digest(MACROS[0].macro_sql) in precompiled
+
+
+def test_compilation_errors_are_raised(tmp_path) -> None:
+    broken = FakeMacro("broken", "{% macro broken() %}{% if %}{% endmacro %}")
+    with pytest.raises(CompilationError):
+        precompile_macros(MACROS + [broken], str(tmp_path / "broken_macros"))
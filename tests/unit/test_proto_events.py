@@ -1,9 +1,16 @@
+import os
+import threading
+
+import pytest
 from dbtlabs.proto.public.v1.fields import common_types_pb2 as types_pb2
-from google.protobuf.json_format import MessageToDict
+from google.protobuf.json_format import MessageToDict, ParseDict, ParseError
 
-from dbt_common.events.base_types import msg_from_base_event
+from dbt_common.events import types_pb2 as core_types_pb2
+from dbt_common.events.base_types import EventLevel, message_from_dict, msg_from_base_event
 from dbt_common.events.functions import msg_to_dict, msg_to_json, reset_metadata_vars
+from dbt_common.events.helpers import datetime_to_json_string
 from dbt_common.events.types import RetryExternalCall
+from dbt_common.invocation import get_invocation_id
 
 info_keys = {
     "name",
@@ -73,3 +80,54 @@ def test_extra_dict_on_event(monkeypatch) -> None:
 
     # clean up
     reset_metadata_vars()
+
+
+@pytest.mark.parametrize(
+    "msg_cls,values",
+    [
+        (core_types_pb2.RetryExternalCall, {"attempt": 3, "max": 5}),
+        (core_types_pb2.RetryExternalCall, {"attempt": "3", "max": 5.0}),
+        (core_types_pb2.RetryExternalCall, {"attempt": None}),
+        (core_types_pb2.Note, {"msg": "note"}),
+        (core_types_pb2.SystemExecutingCmd, {"cmd": ["a", "b"]}),
+        (core_types_pb2.SystemReportReturnCode, {}),
+    ],
+)
+def test_message_from_dict_matches_parse_dict(msg_cls, values) -> None:
+    assert message_from_dict(values, msg_cls) == ParseDict(values, msg_cls())
+
+
+@pytest.mark.parametrize(
+    "values",
+    [{"attempt": 2**40}, {"attempt": "x"}, {"attempt": True}, {"unknown": 1}],
+)
+def test_message_from_dict_raises_parse_dict_errors(values) -> None:
+    with pytest.raises(ParseError) as expected:
+        ParseDict(values, core_types_pb2.RetryExternalCall())
+    with pytest.raises(ParseError) as actual:
+        message_from_dict(values, core_types_pb2.RetryExternalCall)
+    assert str(actual.value) == str(expected.value)
+
+
+def test_event_info_matches_parse_dict(monkeypatch) -> None:
+    monkeypatch.setenv("DBT_ENV_CUSTOM_ENV_env_key", "env_value")
+    reset_metadata_vars()
+
+    event = RetryExternalCall(attempt=3, max=5)
+    msg = msg_from_base_event(event, level=EventLevel.WARN)
+    event_info = {
+        "level": "warn",
+        "msg": event.message(),
+        "invocation_id": get_invocation_id(),
+        "extra": {"env_key": "env_value"},
+        "ts": datetime_to_json_string(msg.info.ts.ToDatetime()),
+        "pid": os.getpid(),
+        "thread": threading.current_thread().name,
+        "code": "M020",
+        "name": "RetryExternalCall",
+    }
+    expected = ParseDict({"info": event_info}, core_types_pb2.RetryExternalCallMsg())
+    expected.data.CopyFrom(event.pb_msg)
+    assert msg == expected
+
+    reset_metadata_vars()
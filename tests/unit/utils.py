@@ -1,3 +1,5 @@
+from dataclasses import dataclass
+
 import pytest
 from pytest_mock import MockerFixture
 
@@ -13,3 +15,17 @@ def event_catcher(mocker: MockerFixture) -> EventCatcher:
     catcher = EventCatcher()
     add_callback_to_manager(catcher.catch)
     return catcher
+
+
+@dataclass
+class FakeMacro:
+    """The parts of a dbt macro node that jinja's macro generators use."""
+
+    name: str
+    macro_sql: str
+
+
+class FakeNode:
+    """A node for rendering templates, identified by its name in errors."""
+
+    name = "my_model"